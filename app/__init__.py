@@ -1,30 +1,45 @@
 from flask import Flask, render_template
 from datetime import timedelta
 from dotenv import load_dotenv
+import atexit
 import os
-from .database import init_db
-from .extensions import socketio, jwt
+from .database import init_pool, close_pool
+from .extensions import socketio, jwt, socket_serializer
+from .jsonutil import JSONProvider
+from .broker import socketio_options
 
 load_dotenv()
 
 
 def create_app():
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
+    app.json = JSONProvider(app)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev_key')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev_jwt')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=15)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
+    # <img>/<audio>/<video> cannot send an Authorization header, so blob
+    # downloads also accept the access token from a cookie scoped to them.
+    app.config['JWT_ACCESS_COOKIE_PATH'] = '/api/blobs'
+    app.config['JWT_COOKIE_SAMESITE'] = 'Lax'
+    app.config['JWT_COOKIE_SECURE'] = os.getenv('JWT_COOKIE_SECURE', 'false').lower() == 'true'
+    app.config['JWT_COOKIE_CSRF_PROTECT'] = False
     app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024
 
     jwt.init_app(app)
-    socketio.init_app(app)
+    serializer = os.getenv('SOCKETIO_SERIALIZER', 'json')
+    socketio.init_app(app, async_mode=os.getenv('SOCKETIO_ASYNC_MODE', 'threading'),
+                      serializer=socket_serializer(serializer), **socketio_options())
 
-    init_db()
+    init_pool()
+    atexit.register(close_pool)
 
     from .auth import auth_bp
     from .api import api_bp
+    from .uploads import uploads_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(api_bp)
+    app.register_blueprint(uploads_bp)
 
     @app.route('/')
     def index():
@@ -32,7 +47,13 @@ def create_app():
 
     @app.route('/chat')
     def chat():
-        return render_template('chat.html')
+        return render_template('chat.html', socket_serializer=serializer)
+
+    from .commands import db_cli, blobs_cli, uploads_cli, retention_cli
+    app.cli.add_command(db_cli)
+    app.cli.add_command(blobs_cli)
+    app.cli.add_command(uploads_cli)
+    app.cli.add_command(retention_cli)
 
     from . import events
 
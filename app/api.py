@@ -1,24 +1,50 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, send_file, abort
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, \
+    set_access_cookies
 from werkzeug.security import generate_password_hash, check_password_hash
-from .database import get_db
+from PIL import Image
+from .database import get_db, get_pool_stats
 from .extensions import socketio
-from datetime import datetime
+from .blobstore import blob_store, is_inline_mime, checked_file_mime
+from .avatars import store_avatar, make_thumbnail, is_avatar, THUMBNAIL_SIZES
+from .writebehind import get_buffer_stats
+from .audit import log_group_action, get_audit_stats
+from .search import search_messages, search_users, SEARCH_PAGE_SIZE
+from .messages import create_file_message
+from .uploads import delete_room_uploads, remove_parts
+from .profiles import get_profile, invalidate_profile, profile_cache
+from .membership import blocks_cache, invalidate_blocks, invalidate_room, is_blocked_in_room, is_member, room_members_cache
+from datetime import datetime, timezone
 import secrets
 import psycopg
-import base64
-import json
+import mimetypes
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 
-def log_group_action(room_id, action, details):
-    conn = get_db()
-    with conn.cursor() as c:
-        c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                  (room_id, action, details, datetime.now().isoformat()))
-        conn.commit()
-    conn.close()
+@api_bp.route('/metrics/db', methods=['GET'])
+@jwt_required()
+def db_metrics():
+    return jsonify(get_pool_stats())
+
+
+@api_bp.route('/metrics/buffers', methods=['GET'])
+@jwt_required()
+def buffer_metrics():
+    return jsonify(get_buffer_stats())
+
+
+@api_bp.route('/metrics/audit', methods=['GET'])
+@jwt_required()
+def audit_metrics():
+    return jsonify(get_audit_stats())
+
+
+@api_bp.route('/metrics/cache', methods=['GET'])
+@jwt_required()
+def cache_metrics():
+    return jsonify({'profiles': profile_cache.stats(), 'room_members': room_members_cache.stats(),
+                    'blocks': blocks_cache.stats()})
 
 
 @api_bp.route('/auth/register', methods=['POST'])
@@ -30,19 +56,19 @@ def register():
     if not name or not password:
         return jsonify({'error': 'Required fields missing'}), 400
 
-    conn = get_db()
     try:
         user_id = secrets.token_hex(4)
         pw_hash = generate_password_hash(password)
-        timestamp = datetime.now().isoformat()
+        timestamp = datetime.now(timezone.utc)
 
-        with conn.cursor() as c:
+        with get_db() as conn, conn.cursor() as c:
             c.execute("INSERT INTO users (id, name, password_hash, created_at) VALUES (%s, %s, %s, %s)",
                       (user_id, name, pw_hash, timestamp))
 
             c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
                       ('general', user_id, 'member', timestamp))
             conn.commit()
+        invalidate_room('general')
 
         access_token = create_access_token(identity=user_id)
         refresh_token = create_refresh_token(identity=user_id)
@@ -55,17 +81,17 @@ def register():
             'last_active': timestamp
         })
 
-        return jsonify({
+        response = jsonify({
             'status': 'ok',
             'access_token': access_token,
             'refresh_token': refresh_token,
             'user_id': user_id,
             'name': name
         })
+        set_access_cookies(response, access_token)
+        return response
     except psycopg.errors.UniqueViolation:
         return jsonify({'error': 'User already exists'}), 409
-    finally:
-        conn.close()
 
 
 @api_bp.route('/auth/login', methods=['POST'])
@@ -74,22 +100,22 @@ def login():
     name = data.get('name')
     password = data.get('password')
 
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT * FROM users WHERE name = %s", (name,))
         user = c.fetchone()
-    conn.close()
 
     if user and check_password_hash(user['password_hash'], password):
         access_token = create_access_token(identity=user['id'])
         refresh_token = create_refresh_token(identity=user['id'])
-        return jsonify({
+        response = jsonify({
             'access_token': access_token,
             'refresh_token': refresh_token,
             'user_id': user['id'],
             'name': user['name'],
             'avatar': user['avatar']
         })
+        set_access_cookies(response, access_token)
+        return response
 
     return jsonify({'error': 'Invalid credentials'}), 401
 
@@ -99,7 +125,9 @@ def login():
 def refresh():
     identity = get_jwt_identity()
     access_token = create_access_token(identity=identity)
-    return jsonify(access_token=access_token)
+    response = jsonify(access_token=access_token)
+    set_access_cookies(response, access_token)
+    return response
 
 
 @api_bp.route('/user/block', methods=['POST'])
@@ -109,8 +137,7 @@ def block_user():
     target_id = request.json.get('target_id')
     action = request.json.get('action')
 
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         if action == 'block':
             try:
                 c.execute("INSERT INTO blocked_users (blocker_id, blocked_id) VALUES (%s, %s)", (user_id, target_id))
@@ -119,7 +146,7 @@ def block_user():
         else:
             c.execute("DELETE FROM blocked_users WHERE blocker_id = %s AND blocked_id = %s", (user_id, target_id))
         conn.commit()
-    conn.close()
+    invalidate_blocks(user_id, target_id)
     return jsonify({'status': 'ok'})
 
 
@@ -132,12 +159,11 @@ def update_profile():
     birth_date = request.form.get('birth_date')
     gender = request.form.get('gender')
 
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("UPDATE users SET bio = %s, real_name = %s, birth_date = %s, gender = %s WHERE id = %s",
                   (bio, real_name, birth_date, gender, user_id))
         conn.commit()
-    conn.close()
+    invalidate_profile(user_id)
     return jsonify({'status': 'ok'})
 
 
@@ -149,20 +175,25 @@ def upload_avatar_gallery():
     file_content = data.get('image')
 
     if file_content:
-        conn = get_db()
-        with conn.cursor() as c:
+        with get_db() as conn, conn.cursor() as c:
             c.execute("SELECT avatars_gallery FROM users WHERE id = %s", (user_id,))
-            row = c.fetchone()
-            gallery = json.loads(row['avatars_gallery']) if row['avatars_gallery'] else []
-
-            if file_content not in gallery:
-                gallery.insert(0, file_content)
-
-            c.execute("UPDATE users SET avatars_gallery = %s, avatar = %s WHERE id = %s",
-                      (json.dumps(gallery), file_content, user_id))
+            known_keys = c.fetchone()['avatars_gallery'] or []
+            try:
+                file_content = store_avatar(c, file_content, known_keys)
+            except (ValueError, OSError):
+                return jsonify({'error': 'Invalid image'}), 400
+
+            c.execute('''UPDATE users
+                         SET avatars_gallery = CASE
+                                                   WHEN %s = ANY(avatars_gallery) THEN avatars_gallery
+                                                   ELSE array_prepend(%s, avatars_gallery) END,
+                             avatar = %s
+                         WHERE id = %s
+                         RETURNING avatars_gallery''', (file_content, file_content, file_content, user_id))
+            gallery = c.fetchone()['avatars_gallery']
             conn.commit()
+            invalidate_profile(user_id)
             socketio.emit('user_updated', {'id': user_id, 'avatar': file_content, 'avatars_gallery': gallery})
-        conn.close()
         return jsonify({'status': 'ok', 'avatar': file_content, 'gallery': gallery})
     return jsonify({'error': 'No file'}), 400
 
@@ -173,24 +204,22 @@ def delete_avatar_from_gallery():
     user_id = get_jwt_identity()
     data = request.json
     avatar_to_delete = data.get('avatar')
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT avatars_gallery, avatar FROM users WHERE id = %s", (user_id,))
         row = c.fetchone()
         if row:
-            gallery = json.loads(row['avatars_gallery']) if row['avatars_gallery'] else []
+            gallery = row['avatars_gallery']
             if avatar_to_delete in gallery:
                 gallery.remove(avatar_to_delete)
                 new_current = row['avatar']
                 if row['avatar'] == avatar_to_delete:
                     new_current = gallery[0] if gallery else None
                 c.execute("UPDATE users SET avatars_gallery = %s, avatar = %s WHERE id = %s",
-                          (json.dumps(gallery), new_current, user_id))
+                          (gallery, new_current, user_id))
                 conn.commit()
+                invalidate_profile(user_id)
                 socketio.emit('user_updated', {'id': user_id, 'avatar': new_current, 'avatars_gallery': gallery})
-                conn.close()
                 return jsonify({'status': 'ok', 'avatar': new_current, 'gallery': gallery})
-    conn.close()
     return jsonify({'error': 'Not found'}), 404
 
 
@@ -200,12 +229,14 @@ def select_avatar():
     user_id = get_jwt_identity()
     data = request.json
     avatar_content = data.get('avatar')
-    conn = get_db()
-    with conn.cursor() as c:
-        c.execute("UPDATE users SET avatar = %s WHERE id = %s", (avatar_content, user_id))
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("UPDATE users SET avatar = %s WHERE id = %s AND %s = ANY(avatars_gallery) RETURNING id",
+                  (avatar_content, user_id, avatar_content))
+        if not c.fetchone():
+            return jsonify({'error': 'Not found'}), 404
         conn.commit()
+        invalidate_profile(user_id)
         socketio.emit('user_updated', {'id': user_id, 'avatar': avatar_content})
-    conn.close()
     return jsonify({'status': 'ok'})
 
 
@@ -214,13 +245,11 @@ def select_avatar():
 def get_group_logs():
     user_id = get_jwt_identity()
     room_id = request.json.get('room_id')
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
         participant = c.fetchone()
 
         if not participant or participant['role'] not in ('owner', 'admin'):
-            conn.close()
             return jsonify({'error': 'Unauthorized'}), 403
 
         c.execute("SELECT created_by, created_at FROM rooms WHERE id = %s", (room_id,))
@@ -229,7 +258,6 @@ def get_group_logs():
         c.execute("SELECT * FROM group_logs WHERE room_id = %s ORDER BY timestamp DESC LIMIT 100", (room_id,))
         logs = [dict(row) for row in c.fetchall()]
         info = {'created_at': room['created_at'], 'created_by': room['created_by']}
-    conn.close()
     return jsonify({'status': 'ok', 'logs': logs, 'info': info})
 
 
@@ -240,16 +268,14 @@ def update_group():
     room_id = request.json.get('room_id')
     name = request.json.get('name')
     avatar_data = request.json.get('image')
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
         participant = c.fetchone()
 
-        c.execute("SELECT name FROM rooms WHERE id = %s", (room_id,))
+        c.execute("SELECT name, avatar FROM rooms WHERE id = %s", (room_id,))
         room = c.fetchone()
 
         if not participant or participant['role'] not in ('owner', 'admin'):
-            conn.close()
             return jsonify({'error': 'Unauthorized'}), 403
 
         updates = []
@@ -260,6 +286,10 @@ def update_group():
             params.append(name)
             log_details.append(f"Назва змінена на {name}")
         if avatar_data:
+            try:
+                avatar_data = store_avatar(c, avatar_data, [room['avatar']])
+            except (ValueError, OSError):
+                return jsonify({'error': 'Invalid image'}), 400
             updates.append("avatar = %s")
             params.append(avatar_data)
             log_details.append("Аватар оновлено")
@@ -269,8 +299,7 @@ def update_group():
             conn.commit()
             log_group_action(room_id, "Оновлення інфо", "; ".join(log_details))
             socketio.emit('group_updated', {'id': room_id, 'name': name, 'avatar': avatar_data})
-    conn.close()
-    return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'avatar': avatar_data})
 
 
 @api_bp.route('/chat/delete', methods=['POST'])
@@ -280,41 +309,92 @@ def delete_chat():
     room_id = request.json.get('room_id')
     mutual = request.json.get('mutual')
 
-    conn = get_db()
-    with conn.cursor() as c:
-        c.execute("SELECT created_by, type, deleted_for FROM rooms WHERE id = %s", (room_id,))
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT created_by, type FROM rooms WHERE id = %s", (room_id,))
         room = c.fetchone()
 
         if not room:
-            conn.close()
             return jsonify({'error': 'Not found'}), 404
 
         if mutual:
             if room['type'] == 'group' and room['created_by'] != user_id:
-                conn.close()
                 return jsonify({'error': 'Unauthorized'}), 403
 
             c.execute("DELETE FROM message_reactions WHERE message_id IN (SELECT id FROM messages WHERE room_id = %s)",
                       (room_id,))
+            c.execute("DELETE FROM message_visibility WHERE message_id IN (SELECT id FROM messages WHERE room_id = %s)",
+                      (room_id,))
             c.execute("DELETE FROM messages WHERE room_id = %s", (room_id,))
+            c.execute("DELETE FROM room_visibility WHERE room_id = %s", (room_id,))
+            c.execute("DELETE FROM read_cursors WHERE room_id = %s", (room_id,))
+            upload_ids = delete_room_uploads(c, room_id)
             c.execute("DELETE FROM participants WHERE room_id = %s", (room_id,))
             c.execute("DELETE FROM group_logs WHERE room_id = %s", (room_id,))
             c.execute("DELETE FROM rooms WHERE id = %s", (room_id,))
             conn.commit()
+            remove_parts(upload_ids)
+            invalidate_room(room_id)
             socketio.emit('chat_deleted', {'id': room_id, 'mutual': True})
         else:
-            deleted_for = json.loads(room['deleted_for']) if room['deleted_for'] else []
-            if user_id not in deleted_for:
-                deleted_for.append(user_id)
-                c.execute("UPDATE rooms SET deleted_for = %s WHERE id = %s", (json.dumps(deleted_for), room_id))
-                conn.commit()
+            c.execute('''INSERT INTO room_visibility (user_id, room_id, hidden)
+                         VALUES (%s, %s, TRUE)
+                         ON CONFLICT (user_id, room_id) DO UPDATE SET hidden = TRUE''', (user_id, room_id))
+            conn.commit()
 
             socketio.emit('chat_deleted', {'id': room_id, 'mutual': False}, to=request.sid)
 
-    conn.close()
     return jsonify({'status': 'ok'})
 
 
+@api_bp.route('/chat/clear', methods=['POST'])
+@jwt_required()
+def clear_chat_history():
+    user_id = get_jwt_identity()
+    room_id = request.json.get('room_id')
+    up_to_id = request.json.get('up_to_id')
+
+    with get_db() as conn, conn.cursor() as c:
+        if not is_member(c, room_id, user_id):
+            return jsonify({'error': 'Unauthorized'}), 403
+
+        c.execute('''INSERT INTO room_visibility (user_id, room_id, cleared_through_id)
+                     SELECT %s, %s, COALESCE(%s, MAX(id))
+                     FROM messages
+                     WHERE room_id = %s
+                     ON CONFLICT (user_id, room_id) DO UPDATE
+                         SET cleared_through_id = GREATEST(room_visibility.cleared_through_id,
+                                                           EXCLUDED.cleared_through_id)
+                     RETURNING cleared_through_id''', (user_id, room_id, up_to_id, room_id))
+        cleared_through_id = c.fetchone()['cleared_through_id']
+        conn.commit()
+
+    return jsonify({'status': 'ok', 'cleared_through_id': cleared_through_id})
+
+
+@api_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search():
+    user_id = get_jwt_identity()
+    query = (request.args.get('q') or '').strip()
+    room_id = request.args.get('room_id') or None
+    if not query:
+        return jsonify({'error': 'Empty query'}), 400
+
+    try:
+        limit = int(request.args.get('limit', SEARCH_PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Bad request'}), 400
+
+    with get_db() as conn, conn.cursor() as c:
+        if room_id and not is_member(c, room_id, user_id):
+            return jsonify({'error': 'Unauthorized'}), 403
+        messages, has_more = search_messages(c, user_id, query, room_id=room_id, limit=limit, offset=offset)
+        users = search_users(c, user_id, query) if not room_id and offset == 0 else []
+
+    return jsonify({'status': 'ok', 'messages': messages, 'users': users, 'has_more': has_more})
+
+
 @api_bp.route('/group/participants', methods=['POST'])
 @jwt_required()
 def manage_participants():
@@ -324,19 +404,16 @@ def manage_participants():
     room_id = data.get('room_id')
     target_id = data.get('target_id')
 
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
         requester = c.fetchone()
         requester_role = requester['role'] if requester else None
 
         if not requester_role:
-            conn.close()
             return jsonify({'error': 'Unauthorized'}), 403
 
         if action in ('add', 'remove'):
             if requester_role not in ('owner', 'admin'):
-                conn.close()
                 return jsonify({'error': 'Unauthorized'}), 403
 
             if action == 'remove':
@@ -344,26 +421,22 @@ def manage_participants():
                 target = c.fetchone()
                 if target:
                     if target['role'] == 'owner':
-                        conn.close()
                         return jsonify({'error': 'Cannot remove owner'}), 403
                     if target['role'] == 'admin' and requester_role != 'owner':
-                        conn.close()
                         return jsonify({'error': 'Admins cannot remove other admins'}), 403
 
-        c.execute("SELECT name FROM users WHERE id = %s", (target_id,))
-        target_user = c.fetchone()
+        target_user = get_profile(c, target_id)
         target_name = target_user['name'] if target_user else 'Unknown'
 
-        c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-        requester_name = c.fetchone()['name']
+        requester_name = get_profile(c, user_id)['name']
 
         if action == 'add':
             try:
                 c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
-                          (room_id, target_id, 'member', datetime.now().isoformat()))
+                          (room_id, target_id, 'member', datetime.now(timezone.utc)))
                 conn.commit()
-                c.execute("SELECT name, avatar FROM users WHERE id = %s", (target_id,))
-                u = c.fetchone()
+                invalidate_room(room_id)
+                u = get_profile(c, target_id)
                 log_group_action(room_id, "Додавання учасника", f"{requester_name} додав {target_name}")
                 socketio.emit('participant_added',
                               {'room_id': room_id,
@@ -374,6 +447,7 @@ def manage_participants():
         elif action == 'remove':
             c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, target_id))
             conn.commit()
+            invalidate_room(room_id)
             log_group_action(room_id, "Видалення учасника", f"{requester_name} видалив {target_name}")
             socketio.emit('participant_removed', {'room_id': room_id, 'user_id': target_id})
 
@@ -381,15 +455,14 @@ def manage_participants():
             if requester_role == 'owner':
                 c.execute("SELECT COUNT(*) as count FROM participants WHERE room_id = %s", (room_id,))
                 if c.fetchone()['count'] > 1:
-                    conn.close()
                     return jsonify({'error': 'Owner cannot leave without deleting or transferring ownership'}), 400
 
             c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
             conn.commit()
+            invalidate_room(room_id)
             log_group_action(room_id, "Вихід учасника", f"{requester_name} покинув групу")
             socketio.emit('participant_removed', {'room_id': room_id, 'user_id': user_id})
 
-    conn.close()
     return jsonify({'status': 'ok'})
 
 
@@ -401,39 +474,61 @@ def upload_file():
     room_id = request.form.get('room_id')
     caption = request.form.get('caption', '')
     if file and room_id:
-        conn = get_db()
-        with conn.cursor() as c:
-            c.execute(
-                "SELECT 1 FROM blocked_users WHERE blocker_id IN (SELECT user_id FROM participants WHERE room_id = %s AND user_id != %s) AND blocked_id = %s",
-                (room_id, user_id, user_id))
-            if c.fetchone():
-                conn.close()
+        with get_db() as conn, conn.cursor() as c:
+            if is_blocked_in_room(c, room_id, user_id):
                 return jsonify({'error': 'Blocked'}), 403
 
-            file_content = base64.b64encode(file.read()).decode('utf-8')
-            timestamp = datetime.now().isoformat()
+            key, size = blob_store.put_stream(file.stream)
+            mime_type = file.mimetype or mimetypes.guess_type(file.filename)[0]
+            mime_type = checked_file_mime(mime_type, blob_store.path(key))
+            message, log_details = create_file_message(c, user_id, room_id, key, size, mime_type, file.filename,
+                                                       caption)
+            conn.commit()
+            if log_details:
+                log_group_action(room_id, "Файл", log_details)
 
-            payload = json.dumps({'file': file_content, 'caption': caption})
+            socketio.emit('new_message', message, to=room_id)
+        return jsonify({'status': 'ok'})
+    return jsonify({'error': 'Bad request'}), 400
 
-            c.execute(
-                "INSERT INTO messages (room_id, sender_id, type, content, filename, created_at) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id",
-                (room_id, user_id, 'file', payload, file.filename, timestamp))
-            file_msg_id = c.fetchone()['id']
 
-            c.execute("SELECT name, avatar FROM users WHERE id = %s", (user_id,))
-            user = c.fetchone()
-            c.execute("SELECT type FROM rooms WHERE id = %s", (room_id,))
-            room = c.fetchone()
-            if room and room['type'] == 'group':
-                log_group_action(room_id, "Файл", f"{user['name']} надіслав файл: {file.filename}")
+@api_bp.route('/blobs/<key>', methods=['GET'])
+@jwt_required(locations=['headers', 'cookies'])
+def download_blob(key):
+    if not blob_store.exists(key):
+        abort(404)
 
-            conn.commit()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT mime_type FROM blobs WHERE sha256 = %s", (key,))
+        row = c.fetchone()
+    mime_type = row['mime_type'] if row and row['mime_type'] else 'application/octet-stream'
+
+    # Anything that is not plain media is never rendered on our origin.
+    download_name = request.args.get('download')
+    inline = not download_name and is_inline_mime(mime_type)
+    response = send_file(blob_store.path(key), mimetype=mime_type, conditional=True, etag=key,
+                         as_attachment=not inline, download_name=download_name or key,
+                         max_age=31536000)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+@api_bp.route('/avatars/<key>/<int:size>', methods=['GET'])
+def download_avatar(key, size):
+    if size not in THUMBNAIL_SIZES or not blob_store.exists(key):
+        abort(404)
+    with get_db() as conn, conn.cursor() as c:
+        if not is_avatar(c, key):
+            abort(404)
 
-            socketio.emit('new_message', {
-                'id': file_msg_id, 'room_id': room_id, 'sender_id': user_id,
-                'sender_name': user['name'], 'sender_avatar': user['avatar'],
-                'type': 'file', 'content': payload, 'filename': file.filename, 'created_at': timestamp
-            }, to=room_id)
-        conn.close()
-        return jsonify({'status': 'ok'})
-    return jsonify({'error': 'Bad request'}), 400
+    try:
+        path = make_thumbnail(key, size)
+    except (OSError, Image.DecompressionBombError):
+        abort(404)
+
+    response = send_file(path, mimetype='image/png', conditional=True, etag=f'{key}-{size}',
+                         max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
@@ -0,0 +1,136 @@
+from .database import get_db
+from .extensions import socketio
+from datetime import datetime, timezone
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 1000))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1))
+AUDIT_PUT_TIMEOUT = float(os.getenv('AUDIT_PUT_TIMEOUT', 0.5))
+AUDIT_MAX_ATTEMPTS = int(os.getenv('AUDIT_MAX_ATTEMPTS', 3))
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    def __init__(self, max_size=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE, interval=AUDIT_FLUSH_INTERVAL,
+                 max_attempts=AUDIT_MAX_ATTEMPTS):
+        self.queue = queue.Queue(max_size)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retry = []
+        self.max_attempts = max_attempts
+        self.write_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.started = False
+        self.stats = {'written': 0, 'batches': 0, 'failures': 0, 'dropped': 0, 'dead_lettered': 0,
+                      'last_batch_ms': None}
+
+    def put(self, room_id, action, details):
+        self.start()
+        entry = (room_id, action, details, datetime.now(timezone.utc))
+        try:
+            # A full queue means the database is behind: hold the caller briefly
+            # instead of growing without bound, and drop the entry if it stays full.
+            self.queue.put(entry, timeout=AUDIT_PUT_TIMEOUT)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logger.warning('Audit queue full, dropping %s entry for room %s', action, room_id)
+
+    def take(self, block):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.interval) if block else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def write(self, batch):
+        started = time.monotonic()
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("""CREATE TEMP TABLE IF NOT EXISTS group_logs_staging
+                         (
+                             room_id   TEXT,
+                             action    TEXT,
+                             details   TEXT,
+                             timestamp TIMESTAMPTZ
+                         ) ON COMMIT DELETE ROWS""")
+            with c.copy("COPY group_logs_staging (room_id, action, details, timestamp) FROM STDIN") as copy:
+                for entry in batch:
+                    copy.write_row(entry)
+            # Rooms deleted while their entries were queued would fail the
+            # foreign key and take the whole batch with them.
+            c.execute("""INSERT INTO group_logs (room_id, action, details, timestamp)
+                         SELECT s.room_id, s.action, s.details, s.timestamp
+                         FROM group_logs_staging s
+                         WHERE EXISTS (SELECT 1 FROM rooms r WHERE r.id = s.room_id)""")
+            conn.commit()
+        self.stats['written'] += len(batch)
+        self.stats['batches'] += 1
+        self.stats['last_batch_ms'] = round((time.monotonic() - started) * 1000, 2)
+
+    def flush(self, block=False):
+        with self.write_lock:
+            batch, attempts = self.retry.pop(0) if self.retry else (self.take(block), 0)
+            if not batch:
+                return 0
+            try:
+                self.write(batch)
+            except Exception:
+                self.stats['failures'] += 1
+                logger.exception('Writing %d audit entries failed', len(batch))
+                self.give_back(batch, attempts + 1)
+                return 0
+            return len(batch)
+
+    def give_back(self, batch, attempts):
+        # A batch that keeps failing is split in halves until the entry that
+        # breaks it stands alone and is dropped, so one bad row cannot hold
+        # up everything queued behind it.
+        if attempts < self.max_attempts:
+            self.retry.insert(0, (batch, attempts))
+        elif len(batch) > 1:
+            half = len(batch) // 2
+            self.retry[:0] = [(batch[:half], 0), (batch[half:], 0)]
+        else:
+            self.stats['dead_lettered'] += 1
+            logger.error('Dropping audit entry after %d attempts: %r', attempts, batch[0])
+
+    def drain(self):
+        while self.flush():
+            pass
+
+    def run(self):
+        while True:
+            if not self.flush(block=True) and self.retry:
+                socketio.sleep(self.interval)
+
+    def start(self):
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+        atexit.register(self.drain)
+        socketio.start_background_task(self.run)
+
+    def depth(self):
+        return self.queue.qsize() + sum(len(batch) for batch, _ in self.retry)
+
+
+audit_writer = AuditWriter()
+
+
+def log_group_action(room_id, action, details):
+    audit_writer.put(room_id, action, details)
+
+
+def get_audit_stats():
+    return {'depth': audit_writer.depth(), 'max_size': audit_writer.queue.maxsize,
+            'batch_size': audit_writer.batch_size, **audit_writer.stats}
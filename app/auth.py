@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, \
+    set_access_cookies
 from werkzeug.security import generate_password_hash, check_password_hash
 from .database import get_db
 from .extensions import socketio
-from datetime import datetime
+from .membership import invalidate_room
+from datetime import datetime, timezone
 import secrets
 import psycopg
 
@@ -19,20 +21,19 @@ def register():
     if not name or not password:
         return jsonify({'error': 'Name and password required'}), 400
 
-    conn = get_db()
-
     try:
         user_id = secrets.token_hex(4)
         pw_hash = generate_password_hash(password)
-        timestamp = datetime.now().isoformat()
+        timestamp = datetime.now(timezone.utc)
 
-        with conn.cursor() as c:
+        with get_db() as conn, conn.cursor() as c:
             c.execute("INSERT INTO users (id, name, password_hash, created_at) VALUES (%s, %s, %s, %s)",
                       (user_id, name, pw_hash, timestamp))
 
             c.execute("INSERT INTO participants (room_id, user_id, joined_at) VALUES (%s, %s, %s)",
                       ('general', user_id, timestamp))
             conn.commit()
+        invalidate_room('general')
 
         access_token = create_access_token(identity=user_id)
         refresh_token = create_refresh_token(identity=user_id)
@@ -45,17 +46,17 @@ def register():
             'last_active': timestamp
         })
 
-        return jsonify({
+        response = jsonify({
             'status': 'ok',
             'access_token': access_token,
             'refresh_token': refresh_token,
             'user_id': user_id,
             'name': name
         })
+        set_access_cookies(response, access_token)
+        return response
     except psycopg.errors.UniqueViolation:
         return jsonify({'error': 'User already exists'}), 409
-    finally:
-        conn.close()
 
 
 @auth_bp.route('/login', methods=['POST'])
@@ -64,22 +65,22 @@ def login():
     name = data.get('name')
     password = data.get('password')
 
-    conn = get_db()
-    with conn.cursor() as c:
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT * FROM users WHERE name = %s", (name,))
         user = c.fetchone()
-    conn.close()
 
     if user and check_password_hash(user['password_hash'], password):
         access_token = create_access_token(identity=user['id'])
         refresh_token = create_refresh_token(identity=user['id'])
-        return jsonify({
+        response = jsonify({
             'access_token': access_token,
             'refresh_token': refresh_token,
             'user_id': user['id'],
             'name': user['name'],
             'avatar': user['avatar']
         })
+        set_access_cookies(response, access_token)
+        return response
 
     return jsonify({'error': 'Invalid credentials'}), 401
 
@@ -89,4 +90,6 @@ def login():
 def refresh():
     identity = get_jwt_identity()
     access_token = create_access_token(identity=identity)
-    return jsonify(access_token=access_token)
+    response = jsonify(access_token=access_token)
+    set_access_cookies(response, access_token)
+    return response
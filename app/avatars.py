@@ -0,0 +1,62 @@
+from PIL import Image, ImageOps, UnidentifiedImageError
+from io import BytesIO
+from .blobstore import blob_store, save_blob_record, is_blob_key
+from .cache import LRUCache
+import base64
+import os
+
+THUMBNAIL_SIZES = (64, 128, 256)
+avatar_keys = LRUCache(int(os.getenv('AVATAR_CACHE_SIZE', 10000)))
+
+
+def is_avatar(c, key):
+    # Thumbnails are served without a token, so only keys that are some
+    # user's or group's avatar qualify; attachments stay behind /api/blobs.
+    if avatar_keys.get(key):
+        return True
+    c.execute('''SELECT EXISTS (SELECT 1 FROM users WHERE avatar = %s OR avatars_gallery @> ARRAY [%s])
+                     OR EXISTS (SELECT 1 FROM rooms WHERE avatar = %s) AS found''', (key, key, key))
+    found = c.fetchone()['found']
+    if found:
+        avatar_keys.set(key, True)
+    return found
+
+
+def thumbnail_path(key, size):
+    return f'{blob_store.path(key)}.{size}.png'
+
+
+def make_thumbnail(key, size):
+    target = thumbnail_path(key, size)
+    if os.path.exists(target):
+        return target
+
+    with Image.open(blob_store.path(key)) as img:
+        thumb = ImageOps.fit(img.convert('RGBA'), (size, size), Image.LANCZOS)
+    tmp = f'{target}.tmp'
+    thumb.save(tmp, 'PNG', optimize=True)
+    os.replace(tmp, target)
+    return target
+
+
+def store_avatar(c, image, known_keys=()):
+    # A blob key is only taken as is when it is already one of the owner's
+    # avatars; anything else has to come in as image data and pass verify().
+    if is_blob_key(image):
+        if image not in known_keys:
+            raise ValueError('Unknown avatar')
+        return image
+
+    data = base64.b64decode(image.split(',', 1)[1] if image.startswith('data:') else image)
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img.verify()
+            mime_type = Image.MIME.get(img.format, 'image/png')
+    except (Image.DecompressionBombError, UnidentifiedImageError) as e:
+        raise ValueError('Invalid image') from e
+
+    key, size = blob_store.put_bytes(data)
+    save_blob_record(c, key, size, mime_type)
+    for thumb_size in THUMBNAIL_SIZES:
+        make_thumbnail(key, thumb_size)
+    return key
@@ -0,0 +1,182 @@
+from datetime import datetime, timezone
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+BLOB_KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+CHUNK_SIZE = 1024 * 1024
+INLINE_MIME_TYPES = {
+    'image/png', 'image/jpeg', 'image/gif', 'image/webp',
+    'audio/webm', 'audio/ogg', 'audio/mpeg', 'audio/mp4', 'audio/wav',
+    'video/webm', 'video/ogg', 'video/mp4',
+}
+MIME_RE = re.compile(r'^[a-z0-9][a-z0-9!#$&^_.+-]*/[a-z0-9][a-z0-9!#$&^_.+-]*$')
+SNIFF_SIZE = 16
+
+
+def is_blob_key(key):
+    return bool(key) and bool(BLOB_KEY_RE.match(key))
+
+
+def is_inline_mime(mime_type):
+    return (mime_type or '').split(';')[0].strip().lower() in INLINE_MIME_TYPES
+
+
+def sniff_types(head):
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return ('image/png',)
+    if head.startswith(b'\xff\xd8\xff'):
+        return ('image/jpeg',)
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return ('image/gif',)
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return ('image/webp',)
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return ('audio/wav',)
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        return ('video/webm', 'audio/webm')
+    if head.startswith(b'OggS'):
+        return ('audio/ogg', 'video/ogg')
+    if head.startswith(b'ID3') or head[:2] in (b'\xff\xfb', b'\xff\xf3', b'\xff\xf2'):
+        return ('audio/mpeg',)
+    if head[4:8] == b'ftyp':
+        return ('video/mp4', 'audio/mp4')
+    if head.startswith(b'%PDF-'):
+        return ('application/pdf',)
+    return ()
+
+
+def checked_mime(declared, head):
+    # The stored type decides how /api/blobs serves the file, so a media
+    # type is only kept when the content's magic bytes agree with it.
+    declared = (declared or '').split(';')[0].strip().lower()
+    sniffed = sniff_types(head)
+    if declared in sniffed:
+        return declared
+    if sniffed:
+        return sniffed[0]
+    if declared in INLINE_MIME_TYPES or not MIME_RE.match(declared):
+        return 'application/octet-stream'
+    return declared
+
+
+def checked_file_mime(declared, path):
+    with open(path, 'rb') as f:
+        return checked_mime(declared, f.read(SNIFF_SIZE))
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+
+    def path(self, key):
+        if not is_blob_key(key):
+            raise ValueError('Invalid blob key')
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return is_blob_key(key) and os.path.exists(self.path(key))
+
+    def put_stream(self, stream, chunk_size=CHUNK_SIZE):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    sha.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            return self.put_file(tmp_path, sha.hexdigest()), size
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put_path(self, src_path, chunk_size=CHUNK_SIZE, keep_source=False):
+        sha = hashlib.sha256()
+        size = 0
+        with open(src_path, 'rb') as src:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                size += len(chunk)
+        if keep_source:
+            src_path = self.clone(src_path)
+        return self.put_file(src_path, sha.hexdigest()), size
+
+    def clone(self, src_path):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copyfile(src_path, tmp_path)
+        return tmp_path
+
+    def put_file(self, tmp_path, key):
+        target = self.path(key)
+        if os.path.exists(target):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(tmp_path, target)
+        return key
+
+    def put_bytes(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        target = self.path(key)
+        if not os.path.exists(target):
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            self.put_file(tmp_path, key)
+        return key, len(data)
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self.path(key))
+
+
+blob_store = BlobStore(os.getenv('BLOB_STORE_DIR', 'storage/blobs'))
+
+
+def save_blob_record(c, key, size, mime_type):
+    c.execute("""INSERT INTO blobs (sha256, size, mime_type, created_at)
+                 VALUES (%s, %s, %s, %s) ON CONFLICT (sha256) DO NOTHING""",
+              (key, size, mime_type, datetime.now(timezone.utc)))
+
+
+def blob_ref(key, size, mime_type, **extra):
+    return json.dumps({'blob': key, 'size': size, 'mime': mime_type, **extra})
+
+
+def parse_data_url(data_url):
+    header, _, payload = data_url.partition(',')
+    mime_type = header[5:].split(';')[0] or 'application/octet-stream'
+    return mime_type, base64.b64decode(payload)
+
+
+def store_bytes(c, data, mime_type):
+    mime_type = checked_mime(mime_type, data[:SNIFF_SIZE])
+    key, size = blob_store.put_bytes(data)
+    save_blob_record(c, key, size, mime_type)
+    return blob_ref(key, size, mime_type)
+
+
+def store_data_url(c, data_url):
+    mime_type, data = parse_data_url(data_url)
+    return store_bytes(c, data, mime_type)
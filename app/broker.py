@@ -0,0 +1,185 @@
+from socketio import PubSubManager
+from psycopg import sql
+from psycopg.rows import dict_row
+from .database import get_db
+from .extensions import socketio
+import json
+import logging
+import psycopg
+import os
+import queue
+import threading
+import time
+import uuid
+
+MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'corporate-chats')
+INVALIDATION_CHANNEL = f'{CHANNEL}-invalidate'
+NOTIFY_PAYLOAD_LIMIT = 7900
+NODE_ID = uuid.uuid4().hex
+
+logger = logging.getLogger(__name__)
+
+
+def queue_scheme(url=MESSAGE_QUEUE):
+    return url.split(':', 1)[0].lower()
+
+
+class MemoryManager(PubSubManager):
+    name = 'memory'
+    channels = {}
+    lock = threading.Lock()
+
+    def _publish(self, data):
+        message = self.json.dumps(data)
+        with self.lock:
+            inboxes = list(self.channels.get(self.channel, []))
+        for inbox in inboxes:
+            inbox.put(message)
+
+    def _listen(self):
+        inbox = queue.Queue()
+        with self.lock:
+            self.channels.setdefault(self.channel, []).append(inbox)
+        while True:
+            yield inbox.get()
+
+
+class NotifyConnection:
+    # Publishes happen inside handlers that already hold a pool connection;
+    # taking a second one from the pool deadlocks once every connection is
+    # held by a handler waiting to publish. NOTIFY goes out on this dedicated
+    # autocommit connection instead.
+    def __init__(self):
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def execute(self, query, params=()):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.conn is None or self.conn.closed:
+                        self.conn = psycopg.connect(os.getenv('DATABASE_URL'), autocommit=True,
+                                                    row_factory=dict_row)
+                    return self.conn.execute(query, params).fetchone()
+                except psycopg.OperationalError:
+                    self.conn = None
+                    if attempt:
+                        raise
+
+
+notify_connection = NotifyConnection()
+
+
+class PostgresManager(PubSubManager):
+    name = 'postgres'
+
+    def _publish(self, data):
+        payload = self.json.dumps(data)
+        if len(payload.encode('utf-8')) > NOTIFY_PAYLOAD_LIMIT:
+            notify_connection.execute("DELETE FROM socketio_outbox WHERE created_at < now() - interval '5 minutes'")
+            row = notify_connection.execute("INSERT INTO socketio_outbox (payload) VALUES (%s) RETURNING id",
+                                            (payload,))
+            payload = f"#{row['id']}"
+        notify_connection.execute("SELECT pg_notify(%s, %s)", (self.channel, payload))
+
+    def _read_outbox(self, outbox_id):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT payload FROM socketio_outbox WHERE id = %s", (outbox_id,))
+            row = c.fetchone()
+        return row['payload'] if row else None
+
+    def _listen(self):
+        for payload in pg_listen(self.channel):
+            if payload.startswith('#'):
+                payload = self._read_outbox(int(payload[1:]))
+            if payload:
+                yield payload
+
+
+def pg_listen(channel):
+    while True:
+        try:
+            with psycopg.connect(os.getenv('DATABASE_URL'), autocommit=True) as conn:
+                conn.execute(sql.SQL('LISTEN {}').format(sql.Identifier(channel)))
+                for notify in conn.notifies():
+                    yield notify.payload
+        except psycopg.OperationalError:
+            logger.exception('Lost LISTEN connection on %s, reconnecting', channel)
+            time.sleep(1)
+
+
+def redis_listen(channel):
+    import redis
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(MESSAGE_QUEUE, decode_responses=True).pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            for message in pubsub.listen():
+                yield message['data']
+        except redis.ConnectionError:
+            logger.exception('Lost subscription on %s, reconnecting', channel)
+            time.sleep(1)
+
+
+def socketio_options():
+    scheme = queue_scheme()
+    if not scheme:
+        return {}
+    if scheme == 'memory':
+        return {'client_manager': MemoryManager(channel=CHANNEL)}
+    if scheme in ('postgres', 'postgresql'):
+        return {'client_manager': PostgresManager(channel=CHANNEL)}
+    return {'message_queue': MESSAGE_QUEUE, 'channel': CHANNEL}
+
+
+invalidation_handlers = {}
+listener_started = False
+listener_lock = threading.Lock()
+
+
+def on_invalidate(kind):
+    def decorator(fn):
+        invalidation_handlers.setdefault(kind, []).append(fn)
+        return fn
+    return decorator
+
+
+def apply_invalidation(kind, key):
+    for handler in invalidation_handlers.get(kind, ()):
+        handler(key)
+
+
+def publish_invalidation(kind, key):
+    apply_invalidation(kind, key)
+    scheme = queue_scheme()
+    message = json.dumps({'node': NODE_ID, 'kind': kind, 'key': key})
+    if scheme in ('postgres', 'postgresql'):
+        notify_connection.execute("SELECT pg_notify(%s, %s)", (INVALIDATION_CHANNEL, message))
+    elif scheme in ('redis', 'rediss'):
+        import redis
+        redis.Redis.from_url(MESSAGE_QUEUE).publish(INVALIDATION_CHANNEL, message)
+
+
+def listen_invalidations():
+    scheme = queue_scheme()
+    messages = pg_listen(INVALIDATION_CHANNEL) if scheme in ('postgres', 'postgresql') \
+        else redis_listen(INVALIDATION_CHANNEL)
+    for raw in messages:
+        try:
+            message = json.loads(raw)
+            if message['node'] != NODE_ID:
+                apply_invalidation(message['kind'], message['key'])
+        except Exception:
+            logger.exception('Bad invalidation message %r', raw)
+
+
+def start_invalidation_listener():
+    global listener_started
+    if queue_scheme() not in ('postgres', 'postgresql', 'redis', 'rediss'):
+        return
+    with listener_lock:
+        if listener_started:
+            return
+        listener_started = True
+    socketio.start_background_task(listen_invalidations)
@@ -0,0 +1,137 @@
+from flask.cli import AppGroup
+from .database import get_db
+from .blobstore import blob_store, blob_ref, save_blob_record, store_data_url
+from .uploads import remove_parts
+from .avatars import store_avatar
+from .migrate import upgrade, status
+from .retention import ensure_partitions, run_retention
+from datetime import datetime, timedelta, timezone
+import mimetypes
+import base64
+import click
+import json
+
+db_cli = AppGroup('db', help='Database schema migrations.')
+blobs_cli = AppGroup('blobs', help='Blob store maintenance.')
+uploads_cli = AppGroup('uploads', help='Chunked upload maintenance.')
+retention_cli = AppGroup('retention', help='Partitioning, retention and archival of messages and group logs.')
+
+
+@db_cli.command('upgrade', help='Apply pending migrations from app/migrations.')
+def db_upgrade():
+    applied = upgrade(log=click.echo)
+    click.echo(f'Applied {len(applied)} migration(s)')
+
+
+@db_cli.command('status', help='List migrations and whether they are applied.')
+def db_status():
+    for version, name, applied in status():
+        click.echo(f"{version:04d}_{name}: {'applied' if applied else 'pending'}")
+
+
+@blobs_cli.command('migrate', help='Move inline base64 media from messages.content into the blob store.')
+@click.option('--batch-size', default=100, show_default=True, help='Messages per transaction.')
+def migrate_blobs(batch_size):
+    last_id = 0
+    migrated = 0
+    while True:
+        with get_db() as conn, conn.cursor() as c:
+            c.execute('''SELECT id, type, content, filename
+                         FROM messages
+                         WHERE id > %s
+                           AND type IN ('file', 'voice', 'video')
+                         ORDER BY id
+                         LIMIT %s''', (last_id, batch_size))
+            rows = c.fetchall()
+            if not rows:
+                break
+
+            for row in rows:
+                last_id = row['id']
+                content = row['content'] or ''
+                new_content = None
+
+                if row['type'] == 'file':
+                    try:
+                        payload = json.loads(content)
+                    except ValueError:
+                        continue
+                    if 'file' not in payload:
+                        continue
+                    key, size = blob_store.put_bytes(base64.b64decode(payload['file']))
+                    mime_type = mimetypes.guess_type(row['filename'] or '')[0] or 'application/octet-stream'
+                    save_blob_record(c, key, size, mime_type)
+                    new_content = blob_ref(key, size, mime_type, caption=payload.get('caption', ''))
+                elif content.startswith('data:'):
+                    new_content = store_data_url(c, content)
+
+                if new_content is not None:
+                    c.execute("UPDATE messages SET content = %s WHERE id = %s", (new_content, row['id']))
+                    migrated += 1
+
+            conn.commit()
+        click.echo(f'Processed up to message {last_id}, migrated {migrated}')
+
+    click.echo(f'Done: {migrated} messages migrated')
+
+
+@blobs_cli.command('migrate-avatars', help='Move base64 user and group avatars into the blob store.')
+def migrate_avatars():
+    migrated = 0
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT id, avatar, avatars_gallery FROM users WHERE avatar IS NOT NULL OR avatars_gallery <> '{}'")
+        for row in c.fetchall():
+            try:
+                known_keys = [row['avatar'], *row['avatars_gallery']]
+                avatar = store_avatar(c, row['avatar'], known_keys) if row['avatar'] else None
+                gallery = [store_avatar(c, img, known_keys) for img in row['avatars_gallery']]
+            except (ValueError, OSError):
+                click.echo(f'Skipping user {row["id"]}: invalid image')
+                continue
+            c.execute("UPDATE users SET avatar = %s, avatars_gallery = %s WHERE id = %s",
+                      (avatar, gallery, row['id']))
+            migrated += 1
+
+        c.execute("SELECT id, avatar FROM rooms WHERE avatar IS NOT NULL")
+        for row in c.fetchall():
+            try:
+                avatar = store_avatar(c, row['avatar'], [row['avatar']])
+            except (ValueError, OSError):
+                click.echo(f'Skipping room {row["id"]}: invalid image')
+                continue
+            c.execute("UPDATE rooms SET avatar = %s WHERE id = %s", (avatar, row['id']))
+            migrated += 1
+
+        conn.commit()
+    click.echo(f'Done: {migrated} users and rooms migrated')
+
+
+@uploads_cli.command('cleanup', help='Drop unfinished chunked uploads older than the given age.')
+@click.option('--older-than-hours', default=24, show_default=True)
+def cleanup_uploads(older_than_hours):
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours)
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("DELETE FROM uploads WHERE created_at < %s RETURNING id", (cutoff,))
+        stale = [row['id'] for row in c.fetchall()]
+        conn.commit()
+
+    remove_parts(stale)
+    click.echo(f'Removed {len(stale)} stale uploads')
+
+
+@retention_cli.command('partitions', help='Create monthly partitions for the current and coming months.')
+def retention_partitions():
+    with get_db() as conn, conn.cursor() as c:
+        names = ensure_partitions(c)
+        conn.commit()
+    click.echo(f"Partitions ready: {', '.join(names)}")
+
+
+@retention_cli.command('run', help='Archive and drop messages and group logs past their retention period.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be archived.')
+def retention_run(dry_run):
+    report = run_retention(dry_run=dry_run)
+    for table, result in report.items():
+        partitions = ', '.join(result['partitions']) or '-'
+        rows = ', '.join(f'{room_type}: {count}' for room_type, count in result['rows'].items()) or '-'
+        click.echo(f"{table}: partitions {partitions}; rows {rows}")
@@ -1,5 +1,34 @@
 from flask_socketio import SocketIO
 from flask_jwt_extended import JWTManager
+from .cache import LRUCache
+from . import jsonutil
+import os
+import time
 
-socketio = SocketIO(cors_allowed_origins="*", max_http_buffer_size=500 * 1024 * 1024)
-jwt = JWTManager()
\ No newline at end of file
+token_cache = LRUCache(max_size=int(os.getenv('JWT_CACHE_SIZE', 10000)))
+
+
+class CachingJWTManager(JWTManager):
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        claims = token_cache.get(encoded_token)
+        if claims is not None and claims['exp'] > time.time():
+            return dict(claims)
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        if 'exp' in claims:
+            token_cache.set(encoded_token, claims, ttl=claims['exp'] - time.time())
+        return dict(claims)
+
+
+def socket_serializer(name):
+    if name == 'msgpack':
+        from socketio.msgpack_packet import MsgPackPacket
+        return MsgPackPacket.configure(dumps_default=jsonutil.default)
+    return 'default'
+
+
+socketio = SocketIO(cors_allowed_origins="*", max_http_buffer_size=500 * 1024 * 1024, json=jsonutil)
+jwt = CachingJWTManager()
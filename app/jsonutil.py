@@ -0,0 +1,21 @@
+from flask.json.provider import DefaultJSONProvider
+from datetime import date
+import json
+
+
+def default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+def dumps(obj, **kwargs):
+    kwargs.setdefault('default', default)
+    return json.dumps(obj, **kwargs)
+
+
+loads = json.loads
+
+
+class JSONProvider(DefaultJSONProvider):
+    default = staticmethod(default)
@@ -0,0 +1,67 @@
+from .broker import on_invalidate, publish_invalidation, start_invalidation_listener
+from .cache import LRUCache
+import os
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 10000))
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', 300))
+
+room_members_cache = LRUCache(MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+blocks_cache = LRUCache(MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+
+
+def room_members(c, room_id):
+    members = room_members_cache.get(room_id)
+    if members is not None:
+        return members
+    start_invalidation_listener()
+    c.execute("SELECT user_id FROM participants WHERE room_id = %s", (room_id,))
+    members = frozenset(r['user_id'] for r in c.fetchall())
+    room_members_cache.set(room_id, members)
+    return members
+
+
+def block_sets(c, user_id):
+    blocks = blocks_cache.get(user_id)
+    if blocks is not None:
+        return blocks
+    start_invalidation_listener()
+    c.execute("SELECT blocked_id FROM blocked_users WHERE blocker_id = %s", (user_id,))
+    blocked_by_me = frozenset(r['blocked_id'] for r in c.fetchall())
+    c.execute("SELECT blocker_id FROM blocked_users WHERE blocked_id = %s", (user_id,))
+    blockers = frozenset(r['blocker_id'] for r in c.fetchall())
+    blocks = (blocked_by_me, blockers)
+    blocks_cache.set(user_id, blocks)
+    return blocks
+
+
+def is_member(c, room_id, user_id):
+    return user_id in room_members(c, room_id)
+
+
+def is_blocked_in_room(c, room_id, user_id):
+    blockers = block_sets(c, user_id)[1]
+    return bool(blockers) and not blockers.isdisjoint(room_members(c, room_id) - {user_id})
+
+
+def get_invisible_users(c, user_id):
+    blocked_by_me, blockers = block_sets(c, user_id)
+    return set(blocked_by_me | blockers)
+
+
+def invalidate_room(room_id):
+    publish_invalidation('room_members', room_id)
+
+
+def invalidate_blocks(*user_ids):
+    for user_id in user_ids:
+        publish_invalidation('blocks', user_id)
+
+
+@on_invalidate('room_members')
+def drop_room(room_id):
+    room_members_cache.delete(room_id)
+
+
+@on_invalidate('blocks')
+def drop_blocks(user_id):
+    blocks_cache.delete(user_id)
@@ -0,0 +1,90 @@
+from .blobstore import blob_ref, save_blob_record
+from .read_cursors import mark_read
+from .profiles import get_profile
+from datetime import datetime, timezone
+
+LOG_DETAILS = {
+    'voice': 'Надіслав голосове',
+    'video': 'Надіслав відеоповідомлення',
+}
+
+# Block check, next room sequence number, insert and un-hiding the room for
+# everyone in one statement, so a message costs a single round trip and either
+# all of it happens or none of it does. No row back means the sender is blocked.
+# The group log entry is written by the audit writer once the message is
+# committed.
+SEND_MESSAGE_SQL = '''
+WITH blocked AS (SELECT EXISTS (SELECT 1
+                                FROM blocked_users b
+                                         JOIN participants p ON p.user_id = b.blocker_id
+                                WHERE p.room_id = %(room_id)s
+                                  AND p.user_id <> %(user_id)s
+                                  AND b.blocked_id = %(user_id)s) AS yes),
+     room AS (UPDATE rooms
+         SET message_seq = message_seq + 1
+         WHERE id = %(room_id)s
+             AND NOT (SELECT yes FROM blocked)
+         RETURNING type, message_seq),
+     msg AS (INSERT INTO messages (room_id, sender_id, type, content, created_at, seq)
+         SELECT %(room_id)s, %(user_id)s, %(type)s, %(content)s, %(now)s, room.message_seq
+         FROM room
+         RETURNING id, created_at, seq),
+     unhide AS (UPDATE room_visibility
+         SET hidden = FALSE
+         WHERE room_id = %(room_id)s
+             AND hidden
+             AND EXISTS (SELECT 1 FROM msg))
+SELECT msg.id, msg.created_at, msg.seq, room.type AS room_type
+FROM msg,
+     room'''
+
+
+def send_message(c, room_id, user_id, msg_type, content):
+    c.execute(SEND_MESSAGE_SQL, {
+        'room_id': room_id, 'user_id': user_id, 'type': msg_type, 'content': content,
+        'now': datetime.now(timezone.utc),
+    })
+    return c.fetchone()
+
+
+def next_message_seq(c, room_id):
+    c.execute("UPDATE rooms SET message_seq = message_seq + 1 WHERE id = %s RETURNING type, message_seq",
+              (room_id,))
+    return c.fetchone()
+
+
+def message_event(msg_id, room_id, sender_id, seq, msg_type, content, created_at, filename=None):
+    # Room fan-out carries ids and blob references only; clients resolve the
+    # sender's name and avatar from their own user cache.
+    event = {'id': msg_id, 'room_id': room_id, 'sender_id': sender_id, 'seq': seq,
+             'type': msg_type, 'content': content, 'created_at': created_at}
+    if filename:
+        event['filename'] = filename
+    return event
+
+
+def message_log_details(sender_name, msg_type):
+    return f"{sender_name}: {LOG_DETAILS.get(msg_type, 'Надіслав повідомлення')}"
+
+
+def create_file_message(c, user_id, room_id, key, size, mime_type, filename, caption):
+    save_blob_record(c, key, size, mime_type)
+    timestamp = datetime.now(timezone.utc)
+
+    payload = blob_ref(key, size, mime_type, caption=caption)
+
+    room = next_message_seq(c, room_id)
+    c.execute(
+        "INSERT INTO messages (room_id, sender_id, type, content, filename, created_at, seq) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id",
+        (room_id, user_id, 'file', payload, filename, timestamp, room['message_seq']))
+    file_msg_id = c.fetchone()['id']
+    mark_read(user_id, room_id, room['message_seq'])
+
+    # The group log entry is written by the caller once the message commits.
+    log_details = None
+    if room['type'] == 'group':
+        user = get_profile(c, user_id)
+        log_details = f"{user['name']} надіслав файл: {filename}"
+
+    event = message_event(file_msg_id, room_id, user_id, room['message_seq'], 'file', payload, timestamp, filename)
+    return event, log_details
@@ -0,0 +1,105 @@
+from datetime import datetime
+import psycopg
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+MIGRATION_FILE_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+NO_TRANSACTION_MARKER = '-- migrate:no-transaction'
+CONCURRENT_INDEX_RE = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+LOCK_ID = 4735201
+
+
+def list_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append({
+            'version': int(match.group(1)),
+            'name': match.group(2),
+            'sql': sql,
+            'transactional': not sql.lstrip().startswith(NO_TRANSACTION_MARKER),
+        })
+    return migrations
+
+
+def split_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [s.strip() for s in '\n'.join(lines).split(';') if s.strip()]
+
+
+def drop_invalid_index(conn, statement):
+    match = CONCURRENT_INDEX_RE.search(statement)
+    if not match:
+        return
+    row = conn.execute("""SELECT NOT i.indisvalid
+                          FROM pg_index i
+                                   JOIN pg_class c ON c.oid = i.indexrelid
+                          WHERE c.relname = %s
+                            AND pg_table_is_visible(c.oid)""", (match.group(1),)).fetchone()
+    if row and row[0]:
+        conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}')
+
+
+def connect():
+    return psycopg.connect(os.getenv('DATABASE_URL'), autocommit=True)
+
+
+def ensure_migrations_table(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_migrations
+                    (
+                        version    INTEGER PRIMARY KEY,
+                        name       TEXT NOT NULL,
+                        applied_at TEXT NOT NULL
+                    )""")
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def apply_migration(conn, migration):
+    if migration['transactional']:
+        with conn.transaction():
+            conn.execute(migration['sql'])
+            conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                         (migration['version'], migration['name'], datetime.now().isoformat()))
+        return
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so each
+    # statement is sent on its own and must be safe to repeat after a failure.
+    for statement in split_statements(migration['sql']):
+        drop_invalid_index(conn, statement)
+        conn.execute(statement)
+    conn.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                 (migration['version'], migration['name'], datetime.now().isoformat()))
+
+
+def upgrade(log=print):
+    with connect() as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+        try:
+            ensure_migrations_table(conn)
+            done = applied_versions(conn)
+            applied = []
+            for migration in list_migrations():
+                if migration['version'] in done:
+                    continue
+                log(f"Applying {migration['version']:04d}_{migration['name']}")
+                apply_migration(conn, migration)
+                applied.append(migration['version'])
+            return applied
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+
+
+def status():
+    with connect() as conn:
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+    return [(m['version'], m['name'], m['version'] in done) for m in list_migrations()]
@@ -0,0 +1,189 @@
+-- Schema previously created by init_db() on every start.
+
+CREATE TABLE IF NOT EXISTS users
+(
+    id              TEXT PRIMARY KEY,
+    name            TEXT NOT NULL UNIQUE,
+    real_name       TEXT,
+    birth_date      TEXT,
+    gender          TEXT,
+    password_hash   TEXT NOT NULL,
+    avatar          TEXT,
+    avatars_gallery TEXT,
+    bio             TEXT,
+    last_active     TEXT,
+    created_at      TEXT
+);
+
+CREATE TABLE IF NOT EXISTS blocked_users
+(
+    blocker_id TEXT REFERENCES users (id),
+    blocked_id TEXT REFERENCES users (id),
+    PRIMARY KEY (blocker_id, blocked_id)
+);
+
+CREATE TABLE IF NOT EXISTS rooms
+(
+    id          TEXT PRIMARY KEY,
+    type        TEXT CHECK (type IN ('private', 'group')),
+    name        TEXT,
+    avatar      TEXT,
+    created_by  TEXT,
+    created_at  TEXT,
+    deleted_for TEXT
+);
+
+CREATE TABLE IF NOT EXISTS participants
+(
+    room_id   TEXT REFERENCES rooms (id),
+    user_id   TEXT REFERENCES users (id),
+    role      TEXT DEFAULT 'member',
+    joined_at TEXT,
+    PRIMARY KEY (room_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS messages
+(
+    id          SERIAL PRIMARY KEY,
+    room_id     TEXT NOT NULL REFERENCES rooms (id),
+    sender_id   TEXT NOT NULL REFERENCES users (id),
+    type        TEXT CHECK (type IN ('text', 'file', 'voice', 'video', 'system')),
+    content     TEXT,
+    filename    TEXT,
+    created_at  TEXT,
+    edited_at   TEXT,
+    deleted_for TEXT
+);
+
+CREATE TABLE IF NOT EXISTS message_reactions
+(
+    id         SERIAL PRIMARY KEY,
+    message_id INTEGER NOT NULL REFERENCES messages (id),
+    user_id    TEXT    NOT NULL REFERENCES users (id),
+    reaction   TEXT    NOT NULL,
+    created_at TEXT,
+    UNIQUE (message_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS group_logs
+(
+    id        SERIAL PRIMARY KEY,
+    room_id   TEXT NOT NULL REFERENCES rooms (id),
+    action    TEXT NOT NULL,
+    details   TEXT,
+    timestamp TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS blobs
+(
+    sha256     TEXT PRIMARY KEY,
+    size       BIGINT NOT NULL,
+    mime_type  TEXT,
+    created_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS uploads
+(
+    id         TEXT PRIMARY KEY,
+    user_id    TEXT   NOT NULL REFERENCES users (id),
+    room_id    TEXT   NOT NULL REFERENCES rooms (id),
+    filename   TEXT   NOT NULL,
+    caption    TEXT,
+    mime_type  TEXT,
+    size       BIGINT NOT NULL,
+    received   BIGINT NOT NULL DEFAULT 0,
+    created_at TEXT
+);
+
+CREATE SEQUENCE IF NOT EXISTS sync_version_seq;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE rooms ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION bump_sync_version() RETURNS trigger AS
+$$
+BEGIN
+    NEW.version := nextval('sync_version_seq');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_room_version_on_participants() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE rooms SET version = nextval('sync_version_seq')
+    WHERE id = COALESCE(NEW.room_id, OLD.room_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_private_rooms_on_user() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE rooms SET version = nextval('sync_version_seq')
+    WHERE type = 'private'
+      AND id IN (SELECT room_id FROM participants WHERE user_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_versions_on_block() RETURNS trigger AS
+$$
+DECLARE
+    row_data blocked_users%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := OLD;
+    ELSE
+        row_data := NEW;
+    END IF;
+    UPDATE users SET version = nextval('sync_version_seq')
+    WHERE id IN (row_data.blocker_id, row_data.blocked_id);
+    UPDATE rooms SET version = nextval('sync_version_seq')
+    WHERE type = 'private'
+      AND id IN (SELECT p1.room_id
+                 FROM participants p1
+                          JOIN participants p2 ON p1.room_id = p2.room_id
+                 WHERE p1.user_id = row_data.blocker_id
+                   AND p2.user_id = row_data.blocked_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_sync_version ON users;
+CREATE TRIGGER users_sync_version
+    BEFORE INSERT OR UPDATE OF name, real_name, avatar, avatars_gallery, bio, gender, birth_date
+    ON users
+    FOR EACH ROW
+EXECUTE FUNCTION bump_sync_version();
+
+DROP TRIGGER IF EXISTS users_private_rooms_version ON users;
+CREATE TRIGGER users_private_rooms_version
+    AFTER UPDATE OF name, avatar
+    ON users
+    FOR EACH ROW
+EXECUTE FUNCTION bump_private_rooms_on_user();
+
+DROP TRIGGER IF EXISTS rooms_sync_version ON rooms;
+CREATE TRIGGER rooms_sync_version
+    BEFORE INSERT OR UPDATE OF name, avatar, type, created_by, deleted_for
+    ON rooms
+    FOR EACH ROW
+EXECUTE FUNCTION bump_sync_version();
+
+DROP TRIGGER IF EXISTS participants_sync_version ON participants;
+CREATE TRIGGER participants_sync_version
+    AFTER INSERT OR UPDATE OR DELETE
+    ON participants
+    FOR EACH ROW
+EXECUTE FUNCTION bump_room_version_on_participants();
+
+DROP TRIGGER IF EXISTS blocked_users_sync_version ON blocked_users;
+CREATE TRIGGER blocked_users_sync_version
+    AFTER INSERT OR DELETE
+    ON blocked_users
+    FOR EACH ROW
+EXECUTE FUNCTION bump_versions_on_block();
+
+INSERT INTO rooms (id, type, name, created_at)
+VALUES ('general', 'group', 'Загальний чат', to_char(now(), 'YYYY-MM-DD"T"HH24:MI:SS.US'))
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,10 @@
+-- migrate:no-transaction
+-- Secondary indexes for the queries run by the socket and REST handlers.
+-- Built CONCURRENTLY so the migration can run against a live database.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_room_id_id_idx ON messages (room_id, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS participants_user_id_idx ON participants (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS blocked_users_blocked_id_idx ON blocked_users (blocked_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS group_logs_room_id_timestamp_idx ON group_logs (room_id, timestamp DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_version_idx ON users (version);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS uploads_created_at_idx ON uploads (created_at);
@@ -0,0 +1,63 @@
+-- Timestamps become timestamptz; deleted_for / avatars_gallery JSON strings become text[].
+-- Indexes on the converted columns (group_logs, uploads) are rebuilt by ALTER TYPE.
+
+CREATE OR REPLACE FUNCTION migrate_json_to_text_array(value TEXT) RETURNS TEXT[] AS
+$$
+SELECT COALESCE(array_agg(item), '{}')
+FROM jsonb_array_elements_text(NULLIF(value, '')::jsonb) AS item
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Column-specific triggers pin the type of the columns they watch.
+DROP TRIGGER IF EXISTS users_sync_version ON users;
+DROP TRIGGER IF EXISTS rooms_sync_version ON rooms;
+
+ALTER TABLE users
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz,
+    ALTER COLUMN last_active TYPE TIMESTAMPTZ USING NULLIF(last_active, '')::timestamptz,
+    ALTER COLUMN avatars_gallery TYPE TEXT[] USING migrate_json_to_text_array(avatars_gallery),
+    ALTER COLUMN avatars_gallery SET DEFAULT '{}',
+    ALTER COLUMN avatars_gallery SET NOT NULL;
+
+ALTER TABLE rooms
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz,
+    ALTER COLUMN deleted_for TYPE TEXT[] USING migrate_json_to_text_array(deleted_for),
+    ALTER COLUMN deleted_for SET DEFAULT '{}',
+    ALTER COLUMN deleted_for SET NOT NULL;
+
+ALTER TABLE participants
+    ALTER COLUMN joined_at TYPE TIMESTAMPTZ USING NULLIF(joined_at, '')::timestamptz;
+
+ALTER TABLE messages
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz,
+    ALTER COLUMN created_at SET DEFAULT now(),
+    ALTER COLUMN edited_at TYPE TIMESTAMPTZ USING NULLIF(edited_at, '')::timestamptz,
+    ALTER COLUMN deleted_for TYPE TEXT[] USING migrate_json_to_text_array(deleted_for),
+    ALTER COLUMN deleted_for SET DEFAULT '{}',
+    ALTER COLUMN deleted_for SET NOT NULL;
+
+ALTER TABLE message_reactions
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz;
+
+ALTER TABLE group_logs
+    ALTER COLUMN timestamp TYPE TIMESTAMPTZ USING "timestamp"::timestamptz,
+    ALTER COLUMN timestamp SET DEFAULT now();
+
+ALTER TABLE blobs
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz;
+
+ALTER TABLE uploads
+    ALTER COLUMN created_at TYPE TIMESTAMPTZ USING NULLIF(created_at, '')::timestamptz;
+
+DROP FUNCTION migrate_json_to_text_array(TEXT);
+
+CREATE TRIGGER users_sync_version
+    BEFORE INSERT OR UPDATE OF name, real_name, avatar, avatars_gallery, bio, gender, birth_date
+    ON users
+    FOR EACH ROW
+EXECUTE FUNCTION bump_sync_version();
+
+CREATE TRIGGER rooms_sync_version
+    BEFORE INSERT OR UPDATE OF name, avatar, type, created_by, deleted_for
+    ON rooms
+    FOR EACH ROW
+EXECUTE FUNCTION bump_sync_version();
@@ -0,0 +1,54 @@
+-- Per-user visibility moves from the deleted_for arrays to dedicated relations.
+
+CREATE TABLE IF NOT EXISTS message_visibility
+(
+    user_id    TEXT    NOT NULL REFERENCES users (id),
+    message_id INTEGER NOT NULL REFERENCES messages (id),
+    hidden_at  TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (user_id, message_id)
+);
+
+CREATE INDEX IF NOT EXISTS message_visibility_message_id_idx ON message_visibility (message_id);
+
+CREATE TABLE IF NOT EXISTS room_visibility
+(
+    user_id           TEXT    NOT NULL REFERENCES users (id),
+    room_id           TEXT    NOT NULL REFERENCES rooms (id),
+    hidden            BOOLEAN NOT NULL DEFAULT FALSE,
+    cleared_through_id INTEGER,
+    PRIMARY KEY (user_id, room_id)
+);
+
+CREATE INDEX IF NOT EXISTS room_visibility_hidden_room_id_idx ON room_visibility (room_id) WHERE hidden;
+
+INSERT INTO message_visibility (user_id, message_id)
+SELECT hidden.user_id, m.id
+FROM messages m
+         CROSS JOIN LATERAL unnest(m.deleted_for) AS hidden(user_id)
+         JOIN users u ON u.id = hidden.user_id
+ON CONFLICT DO NOTHING;
+
+INSERT INTO room_visibility (user_id, room_id, hidden)
+SELECT hidden.user_id, r.id, TRUE
+FROM rooms r
+         CROSS JOIN LATERAL unnest(r.deleted_for) AS hidden(user_id)
+         JOIN users u ON u.id = hidden.user_id
+ON CONFLICT (user_id, room_id) DO UPDATE SET hidden = TRUE;
+
+DROP TRIGGER IF EXISTS rooms_sync_version ON rooms;
+ALTER TABLE rooms DROP COLUMN deleted_for;
+ALTER TABLE messages DROP COLUMN deleted_for;
+
+CREATE TRIGGER rooms_sync_version
+    BEFORE INSERT OR UPDATE OF name, avatar, type, created_by
+    ON rooms
+    FOR EACH ROW
+EXECUTE FUNCTION bump_sync_version();
+
+-- Hiding or restoring a room changes what get_data returns for it.
+DROP TRIGGER IF EXISTS room_visibility_sync_version ON room_visibility;
+CREATE TRIGGER room_visibility_sync_version
+    AFTER INSERT OR UPDATE OF hidden OR DELETE
+    ON room_visibility
+    FOR EACH ROW
+EXECUTE FUNCTION bump_room_version_on_participants();
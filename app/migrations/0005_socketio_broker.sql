@@ -0,0 +1,22 @@
+-- Shared state for running several Socket.IO workers against one database.
+
+-- Payloads above the NOTIFY size limit are parked here and announced by id.
+CREATE TABLE IF NOT EXISTS socketio_outbox
+(
+    id         BIGSERIAL PRIMARY KEY,
+    payload    TEXT        NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS socketio_outbox_created_at_idx ON socketio_outbox (created_at);
+
+CREATE TABLE IF NOT EXISTS presence_sessions
+(
+    sid          TEXT PRIMARY KEY,
+    user_id      TEXT        NOT NULL REFERENCES users (id),
+    node_id      TEXT        NOT NULL,
+    connected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS presence_sessions_user_id_idx ON presence_sessions (user_id);
+CREATE INDEX IF NOT EXISTS presence_sessions_node_id_idx ON presence_sessions (node_id);
@@ -0,0 +1,7 @@
+-- Worker heartbeats; sessions of a worker that stops heartbeating are expired by the others.
+
+CREATE TABLE IF NOT EXISTS presence_nodes
+(
+    node_id      TEXT PRIMARY KEY,
+    heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
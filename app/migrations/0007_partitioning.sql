@@ -0,0 +1,95 @@
+-- messages and group_logs become range-partitioned by month on their timestamp.
+-- Rows outside every monthly partition go to <table>_default; partitions for the
+-- coming months are created ahead of time by `flask retention partitions`.
+
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, key_column TEXT, month DATE) RETURNS TEXT AS
+$$
+DECLARE
+    start_at  TIMESTAMPTZ := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    end_at    TIMESTAMPTZ := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    partition TEXT        := format('%s_p%s', parent, to_char(month, 'YYYYMM'));
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN partition;
+    END IF;
+    -- Rows of this month already in the default partition must move out
+    -- first, otherwise the new partition cannot be created.
+    EXECUTE format('CREATE TEMP TABLE partition_rows AS SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition, parent, start_at, end_at);
+    EXECUTE format('INSERT INTO %I SELECT * FROM partition_rows', parent);
+    DROP TABLE partition_rows;
+    RETURN partition;
+END
+$$ LANGUAGE plpgsql;
+
+-- A partitioned table cannot be the target of a foreign key on id alone.
+-- Reactions and hidden marks are removed together with their messages instead.
+ALTER TABLE message_reactions DROP CONSTRAINT IF EXISTS message_reactions_message_id_fkey;
+ALTER TABLE message_visibility DROP CONSTRAINT IF EXISTS message_visibility_message_id_fkey;
+
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+ALTER INDEX messages_pkey RENAME TO messages_unpartitioned_pkey;
+ALTER INDEX IF EXISTS messages_room_id_id_idx RENAME TO messages_unpartitioned_room_id_id_idx;
+
+CREATE TABLE messages
+(
+    id         INTEGER     NOT NULL DEFAULT nextval('messages_id_seq'),
+    room_id    TEXT        NOT NULL REFERENCES rooms (id),
+    sender_id  TEXT        NOT NULL REFERENCES users (id),
+    type       TEXT CHECK (type IN ('text', 'file', 'voice', 'video', 'system')),
+    content    TEXT,
+    filename   TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    edited_at  TIMESTAMPTZ,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE messages_id_seq OWNED BY messages.id;
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+CREATE INDEX messages_room_id_id_idx ON messages (room_id, id);
+
+SELECT create_monthly_partition('messages', 'created_at', month::date)
+FROM generate_series(
+             date_trunc('month', COALESCE((SELECT min(created_at) FROM messages_unpartitioned), now()) AT TIME ZONE 'UTC'),
+             date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months',
+             interval '1 month') AS month;
+
+INSERT INTO messages (id, room_id, sender_id, type, content, filename, created_at, edited_at)
+SELECT id, room_id, sender_id, type, content, filename, COALESCE(created_at, now()), edited_at
+FROM messages_unpartitioned;
+
+DROP TABLE messages_unpartitioned;
+
+ALTER TABLE group_logs RENAME TO group_logs_unpartitioned;
+ALTER INDEX group_logs_pkey RENAME TO group_logs_unpartitioned_pkey;
+ALTER INDEX IF EXISTS group_logs_room_id_timestamp_idx RENAME TO group_logs_unpartitioned_room_id_timestamp_idx;
+
+CREATE TABLE group_logs
+(
+    id        INTEGER     NOT NULL DEFAULT nextval('group_logs_id_seq'),
+    room_id   TEXT        NOT NULL REFERENCES rooms (id),
+    action    TEXT        NOT NULL,
+    details   TEXT,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER SEQUENCE group_logs_id_seq OWNED BY group_logs.id;
+CREATE TABLE group_logs_default PARTITION OF group_logs DEFAULT;
+CREATE INDEX group_logs_room_id_timestamp_idx ON group_logs (room_id, timestamp DESC);
+
+SELECT create_monthly_partition('group_logs', 'timestamp', month::date)
+FROM generate_series(
+             date_trunc('month', COALESCE((SELECT min(timestamp) FROM group_logs_unpartitioned), now()) AT TIME ZONE 'UTC'),
+             date_trunc('month', now() AT TIME ZONE 'UTC') + interval '2 months',
+             interval '1 month') AS month;
+
+INSERT INTO group_logs (id, room_id, action, details, timestamp)
+SELECT id, room_id, action, details, timestamp
+FROM group_logs_unpartitioned;
+
+DROP TABLE group_logs_unpartitioned;
@@ -0,0 +1,15 @@
+-- Full-text search over message text and file names, trigram matching for
+-- partial file and user names.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS search TSVECTOR GENERATED ALWAYS AS (
+        to_tsvector('simple', CASE WHEN type = 'text' THEN coalesce(content, '') ELSE '' END || ' ' ||
+                              coalesce(filename, ''))
+        ) STORED;
+
+CREATE INDEX IF NOT EXISTS messages_search_idx ON messages USING gin (search);
+CREATE INDEX IF NOT EXISTS messages_filename_trgm_idx ON messages USING gin (filename gin_trgm_ops)
+    WHERE filename IS NOT NULL;
+CREATE INDEX IF NOT EXISTS users_name_trgm_idx ON users USING gin (name gin_trgm_ops);
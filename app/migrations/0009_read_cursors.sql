@@ -0,0 +1,54 @@
+-- Per-room message sequence numbers and per-user read cursors; the unread
+-- count of a room is rooms.message_seq - read_cursors.read_seq.
+
+ALTER TABLE rooms ADD COLUMN IF NOT EXISTS message_seq BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS seq BIGINT;
+
+CREATE TABLE IF NOT EXISTS read_cursors
+(
+    user_id    TEXT        NOT NULL REFERENCES users (id),
+    room_id    TEXT        NOT NULL REFERENCES rooms (id),
+    read_seq   BIGINT      NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, room_id)
+);
+
+CREATE INDEX IF NOT EXISTS read_cursors_room_id_idx ON read_cursors (room_id);
+
+UPDATE messages m
+SET seq = n.seq
+FROM (SELECT id, created_at, row_number() OVER (PARTITION BY room_id ORDER BY id) AS seq FROM messages) n
+WHERE m.id = n.id
+  AND m.created_at = n.created_at;
+
+UPDATE rooms r
+SET message_seq = s.max_seq
+FROM (SELECT room_id, max(seq) AS max_seq FROM messages GROUP BY room_id) s
+WHERE r.id = s.room_id;
+
+-- Existing members start with everything read.
+INSERT INTO read_cursors (user_id, room_id, read_seq)
+SELECT p.user_id, p.room_id, r.message_seq
+FROM participants p
+         JOIN rooms r ON r.id = p.room_id
+ON CONFLICT (user_id, room_id) DO NOTHING;
+
+-- So do members added later: history from before they joined is not unread.
+CREATE OR REPLACE FUNCTION init_read_cursor() RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO read_cursors (user_id, room_id, read_seq)
+    SELECT NEW.user_id, NEW.room_id, message_seq
+    FROM rooms
+    WHERE id = NEW.room_id
+    ON CONFLICT (user_id, room_id) DO UPDATE SET read_seq = EXCLUDED.read_seq, updated_at = now();
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS participants_read_cursor ON participants;
+CREATE TRIGGER participants_read_cursor
+    AFTER INSERT
+    ON participants
+    FOR EACH ROW
+EXECUTE FUNCTION init_read_cursor();
@@ -0,0 +1,157 @@
+-- Last message and message count per room, kept up to date by statement
+-- triggers on messages so the room list never has to look into messages.
+
+CREATE TABLE IF NOT EXISTS room_summary
+(
+    room_id         TEXT PRIMARY KEY REFERENCES rooms (id) ON DELETE CASCADE,
+    last_message_id INTEGER,
+    last_sender_id  TEXT,
+    last_type       TEXT,
+    preview         TEXT,
+    last_message_at TIMESTAMPTZ,
+    message_count   BIGINT NOT NULL DEFAULT 0
+);
+
+-- Text is encrypted on the client and cannot be cut on the server, so long
+-- texts get no preview rather than a broken one.
+CREATE OR REPLACE FUNCTION message_preview(type TEXT, content TEXT, filename TEXT) RETURNS TEXT AS
+$$
+SELECT CASE
+           WHEN type IN ('text', 'system') AND length(content) <= 2048 THEN content
+           WHEN type = 'file' THEN filename
+           END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_room_summary(room_ids TEXT[]) RETURNS VOID AS
+$$
+UPDATE room_summary s
+SET (last_message_id, last_sender_id, last_type, preview, last_message_at) =
+        (SELECT m.id, m.sender_id, m.type, message_preview(m.type, m.content, m.filename), m.created_at
+         FROM messages m
+         WHERE m.room_id = s.room_id
+         ORDER BY m.id DESC
+         LIMIT 1),
+    message_count = (SELECT count(*) FROM messages m WHERE m.room_id = s.room_id)
+WHERE room_ids IS NULL
+   OR s.room_id = ANY (room_ids)
+$$ LANGUAGE sql;
+
+-- Sends take the rooms row lock before their id is drawn, so within a room
+-- new rows always carry the highest id.
+CREATE OR REPLACE FUNCTION room_summary_on_insert() RETURNS trigger AS
+$$
+BEGIN
+    INSERT INTO room_summary AS s (room_id, last_message_id, last_sender_id, last_type, preview, last_message_at,
+                                   message_count)
+    SELECT DISTINCT ON (room_id) room_id,
+                                 id,
+                                 sender_id,
+                                 type,
+                                 message_preview(type, content, filename),
+                                 created_at,
+                                 count(*) OVER (PARTITION BY room_id)
+    FROM new_rows
+    ORDER BY room_id, id DESC
+    ON CONFLICT (room_id) DO UPDATE SET last_message_id = EXCLUDED.last_message_id,
+                                        last_sender_id  = EXCLUDED.last_sender_id,
+                                        last_type       = EXCLUDED.last_type,
+                                        preview         = EXCLUDED.preview,
+                                        last_message_at = EXCLUDED.last_message_at,
+                                        message_count   = s.message_count + EXCLUDED.message_count;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION room_summary_on_update() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE room_summary s
+    SET preview = message_preview(n.type, n.content, n.filename)
+    FROM new_rows n
+    WHERE s.room_id = n.room_id
+      AND s.last_message_id = n.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION room_summary_on_delete() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE room_summary s
+    SET message_count = s.message_count - d.count
+    FROM (SELECT room_id, count(*) AS count FROM old_rows GROUP BY room_id) d
+    WHERE s.room_id = d.room_id;
+
+    UPDATE room_summary s
+    SET (last_message_id, last_sender_id, last_type, preview, last_message_at) =
+            (SELECT m.id, m.sender_id, m.type, message_preview(m.type, m.content, m.filename), m.created_at
+             FROM messages m
+             WHERE m.room_id = s.room_id
+             ORDER BY m.id DESC
+             LIMIT 1)
+    WHERE s.last_message_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+INSERT INTO room_summary (room_id, last_message_id, last_sender_id, last_type, preview, last_message_at, message_count)
+SELECT DISTINCT ON (room_id) room_id,
+                             id,
+                             sender_id,
+                             type,
+                             message_preview(type, content, filename),
+                             created_at,
+                             count(*) OVER (PARTITION BY room_id)
+FROM messages
+ORDER BY room_id, id DESC
+ON CONFLICT (room_id) DO NOTHING;
+
+DROP TRIGGER IF EXISTS messages_summary_insert ON messages;
+CREATE TRIGGER messages_summary_insert
+    AFTER INSERT
+    ON messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+EXECUTE FUNCTION room_summary_on_insert();
+
+DROP TRIGGER IF EXISTS messages_summary_update ON messages;
+CREATE TRIGGER messages_summary_update
+    AFTER UPDATE
+    ON messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+EXECUTE FUNCTION room_summary_on_update();
+
+DROP TRIGGER IF EXISTS messages_summary_delete ON messages;
+CREATE TRIGGER messages_summary_delete
+    AFTER DELETE
+    ON messages
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+EXECUTE FUNCTION room_summary_on_delete();
+
+-- Rows moved out of the default partition go straight into the new one;
+-- going through the parent would count them a second time.
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, key_column TEXT, month DATE) RETURNS TEXT AS
+$$
+DECLARE
+    start_at  TIMESTAMPTZ := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    end_at    TIMESTAMPTZ := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    partition TEXT        := format('%s_p%s', parent, to_char(month, 'YYYYMM'));
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN partition;
+    END IF;
+    -- Rows of this month already in the default partition must move out
+    -- first, otherwise the new partition cannot be created.
+    EXECUTE format('CREATE TEMP TABLE partition_rows AS SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition, parent, start_at, end_at);
+    EXECUTE format('INSERT INTO %I SELECT * FROM partition_rows', partition);
+    DROP TABLE partition_rows;
+    RETURN partition;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,72 @@
+-- Sync versions become the id of the writing transaction instead of a
+-- sequence value. Sequence values are handed out before commit, so a row
+-- stamped N could become visible after a client had already synced past
+-- N + 1. get_data now hands out the snapshot xmin as the watermark: every
+-- transaction below it has finished, and everything at or above it is sent
+-- again on the next sync.
+
+CREATE OR REPLACE FUNCTION sync_version() RETURNS BIGINT AS
+$$
+SELECT pg_current_xact_id()::text::bigint
+$$ LANGUAGE sql VOLATILE;
+
+CREATE OR REPLACE FUNCTION sync_watermark() RETURNS BIGINT AS
+$$
+SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+$$ LANGUAGE sql VOLATILE;
+
+CREATE OR REPLACE FUNCTION bump_sync_version() RETURNS trigger AS
+$$
+BEGIN
+    NEW.version := sync_version();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_room_version_on_participants() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE rooms SET version = sync_version()
+    WHERE id = COALESCE(NEW.room_id, OLD.room_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_private_rooms_on_user() RETURNS trigger AS
+$$
+BEGIN
+    UPDATE rooms SET version = sync_version()
+    WHERE type = 'private'
+      AND id IN (SELECT room_id FROM participants WHERE user_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bump_versions_on_block() RETURNS trigger AS
+$$
+DECLARE
+    row_data blocked_users%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := OLD;
+    ELSE
+        row_data := NEW;
+    END IF;
+    UPDATE users SET version = sync_version()
+    WHERE id IN (row_data.blocker_id, row_data.blocked_id);
+    UPDATE rooms SET version = sync_version()
+    WHERE type = 'private'
+      AND id IN (SELECT p1.room_id
+                 FROM participants p1
+                          JOIN participants p2 ON p1.room_id = p2.room_id
+                 WHERE p1.user_id = row_data.blocker_id
+                   AND p2.user_id = row_data.blocked_id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Old sequence values are not comparable with transaction ids.
+UPDATE users SET version = sync_version();
+UPDATE rooms SET version = sync_version();
+
+DROP SEQUENCE IF EXISTS sync_version_seq;
@@ -0,0 +1,11 @@
+-- Message text is encrypted on the client, so indexing it only produced
+-- ciphertext tokens no plaintext query can match. The full-text index now
+-- covers file names only.
+
+DROP INDEX IF EXISTS messages_search_idx;
+ALTER TABLE messages DROP COLUMN IF EXISTS search;
+
+ALTER TABLE messages
+    ADD COLUMN search TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', coalesce(filename, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS messages_search_idx ON messages USING gin (search);
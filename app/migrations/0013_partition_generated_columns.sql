@@ -0,0 +1,36 @@
+-- Generated columns (messages.search since 0008) cannot be written, so
+-- INSERT ... SELECT * failed whenever a partition was created for a month
+-- that already had rows in the default partition. The copy now lists the
+-- stored columns only and the generated ones are recomputed.
+
+CREATE OR REPLACE FUNCTION create_monthly_partition(parent TEXT, key_column TEXT, month DATE) RETURNS TEXT AS
+$$
+DECLARE
+    start_at  TIMESTAMPTZ := date_trunc('month', month::timestamp) AT TIME ZONE 'UTC';
+    end_at    TIMESTAMPTZ := (date_trunc('month', month::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    partition TEXT        := format('%s_p%s', parent, to_char(month, 'YYYYMM'));
+    columns   TEXT;
+BEGIN
+    IF to_regclass(partition) IS NOT NULL THEN
+        RETURN partition;
+    END IF;
+    -- Rows of this month already in the default partition must move out
+    -- first, otherwise the new partition cannot be created.
+    EXECUTE format('CREATE TEMP TABLE partition_rows AS SELECT * FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('DELETE FROM %I WHERE %I >= %L AND %I < %L',
+                   parent || '_default', key_column, start_at, key_column, end_at);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   partition, parent, start_at, end_at);
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+    INTO columns
+    FROM pg_attribute
+    WHERE attrelid = parent::regclass
+      AND attnum > 0
+      AND NOT attisdropped
+      AND attgenerated = '';
+    EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM partition_rows', partition, columns, columns);
+    DROP TABLE partition_rows;
+    RETURN partition;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,309 @@
+from .broker import MESSAGE_QUEUE, NODE_ID, queue_scheme
+from .database import get_db
+from .extensions import socketio
+from .writebehind import WriteBehindBuffer
+from datetime import datetime, timezone
+import atexit
+import logging
+import os
+import threading
+
+PRESENCE_TTL = int(os.getenv('PRESENCE_TTL', 30))
+HEARTBEAT_INTERVAL = int(os.getenv('PRESENCE_HEARTBEAT_INTERVAL', 10))
+FLUSH_INTERVAL = float(os.getenv('PRESENCE_FLUSH_INTERVAL', 1))
+LAST_ACTIVE_FLUSH_INTERVAL = float(os.getenv('LAST_ACTIVE_FLUSH_INTERVAL', 5))
+LAST_ACTIVE_FLUSH_SIZE = int(os.getenv('LAST_ACTIVE_FLUSH_SIZE', 500))
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryPresence:
+    def __init__(self):
+        self.sessions = {}
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    def add(self, user_id, sid):
+        with self.lock:
+            self.owners[sid] = user_id
+            self.sessions.setdefault(user_id, set()).add(sid)
+            return len(self.sessions[user_id]) == 1
+
+    def remove(self, sid):
+        with self.lock:
+            user_id = self.owners.pop(sid, None)
+            sids = self.sessions.get(user_id)
+            if sids is None:
+                return None
+            sids.discard(sid)
+            if sids:
+                return None
+            del self.sessions[user_id]
+            return user_id
+
+    def sids(self, user_id):
+        with self.lock:
+            return list(self.sessions.get(user_id, ()))
+
+    def is_online(self, user_id):
+        return user_id in self.sessions
+
+    def online_users(self):
+        with self.lock:
+            return set(self.sessions)
+
+    def heartbeat(self):
+        pass
+
+    def expire(self):
+        return []
+
+    def forget_node(self):
+        pass
+
+
+class RedisPresence:
+    def __init__(self, url, prefix='presence', node_id=NODE_ID):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.node_id = node_id
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+
+    def _sid_key(self, sid):
+        return f'{self.prefix}:sid:{sid}'
+
+    def _node_key(self, node_id):
+        return f'{self.prefix}:node:{node_id}'
+
+    def add(self, user_id, sid):
+        pipe = self.redis.pipeline()
+        pipe.set(self._sid_key(sid), user_id)
+        pipe.sadd(self._node_key(self.node_id), sid)
+        pipe.sadd(self._user_key(user_id), sid)
+        pipe.sadd(f'{self.prefix}:online', user_id)
+        pipe.scard(self._user_key(user_id))
+        return pipe.execute()[-1] == 1
+
+    def remove(self, sid, node_id=NODE_ID):
+        user_id = self.redis.getdel(self._sid_key(sid))
+        if user_id is None:
+            return None
+        pipe = self.redis.pipeline()
+        pipe.srem(self._node_key(node_id), sid)
+        pipe.srem(self._user_key(user_id), sid)
+        pipe.scard(self._user_key(user_id))
+        if pipe.execute()[-1]:
+            return None
+        self.redis.srem(f'{self.prefix}:online', user_id)
+        return user_id
+
+    def sids(self, user_id):
+        return list(self.redis.smembers(self._user_key(user_id)))
+
+    def is_online(self, user_id):
+        return bool(self.redis.sismember(f'{self.prefix}:online', user_id))
+
+    def online_users(self):
+        return set(self.redis.smembers(f'{self.prefix}:online'))
+
+    def heartbeat(self):
+        pipe = self.redis.pipeline()
+        pipe.set(f'{self._node_key(self.node_id)}:alive', 1, ex=PRESENCE_TTL)
+        pipe.sadd(f'{self.prefix}:nodes', self.node_id)
+        pipe.execute()
+
+    def expire(self):
+        offline = []
+        for node_id in self.redis.smembers(f'{self.prefix}:nodes'):
+            if self.redis.exists(f'{self._node_key(node_id)}:alive'):
+                continue
+            offline.extend(self._drop_node(node_id))
+        return offline
+
+    def _drop_node(self, node_id):
+        offline = []
+        for sid in self.redis.smembers(self._node_key(node_id)):
+            user_id = self.remove(sid, node_id)
+            if user_id:
+                offline.append(user_id)
+        self.redis.delete(self._node_key(node_id), f'{self._node_key(node_id)}:alive')
+        self.redis.srem(f'{self.prefix}:nodes', node_id)
+        return offline
+
+    def forget_node(self):
+        self._drop_node(self.node_id)
+
+
+class PostgresPresence:
+    def __init__(self, node_id=NODE_ID):
+        self.node_id = node_id
+
+    def add(self, user_id, sid):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT EXISTS (SELECT 1 FROM presence_sessions WHERE user_id = %s) AS online", (user_id,))
+            was_online = c.fetchone()['online']
+            c.execute('''INSERT INTO presence_sessions (sid, user_id, node_id)
+                         VALUES (%s, %s, %s)
+                         ON CONFLICT (sid) DO UPDATE SET user_id = EXCLUDED.user_id, node_id = EXCLUDED.node_id''',
+                      (sid, user_id, self.node_id))
+            conn.commit()
+        return not was_online
+
+    def remove(self, sid):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("DELETE FROM presence_sessions WHERE sid = %s RETURNING user_id", (sid,))
+            row = c.fetchone()
+            conn.commit()
+            if not row:
+                return None
+            c.execute("SELECT EXISTS (SELECT 1 FROM presence_sessions WHERE user_id = %s) AS online",
+                      (row['user_id'],))
+            return None if c.fetchone()['online'] else row['user_id']
+
+    def sids(self, user_id):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT sid FROM presence_sessions WHERE user_id = %s", (user_id,))
+            return [row['sid'] for row in c.fetchall()]
+
+    def is_online(self, user_id):
+        return bool(self.sids(user_id))
+
+    def online_users(self):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT DISTINCT user_id FROM presence_sessions")
+            return {row['user_id'] for row in c.fetchall()}
+
+    def heartbeat(self):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute('''INSERT INTO presence_nodes (node_id, heartbeat_at)
+                         VALUES (%s, now())
+                         ON CONFLICT (node_id) DO UPDATE SET heartbeat_at = now()''', (self.node_id,))
+            conn.commit()
+
+    def expire(self):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("DELETE FROM presence_nodes WHERE heartbeat_at < now() - make_interval(secs => %s)",
+                      (PRESENCE_TTL,))
+            c.execute('''DELETE FROM presence_sessions s
+                         WHERE NOT EXISTS (SELECT 1 FROM presence_nodes n WHERE n.node_id = s.node_id)
+                         RETURNING user_id''')
+            user_ids = list({row['user_id'] for row in c.fetchall()})
+            conn.commit()
+            if not user_ids:
+                return []
+            c.execute("SELECT DISTINCT user_id FROM presence_sessions WHERE user_id = ANY(%s)", (user_ids,))
+            still_online = {row['user_id'] for row in c.fetchall()}
+        return [user_id for user_id in user_ids if user_id not in still_online]
+
+    def forget_node(self):
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("DELETE FROM presence_sessions WHERE node_id = %s", (self.node_id,))
+            c.execute("DELETE FROM presence_nodes WHERE node_id = %s", (self.node_id,))
+            conn.commit()
+
+
+def make_presence():
+    scheme = queue_scheme()
+    if scheme in ('redis', 'rediss'):
+        return RedisPresence(MESSAGE_QUEUE)
+    if scheme in ('postgres', 'postgresql'):
+        return PostgresPresence()
+    return MemoryPresence()
+
+
+presence = make_presence()
+
+
+class PresenceNotifier:
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def queue(self, user_id, status, last_active=None):
+        with self.lock:
+            self.pending[user_id] = {'user_id': user_id, 'status': status, 'last_active': last_active}
+
+    def flush(self):
+        with self.lock:
+            updates, self.pending = self.pending, {}
+        if not updates:
+            return
+
+        user_ids = list(updates)
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT id, gender FROM users WHERE id = ANY(%s)", (user_ids,))
+            for row in c.fetchall():
+                updates[row['id']]['gender'] = row['gender'] or 'male'
+
+            c.execute('''SELECT room_id, array_agg(user_id) AS user_ids
+                         FROM participants
+                         WHERE user_id = ANY(%s)
+                         GROUP BY room_id''', (user_ids,))
+            rooms = c.fetchall()
+
+        # One packet per room that contains changed users; everyone sharing a
+        # room with them is in that room, so nobody else needs to hear about it.
+        for room in rooms:
+            socketio.emit('presence_update', {'updates': [updates[uid] for uid in room['user_ids']]},
+                          to=room['room_id'])
+
+
+notifier = PresenceNotifier()
+
+
+def flush_last_active(items):
+    values = ', '.join(['(%s, %s::timestamptz)'] * len(items))
+    params = [param for item in items.items() for param in item]
+    with get_db() as conn, conn.cursor() as c:
+        c.execute(f'''UPDATE users u
+                      SET last_active = v.last_active
+                      FROM (VALUES {values}) AS v(id, last_active)
+                      WHERE u.id = v.id
+                        AND (u.last_active IS NULL OR u.last_active < v.last_active)''', params)
+        conn.commit()
+
+
+last_active_buffer = WriteBehindBuffer('last_active', flush_last_active,
+                                       interval=LAST_ACTIVE_FLUSH_INTERVAL, max_size=LAST_ACTIVE_FLUSH_SIZE)
+loop_started = False
+loop_lock = threading.Lock()
+
+
+def expire_dead_nodes():
+    offline = presence.expire()
+    if not offline:
+        return
+    last_seen = datetime.now(timezone.utc)
+    for user_id in offline:
+        last_active_buffer.put(user_id, last_seen)
+        notifier.queue(user_id, 'offline', last_seen)
+
+
+def presence_loop():
+    ticks_per_heartbeat = max(1, int(HEARTBEAT_INTERVAL / FLUSH_INTERVAL))
+    tick = 0
+    while True:
+        socketio.sleep(FLUSH_INTERVAL)
+        tick += 1
+        try:
+            if tick % ticks_per_heartbeat == 0:
+                presence.heartbeat()
+                expire_dead_nodes()
+            notifier.flush()
+        except Exception:
+            logger.exception('Presence loop iteration failed')
+
+
+def start_presence_loop():
+    global loop_started
+    with loop_lock:
+        if loop_started:
+            return
+        loop_started = True
+    presence.heartbeat()
+    atexit.register(presence.forget_node)
+    last_active_buffer.start()
+    socketio.start_background_task(presence_loop)
@@ -0,0 +1,31 @@
+from .broker import on_invalidate, publish_invalidation, start_invalidation_listener
+from .cache import LRUCache
+import os
+
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 10000))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 300))
+
+profile_cache = LRUCache(PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+
+def get_profile(c, user_id):
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    start_invalidation_listener()
+    c.execute("SELECT id, name, avatar FROM users WHERE id = %s", (user_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    profile = {'id': row['id'], 'name': row['name'], 'avatar': row['avatar']}
+    profile_cache.set(user_id, profile)
+    return profile
+
+
+def invalidate_profile(user_id):
+    publish_invalidation('profile', user_id)
+
+
+@on_invalidate('profile')
+def drop_profile(user_id):
+    profile_cache.delete(user_id)
@@ -0,0 +1,46 @@
+from .database import get_db
+from .extensions import socketio
+from .writebehind import WriteBehindBuffer
+import os
+
+READ_CURSOR_FLUSH_INTERVAL = float(os.getenv('READ_CURSOR_FLUSH_INTERVAL', 2))
+READ_CURSOR_FLUSH_SIZE = int(os.getenv('READ_CURSOR_FLUSH_SIZE', 1000))
+
+
+def flush_read_cursors(items):
+    values = ', '.join(['(%s, %s, %s::bigint)'] * len(items))
+    params = [param for (user_id, room_id), seq in items.items() for param in (user_id, room_id, seq)]
+    with get_db() as conn, conn.cursor() as c:
+        c.execute(f'''INSERT INTO read_cursors (user_id, room_id, read_seq, updated_at)
+                      SELECT v.user_id, v.room_id, LEAST(v.seq, r.message_seq), now()
+                      FROM (VALUES {values}) AS v(user_id, room_id, seq)
+                               JOIN rooms r ON r.id = v.room_id
+                               JOIN participants p ON p.room_id = v.room_id AND p.user_id = v.user_id
+                      ON CONFLICT (user_id, room_id) DO UPDATE
+                          SET read_seq   = GREATEST(read_cursors.read_seq, EXCLUDED.read_seq),
+                              updated_at = EXCLUDED.updated_at
+                      RETURNING user_id, room_id, read_seq''', params)
+        rows = c.fetchall()
+        conn.commit()
+
+    receipts = {}
+    for row in rows:
+        receipts.setdefault(row['room_id'], []).append({'user_id': row['user_id'], 'seq': row['read_seq']})
+    for room_id, cursors in receipts.items():
+        socketio.emit('read_receipts', {'room_id': room_id, 'cursors': cursors}, to=room_id)
+
+
+read_cursor_buffer = WriteBehindBuffer('read_cursors', flush_read_cursors, interval=READ_CURSOR_FLUSH_INTERVAL,
+                                       max_size=READ_CURSOR_FLUSH_SIZE, merge=max)
+
+
+def mark_read(user_id, room_id, seq):
+    read_cursor_buffer.start()
+    read_cursor_buffer.put((user_id, room_id), int(seq))
+
+
+def unread_count(user_id, room_id, message_seq, read_seq):
+    pending = read_cursor_buffer.peek((user_id, room_id))
+    if pending is not None:
+        read_seq = max(read_seq or 0, pending)
+    return max(0, message_seq - (read_seq or 0))
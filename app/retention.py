@@ -0,0 +1,147 @@
+from .database import get_db
+from datetime import datetime, timedelta, timezone
+from psycopg import sql
+import gzip
+import logging
+import os
+import re
+
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'storage/archive')
+PARTITION_PREMAKE_MONTHS = int(os.getenv('PARTITION_PREMAKE_MONTHS', 2))
+ROOM_TYPES = ('private', 'group')
+PARTITIONED_TABLES = {'messages': 'created_at', 'group_logs': 'timestamp'}
+PARTITION_NAME_RE = re.compile(r'^(\w+)_p(\d{4})(\d{2})$')
+
+logger = logging.getLogger(__name__)
+
+
+def retention_days(table, room_type):
+    value = os.getenv(f'RETENTION_{table.upper()}_{room_type.upper()}_DAYS') or \
+            os.getenv(f'RETENTION_{table.upper()}_DAYS')
+    return int(value) if value else None
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def ensure_partitions(c, months_ahead=PARTITION_PREMAKE_MONTHS):
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    names = []
+    for table, key_column in PARTITIONED_TABLES.items():
+        for offset in range(months_ahead + 1):
+            c.execute("SELECT create_monthly_partition(%s, %s, %s) AS name",
+                      (table, key_column, add_months(this_month, offset)))
+            names.append(c.fetchone()['name'])
+    return names
+
+
+def list_partitions(c, table):
+    c.execute("""SELECT child.relname AS name
+                 FROM pg_inherits i
+                          JOIN pg_class child ON child.oid = i.inhrelid
+                 WHERE i.inhparent = %s::regclass
+                 ORDER BY child.relname""", (table,))
+    partitions = []
+    for row in c.fetchall():
+        match = PARTITION_NAME_RE.match(row['name'])
+        if match and match.group(1) == table:
+            start = datetime(int(match.group(2)), int(match.group(3)), 1, tzinfo=timezone.utc)
+            partitions.append({'name': row['name'], 'start': start, 'end': add_months(start, 1)})
+    return partitions
+
+
+def export_rows(c, query, params, name):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f'{name}.csv.gz')
+    tmp = f'{path}.tmp'
+    with gzip.open(tmp, 'wb') as f:
+        with c.copy(sql.SQL('COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)').format(query), params) as copy:
+            for chunk in copy:
+                f.write(chunk)
+    os.replace(tmp, path)
+    return path
+
+
+def delete_message_dependents(c, message_ids_query, params):
+    c.execute(sql.SQL('DELETE FROM message_reactions WHERE message_id IN ({})').format(message_ids_query), params)
+    c.execute(sql.SQL('DELETE FROM message_visibility WHERE message_id IN ({})').format(message_ids_query), params)
+
+
+def partition_cutoff(table, now):
+    days = [retention_days(table, room_type) for room_type in ROOM_TYPES]
+    if None in days:
+        return None
+    return now - timedelta(days=max(days))
+
+
+def archive_partitions(conn, c, table, now, dry_run=False):
+    cutoff = partition_cutoff(table, now)
+    if cutoff is None:
+        return []
+
+    archived = []
+    for partition in list_partitions(c, table):
+        if partition['end'] > cutoff:
+            continue
+        archived.append(partition['name'])
+        if dry_run:
+            continue
+
+        name = sql.Identifier(partition['name'])
+        export_rows(c, sql.SQL('SELECT * FROM {}').format(name), None, partition['name'])
+        if table == 'messages':
+            delete_message_dependents(c, sql.SQL('SELECT id FROM {}').format(name), None)
+        c.execute(sql.SQL('ALTER TABLE {} DETACH PARTITION {}').format(sql.Identifier(table), name))
+        c.execute(sql.SQL('DROP TABLE {}').format(name))
+        conn.commit()
+        logger.info('Archived and detached %s', partition['name'])
+    return archived
+
+
+def purge_expired_rows(conn, c, table, now, dry_run=False):
+    key_column = PARTITIONED_TABLES[table]
+    purged = {}
+    for room_type in ROOM_TYPES:
+        days = retention_days(table, room_type)
+        if days is None:
+            continue
+        cutoff = now - timedelta(days=days)
+        where = sql.SQL('{} < %s AND room_id IN (SELECT id FROM rooms WHERE type = %s)').format(
+            sql.Identifier(key_column))
+        params = (cutoff, room_type)
+
+        if dry_run:
+            c.execute(sql.SQL('SELECT count(*) AS count FROM {} WHERE {}').format(sql.Identifier(table), where),
+                      params)
+            purged[room_type] = c.fetchone()['count']
+            continue
+
+        name = f"{table}_{room_type}_before_{cutoff:%Y%m%d}_{now:%Y%m%d%H%M%S}"
+        export_rows(c, sql.SQL('SELECT * FROM {} WHERE {}').format(sql.Identifier(table), where), params, name)
+        if table == 'messages':
+            delete_message_dependents(c, sql.SQL('SELECT id FROM messages WHERE {}').format(where), params)
+        c.execute(sql.SQL('DELETE FROM {} WHERE {}').format(sql.Identifier(table), where), params)
+        purged[room_type] = c.rowcount
+        conn.commit()
+    return purged
+
+
+def run_retention(dry_run=False):
+    now = datetime.now(timezone.utc)
+    report = {}
+    with get_db() as conn, conn.cursor() as c:
+        if not dry_run:
+            ensure_partitions(c)
+            conn.commit()
+        for table in PARTITIONED_TABLES:
+            report[table] = {
+                'partitions': archive_partitions(conn, c, table, now, dry_run),
+                'rows': purge_expired_rows(conn, c, table, now, dry_run),
+            }
+        # Dropped partitions bypass the room_summary triggers.
+        if report['messages']['partitions'] and not dry_run:
+            c.execute("SELECT refresh_room_summary(NULL)")
+            conn.commit()
+    return report
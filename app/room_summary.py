@@ -0,0 +1,44 @@
+# The caller's rooms with their last message, unread state and visibility in
+# one pass: participants (user_id index) joined to room_summary, rooms,
+# room_visibility and read_cursors by primary key, most recent activity first.
+ROOM_LIST_SQL = '''
+SELECT r.id,
+       r.version,
+       r.message_seq,
+       rc.read_seq,
+       s.last_message_id,
+       s.last_sender_id,
+       s.last_type,
+       s.preview,
+       s.message_count,
+       COALESCE(s.last_message_at, r.created_at) AS last_activity,
+       s.last_message_id <= COALESCE(rv.cleared_through_id, 0)
+           OR EXISTS (SELECT 1
+                      FROM message_visibility v
+                      WHERE v.user_id = p.user_id
+                        AND v.message_id = s.last_message_id) AS last_hidden
+FROM participants p
+         JOIN rooms r ON r.id = p.room_id
+         LEFT JOIN room_summary s ON s.room_id = p.room_id
+         LEFT JOIN room_visibility rv ON rv.room_id = p.room_id AND rv.user_id = p.user_id
+         LEFT JOIN read_cursors rc ON rc.room_id = p.room_id AND rc.user_id = p.user_id
+WHERE p.user_id = %s
+  AND NOT COALESCE(rv.hidden, FALSE)
+ORDER BY last_activity DESC, r.id'''
+
+
+def list_rooms(c, user_id):
+    c.execute(ROOM_LIST_SQL, (user_id,))
+    return c.fetchall()
+
+
+def room_summary(row, all_invisible):
+    summary = {'last_activity': row['last_activity'], 'message_count': row['message_count'] or 0}
+    if row['last_message_id'] and not row['last_hidden'] and row['last_sender_id'] not in all_invisible:
+        summary.update({
+            'last_message_id': row['last_message_id'],
+            'sender_id': row['last_sender_id'],
+            'type': row['last_type'],
+            'preview': row['preview'],
+        })
+    return summary
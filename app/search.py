@@ -0,0 +1,76 @@
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+TRIGRAM_MIN_LENGTH = 3
+
+# Message text is encrypted on the client, so only file names are searched.
+# Candidates come from the GIN indexes (file name tsvector, and file name
+# trigrams for longer queries) limited to the caller's rooms; visibility and
+# blocks are applied to the candidates only.
+SEARCH_MESSAGES_SQL = '''
+WITH q AS (SELECT websearch_to_tsquery('simple', %(q)s) AS query),
+     my_rooms AS (SELECT room_id
+                  FROM participants
+                  WHERE user_id = %(user_id)s
+                    AND (%(room_id)s::text IS NULL OR room_id = %(room_id)s)),
+     hits AS (SELECT m.id, m.created_at, ts_rank_cd(m.search, q.query) AS rank
+              FROM messages m,
+                   q
+              WHERE m.search @@ q.query
+                AND m.room_id IN (SELECT room_id FROM my_rooms)
+              UNION ALL
+              SELECT m.id, m.created_at, similarity(m.filename, %(q)s) AS rank
+              FROM messages m
+              WHERE %(trigram)s
+                AND m.filename ILIKE %(like)s
+                AND m.room_id IN (SELECT room_id FROM my_rooms)),
+     ranked AS (SELECT id, created_at, max(rank) AS rank
+                FROM hits
+                GROUP BY id, created_at)
+SELECT m.id, m.room_id, m.sender_id, m.type, m.content, m.filename, m.created_at, m.edited_at,
+       u.name AS sender_name, u.avatar AS sender_avatar, r.rank
+FROM ranked r
+         JOIN messages m ON m.id = r.id AND m.created_at = r.created_at
+         JOIN users u ON u.id = m.sender_id
+         LEFT JOIN room_visibility rv ON rv.user_id = %(user_id)s AND rv.room_id = m.room_id
+WHERE m.id > COALESCE(rv.cleared_through_id, 0)
+  AND NOT EXISTS (SELECT 1 FROM message_visibility v WHERE v.user_id = %(user_id)s AND v.message_id = m.id)
+  AND NOT EXISTS (SELECT 1
+                  FROM blocked_users b
+                  WHERE (b.blocker_id = %(user_id)s AND b.blocked_id = m.sender_id)
+                     OR (b.blocker_id = m.sender_id AND b.blocked_id = %(user_id)s))
+ORDER BY r.rank DESC, m.id DESC
+LIMIT %(limit)s OFFSET %(offset)s'''
+
+SEARCH_USERS_SQL = '''
+SELECT u.id, u.name, u.real_name, u.avatar, similarity(u.name, %(q)s) AS rank
+FROM users u
+WHERE u.name ILIKE %(like)s
+  AND u.id <> %(user_id)s
+  AND NOT EXISTS (SELECT 1
+                  FROM blocked_users b
+                  WHERE b.blocker_id = u.id AND b.blocked_id = %(user_id)s)
+ORDER BY rank DESC, u.name
+LIMIT %(limit)s'''
+
+
+def like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def search_messages(c, user_id, query, room_id=None, limit=SEARCH_PAGE_SIZE, offset=0):
+    limit = max(1, min(int(limit or SEARCH_PAGE_SIZE), SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, int(offset or 0))
+    c.execute(SEARCH_MESSAGES_SQL, {
+        'q': query, 'like': like_pattern(query), 'trigram': len(query) >= TRIGRAM_MIN_LENGTH,
+        'user_id': user_id, 'room_id': room_id, 'limit': limit + 1, 'offset': offset,
+    })
+    rows = [dict(row) for row in c.fetchall()]
+    return rows[:limit], len(rows) > limit
+
+
+def search_users(c, user_id, query, limit=SEARCH_PAGE_SIZE):
+    if len(query) < TRIGRAM_MIN_LENGTH:
+        return []
+    c.execute(SEARCH_USERS_SQL, {'q': query, 'like': like_pattern(query), 'user_id': user_id, 'limit': limit})
+    return [dict(row) for row in c.fetchall()]
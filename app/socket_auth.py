@@ -1,11 +1,15 @@
 from flask import request
 from flask_socketio import emit, join_room
-from flask_jwt_extended import decode_token
 from .extensions import socketio
 from .database import get_db
-from datetime import datetime
-import json
-from .socket_utils import connected_users, calculate_age
+from datetime import datetime, timezone
+from .socket_utils import user_room, calculate_age, socket_sessions, bind_socket_user, renew_socket_user, socket_user, \
+    emit_packed
+from .presence import presence, notifier, last_active_buffer, start_presence_loop
+from .profiles import invalidate_profile
+from .membership import block_sets
+from .read_cursors import unread_count
+from .room_summary import list_rooms, room_summary
 
 
 @socketio.on('connect')
@@ -14,142 +18,137 @@ def on_connect(auth):
     user_id = None
     if token:
         try:
-            decoded = decode_token(token)
-            user_id = decoded['sub']
+            user_id = bind_socket_user(token, compress=bool(auth.get('compress')))
         except:
             return False
 
     if not user_id: return False
 
-    if user_id not in connected_users:
-        connected_users[user_id] = set()
-    connected_users[user_id].add(request.sid)
+    start_presence_loop()
+    if presence.add(user_id, request.sid):
+        notifier.queue(user_id, 'online')
+    join_room(user_room(user_id))
 
-    socketio.emit('user_status', {'user_id': user_id, 'status': 'online'})
-
-    conn = get_db()
-    with conn.cursor() as c:
-        c.execute("UPDATE users SET last_active = %s WHERE id = %s", (datetime.now().isoformat(), user_id))
-        conn.commit()
+    last_active_buffer.put(user_id, datetime.now(timezone.utc))
 
+    with get_db() as conn, conn.cursor() as c:
         c.execute("SELECT room_id FROM participants WHERE user_id = %s", (user_id,))
         rooms = c.fetchall()
         for room in rooms:
             join_room(room['room_id'])
-    conn.close()
 
 
 @socketio.on('disconnect')
 def on_disconnect(reason=None):
-    dead_user = None
-    for uid, sids in connected_users.items():
-        if request.sid in sids:
-            sids.remove(request.sid)
-            if not sids:
-                dead_user = uid
-                del connected_users[uid]
-            break
+    socket_sessions.pop(request.sid, None)
+    dead_user = presence.remove(request.sid)
 
     if dead_user:
-        last_seen = datetime.now().isoformat()
-        conn = get_db()
-        try:
-            with conn.cursor() as c:
-                c.execute("UPDATE users SET last_active = %s WHERE id = %s", (last_seen, dead_user))
-                conn.commit()
+        last_seen = datetime.now(timezone.utc)
+        notifier.queue(dead_user, 'offline', last_seen)
+        last_active_buffer.put(dead_user, last_seen)
 
-                c.execute("SELECT gender FROM users WHERE id = %s", (dead_user,))
-                user = c.fetchone()
-                gender = user['gender'] if user else 'male'
-                socketio.emit('user_status',
-                              {'user_id': dead_user, 'status': 'offline', 'last_active': last_seen, 'gender': gender})
-        except Exception:
-            pass
-        finally:
-            conn.close()
 
-
-@socketio.on('get_data')
-def get_data(data):
-    try:
-        token = data.get('token')
-        decoded = decode_token(token)
-        user_id = decoded['sub']
-    except:
+@socketio.on('refresh_token')
+def refresh_socket_token(data):
+    auth = renew_socket_user(data.get('token') if data else None)
+    if not auth:
+        emit('token_expired')
         return
+    emit('token_refreshed', {'exp': auth['exp']})
+
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT blocked_id FROM blocked_users WHERE blocker_id = %s", (user_id,))
-            blocked_by_me = [r['blocked_id'] for r in c.fetchall()]
+def current_sync_version(c):
+    # Oldest transaction still running: rows stamped below it are final, rows
+    # at or above it are sent again next time and merged by id on the client.
+    c.execute("SELECT sync_watermark() AS version")
+    return c.fetchone()['version']
 
-            c.execute("SELECT blocker_id FROM blocked_users WHERE blocked_id = %s", (user_id,))
-            blockers = [r['blocker_id'] for r in c.fetchall()]
 
-            all_invisible = set(blocked_by_me + blockers)
+@socketio.on('get_data')
+def get_data(data):
+    user_id = socket_user(data)
+    if not user_id:
+        return
 
-            c.execute('''SELECT r.id, r.name, r.type, r.avatar, r.created_by, r.deleted_for
-                         FROM rooms r
-                                  JOIN participants p ON r.id = p.room_id
-                         WHERE p.user_id = %s''', (user_id,))
-            my_rooms = []
+    since = data.get('since_xid')
+    since = int(since) if since is not None else None
+
+    with get_db() as conn, conn.cursor() as c:
+        version = current_sync_version(c)
+        if since is not None and since > version:
+            since = None
+        full = since is None
+        since_version = since if since is not None else -1
+
+        blocked_by_me, blockers = block_sets(c, user_id)
+        all_invisible = set(blocked_by_me | blockers)
+        online_users = presence.online_users()
+
+        room_ids = []
+        changed_room_ids = []
+        unread = {}
+        summaries = {}
+        for row in list_rooms(c, user_id):
+            room_ids.append(row['id'])
+            unread[row['id']] = unread_count(user_id, row['id'], row['message_seq'], row['read_seq'])
+            summaries[row['id']] = room_summary(row, all_invisible)
+            if row['version'] >= since_version:
+                changed_room_ids.append(row['id'])
+
+        my_rooms = []
+        if changed_room_ids:
+            c.execute('''SELECT u.id, u.name, u.avatar, p.role, p.room_id
+                         FROM users u
+                                  JOIN participants p ON u.id = p.user_id
+                         WHERE p.room_id = ANY(%s)''', (changed_room_ids,))
+            participants = {room_id: [] for room_id in changed_room_ids}
             for row in c.fetchall():
-                deleted_for = json.loads(row['deleted_for']) if row['deleted_for'] else []
-                if user_id in deleted_for:
-                    continue
+                u = dict(row)
+                participants[u.pop('room_id')].append(u)
 
+            c.execute('''SELECT id, name, type, avatar, created_by
+                         FROM rooms
+                         WHERE id = ANY(%s)''', (changed_room_ids,))
+            for row in c.fetchall():
                 r_dict = dict(row)
-                del r_dict['deleted_for']
+                r_dict['participants'] = participants[r_dict['id']]
 
                 if r_dict['type'] == 'private':
-                    c.execute('''SELECT u.id, u.name, u.avatar
-                                 FROM users u
-                                          JOIN participants p ON u.id = p.user_id
-                                 WHERE p.room_id = %s
-                                   AND u.id != %s''', (r_dict['id'], user_id))
-                    other_user = c.fetchone()
+                    other_user = next((u for u in r_dict['participants'] if u['id'] != user_id), None)
                     if other_user:
-                        if other_user['id'] in all_invisible:
-                            r_dict['name'] = other_user['name']
-                            r_dict['avatar'] = None
-                        else:
-                            r_dict['name'] = other_user['name']
-                            r_dict['avatar'] = other_user['avatar']
-
-                c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                             FROM users u
-                                      JOIN participants p ON u.id = p.user_id
-                             WHERE p.room_id = %s''', (r_dict['id'],))
-                r_dict['participants'] = [dict(u) for u in c.fetchall()]
-                my_rooms.append(r_dict)
+                        r_dict['name'] = other_user['name']
+                        r_dict['avatar'] = None if other_user['id'] in all_invisible else other_user['avatar']
 
-            c.execute(
-                "SELECT id, name, real_name, avatar, last_active, bio, avatars_gallery, gender, birth_date FROM users WHERE id != %s",
-                (user_id,))
-            all_users = []
-            for row in c.fetchall():
-                u = dict(row)
+                my_rooms.append(r_dict)
 
-                if u['id'] in all_invisible:
-                    u['bio'] = ''
-                    u['real_name'] = ''
-                    u['birth_date'] = ''
-                    u['age'] = None
-                    u['avatars_gallery'] = []
-                    u['avatar'] = None
-                    u['is_online'] = False
-                    u['last_active'] = None
-                else:
-                    u['is_online'] = u['id'] in connected_users
-                    u['age'] = calculate_age(u['birth_date'])
-                    u['avatars_gallery'] = json.loads(u['avatars_gallery']) if u['avatars_gallery'] else []
-
-                all_users.append(u)
-
-            c.execute("SELECT bio, avatars_gallery, avatar, real_name, birth_date, gender FROM users WHERE id = %s",
-                      (user_id,))
-            me = c.fetchone()
+        c.execute(
+            "SELECT id, name, real_name, avatar, last_active, bio, avatars_gallery, gender, birth_date FROM users WHERE id != %s AND version >= %s",
+            (user_id, since_version))
+        all_users = []
+        for row in c.fetchall():
+            u = dict(row)
+
+            if u['id'] in all_invisible:
+                u['bio'] = ''
+                u['real_name'] = ''
+                u['birth_date'] = ''
+                u['age'] = None
+                u['avatars_gallery'] = []
+                u['avatar'] = None
+                u['is_online'] = False
+                u['last_active'] = None
+            else:
+                u['is_online'] = u['id'] in online_users
+                u['age'] = calculate_age(u['birth_date'])
+
+            all_users.append(u)
+
+        c.execute("SELECT bio, avatars_gallery, avatar, real_name, birth_date, gender, version FROM users WHERE id = %s",
+                  (user_id,))
+        me = c.fetchone()
+        my_profile = None
+        if me['version'] >= since_version:
             my_profile = {
                 'id': user_id,
                 'bio': me['bio'],
@@ -158,21 +157,21 @@ def get_data(data):
                 'age': calculate_age(me['birth_date']),
                 'gender': me['gender'],
                 'avatar': me['avatar'],
-                'avatars_gallery': json.loads(me['avatars_gallery']) if me['avatars_gallery'] else [],
-                'blocked_users': blocked_by_me
+                'avatars_gallery': me['avatars_gallery'],
+                'blocked_users': list(blocked_by_me)
             }
 
-            emit('data_update', {'rooms': my_rooms, 'users': all_users, 'my_profile': my_profile})
-    finally:
-        conn.close()
+        online = [uid for uid in online_users if uid != user_id and uid not in all_invisible]
+
+        emit_packed('data_update', {'version': version, 'full': full, 'rooms': my_rooms, 'room_ids': room_ids,
+                                    'unread': unread, 'summaries': summaries, 'users': all_users,
+                                    'online': online, 'my_profile': my_profile})
 
 
 @socketio.on('update_profile')
 def update_profile(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     real_name = data.get('real_name')
@@ -180,22 +179,18 @@ def update_profile(data):
     gender = data.get('gender')
     bio = data.get('bio')
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("UPDATE users SET real_name = %s, birth_date = %s, gender = %s, bio = %s WHERE id = %s",
-                      (real_name, birth_date, gender, bio, user_id))
-            conn.commit()
-
-            c.execute(
-                "SELECT id, name, real_name, avatar, last_active, bio, avatars_gallery, gender, birth_date FROM users WHERE id = %s",
-                (user_id,))
-            user = dict(c.fetchone())
-            user['age'] = calculate_age(user['birth_date'])
-            user['avatars_gallery'] = json.loads(user['avatars_gallery']) if user['avatars_gallery'] else []
-            user['is_online'] = True
-
-            emit('profile_updated', {'user_id': user_id, 'user_data': user}, broadcast=True)
-            emit('my_profile_saved', {'status': 'ok'})
-    finally:
-        conn.close()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("UPDATE users SET real_name = %s, birth_date = %s, gender = %s, bio = %s WHERE id = %s",
+                  (real_name, birth_date, gender, bio, user_id))
+        conn.commit()
+        invalidate_profile(user_id)
+
+        c.execute(
+            "SELECT id, name, real_name, avatar, last_active, bio, avatars_gallery, gender, birth_date FROM users WHERE id = %s",
+            (user_id,))
+        user = dict(c.fetchone())
+        user['age'] = calculate_age(user['birth_date'])
+        user['is_online'] = True
+
+        emit('profile_updated', {'user_id': user_id, 'user_data': user}, broadcast=True)
+        emit('my_profile_saved', {'status': 'ok'})
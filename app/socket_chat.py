@@ -1,142 +1,212 @@
 from flask import request
 from flask_socketio import emit, join_room
-from flask_jwt_extended import decode_token
 from .extensions import socketio
 from .database import get_db
-from datetime import datetime
+from datetime import datetime, timezone
 import secrets
-import json
-from .socket_utils import connected_users
+from .socket_utils import user_room, socket_user, emit_packed
+from .blobstore import store_bytes, store_data_url
+from .profiles import get_profile
+from .messages import send_message, message_event, message_log_details
+from .audit import log_group_action
+from .read_cursors import mark_read
+from .membership import block_sets, get_invisible_users, invalidate_room, is_blocked_in_room, is_member
 
 
 @socketio.on('start_private_chat')
 def start_private_chat(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     target_id = data['target_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute('''SELECT r.id, r.deleted_for
-                         FROM rooms r
-                                  JOIN participants p1 ON r.id = p1.room_id
-                                  JOIN participants p2 ON r.id = p2.room_id
-                         WHERE r.type = 'private'
-                           AND p1.user_id = %s
-                           AND p2.user_id = %s''', (user_id, target_id))
-            existing = c.fetchone()
-
-            if existing:
-                room_id = existing['id']
-                deleted_for = json.loads(existing['deleted_for']) if existing['deleted_for'] else []
-                if user_id in deleted_for:
-                    deleted_for.remove(user_id)
-                    c.execute("UPDATE rooms SET deleted_for = %s WHERE id = %s", (json.dumps(deleted_for), room_id))
-                    conn.commit()
-            else:
-                room_id = secrets.token_hex(8)
-                c.execute("INSERT INTO rooms (id, type, created_by, created_at) VALUES (%s, %s, %s, %s)",
-                          (room_id, 'private', user_id, datetime.now().isoformat()))
-                c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
-                          (room_id, user_id, 'member', datetime.now().isoformat()))
-                c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
-                          (room_id, target_id, 'member', datetime.now().isoformat()))
+    with get_db() as conn, conn.cursor() as c:
+        c.execute('''SELECT r.id
+                     FROM rooms r
+                              JOIN participants p1 ON r.id = p1.room_id
+                              JOIN participants p2 ON r.id = p2.room_id
+                     WHERE r.type = 'private'
+                       AND p1.user_id = %s
+                       AND p2.user_id = %s''', (user_id, target_id))
+        existing = c.fetchone()
+
+        if existing:
+            room_id = existing['id']
+            c.execute("UPDATE room_visibility SET hidden = FALSE WHERE user_id = %s AND room_id = %s AND hidden",
+                      (user_id, room_id))
+            if c.rowcount > 0:
                 conn.commit()
+        else:
+            room_id = secrets.token_hex(8)
+            c.execute("INSERT INTO rooms (id, type, created_by, created_at) VALUES (%s, %s, %s, %s)",
+                      (room_id, 'private', user_id, datetime.now(timezone.utc)))
+            c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                      (room_id, user_id, 'member', datetime.now(timezone.utc)))
+            c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                      (room_id, target_id, 'member', datetime.now(timezone.utc)))
+            conn.commit()
+            invalidate_room(room_id)
+
+        join_room(room_id)
+        socketio.emit('force_join_room', {'room_id': room_id}, to=user_room(target_id))
+
+        emit('private_chat_ready', {'room_id': room_id})
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+
+def load_reactions(c, message_ids):
+    message_ids = [int(msg_id) for msg_id in message_ids]
+    reactions = {msg_id: {} for msg_id in message_ids}
+    if not message_ids:
+        return reactions
+
+    c.execute('''SELECT r.message_id, r.user_id, r.reaction, u.name, u.avatar
+                 FROM message_reactions r
+                          JOIN users u ON r.user_id = u.id
+                 WHERE r.message_id = ANY(%s)''', (message_ids,))
+    for r in c.fetchall():
+        reactions[r['message_id']][r['user_id']] = {'reaction': r['reaction'], 'name': r['name'],
+                                                    'avatar': r['avatar']}
+    return reactions
+
+
+def fetch_history_page(c, room_id, user_id, all_invisible, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    limit = max(1, min(int(limit or HISTORY_PAGE_SIZE), HISTORY_MAX_PAGE_SIZE))
+
+    conditions = [
+        "m.room_id = %s",
+        "m.id > COALESCE((SELECT cleared_through_id FROM room_visibility WHERE user_id = %s AND room_id = %s), 0)",
+        "NOT EXISTS (SELECT 1 FROM message_visibility v WHERE v.user_id = %s AND v.message_id = m.id)",
+    ]
+    params = [room_id, user_id, room_id, user_id]
+    if before is not None:
+        conditions.append("m.id < %s")
+        params.append(int(before))
+    if after is not None:
+        conditions.append("m.id > %s")
+        params.append(int(after))
+    order = 'ASC' if after is not None and before is None else 'DESC'
+    params.append(limit + 1)
+
+    c.execute(f'''SELECT m.id, m.room_id, m.sender_id, m.seq, m.type, m.content, m.filename, m.created_at, m.edited_at,
+                         u.name as sender_name, u.avatar as sender_avatar
+                  FROM messages m
+                           JOIN users u ON m.sender_id = u.id
+                  WHERE {' AND '.join(conditions)}
+                  ORDER BY m.id {order}
+                  LIMIT %s''', tuple(params))
+    rows = c.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == 'DESC':
+        rows.reverse()
+
+    reactions = load_reactions(c, [row['id'] for row in rows])
+
+    messages = []
+    for row in rows:
+        msg_dict = dict(row)
 
-            join_room(room_id)
-            if target_id in connected_users:
-                for sid in connected_users[target_id]:
-                    socketio.emit('force_join_room', {'room_id': room_id}, room=sid)
+        if msg_dict['sender_id'] in all_invisible:
+            msg_dict['sender_avatar'] = None
 
-            emit('private_chat_ready', {'room_id': room_id})
-    finally:
-        conn.close()
+        msg_dict['reactions'] = reactions[msg_dict['id']]
+        messages.append(msg_dict)
+
+    return messages, has_more
 
 
 @socketio.on('join_chat')
 def join_chat(data):
-    room_id = data['room_id']
-    join_room(room_id)
-    conn = get_db()
-
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
-        conn.close()
+    user_id = socket_user(data)
+    if not user_id:
         return
 
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT blocked_id FROM blocked_users WHERE blocker_id = %s", (user_id,))
-            blocked_by_me = [r['blocked_id'] for r in c.fetchall()]
-            c.execute("SELECT blocker_id FROM blocked_users WHERE blocked_id = %s", (user_id,))
-            blockers = [r['blocker_id'] for r in c.fetchall()]
-            all_invisible = set(blocked_by_me + blockers)
-
-            c.execute('''SELECT m.*, u.name as sender_name, u.avatar as sender_avatar
-                         FROM messages m
-                                  JOIN users u ON m.sender_id = u.id
-                         WHERE m.room_id = %s
-                         ORDER BY m.created_at''', (room_id,))
-
-            raw_messages = c.fetchall()
-            messages = []
-
-            for row in raw_messages:
-                deleted_for = json.loads(row['deleted_for']) if row['deleted_for'] else []
-                if user_id not in deleted_for:
-                    msg_dict = dict(row)
-
-                    if msg_dict['sender_id'] in all_invisible:
-                        msg_dict['sender_avatar'] = None
-
-                    c.execute('''SELECT r.user_id, r.reaction, u.name, u.avatar
-                                 FROM message_reactions r
-                                          JOIN users u ON r.user_id = u.id
-                                 WHERE message_id = %s''', (msg_dict['id'],))
-                    reactions_rows = c.fetchall()
-                    reactions_map = {}
-                    for r in reactions_rows:
-                        reactions_map[r['user_id']] = {'reaction': r['reaction'], 'name': r['name'],
-                                                       'avatar': r['avatar']}
-
-                    msg_dict['reactions'] = reactions_map
-                    messages.append(msg_dict)
-
-            c.execute("SELECT * FROM rooms WHERE id = %s", (room_id,))
-            room_info = c.fetchone()
-
-            if room_info and room_info['type'] == 'group':
-                c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                             FROM users u
-                                      JOIN participants p ON u.id = p.user_id
-                             WHERE p.room_id = %s''', (room_id,))
-                participants = [dict(u) for u in c.fetchall()]
-
-                for p in participants:
-                    if p['id'] in all_invisible:
-                        p['avatar'] = None
-
-                emit('group_details',
-                     {'room_id': room_id, 'created_by': room_info['created_by'], 'participants': participants})
-
-            emit('chat_history', {'room_id': room_id, 'messages': messages})
-    finally:
-        conn.close()
+    room_id = data.get('room_id')
+    with get_db() as conn, conn.cursor() as c:
+        if not is_member(c, room_id, user_id):
+            return
+        join_room(room_id)
+
+        all_invisible = get_invisible_users(c, user_id)
+        messages, has_more = fetch_history_page(c, room_id, user_id, all_invisible, limit=data.get('limit'))
+
+        c.execute("SELECT * FROM rooms WHERE id = %s", (room_id,))
+        room_info = c.fetchone()
+
+        if room_info and room_info['type'] == 'group':
+            c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                         FROM users u
+                                  JOIN participants p ON u.id = p.user_id
+                         WHERE p.room_id = %s''', (room_id,))
+            participants = [dict(u) for u in c.fetchall()]
+
+            for p in participants:
+                if p['id'] in all_invisible:
+                    p['avatar'] = None
+
+            emit('group_details',
+                 {'room_id': room_id, 'created_by': room_info['created_by'], 'participants': participants})
+
+        c.execute("SELECT user_id, read_seq AS seq FROM read_cursors WHERE room_id = %s AND user_id != %s",
+                  (room_id, user_id))
+        read_cursors = [dict(row) for row in c.fetchall()]
+
+        emit_packed('chat_history', {'room_id': room_id, 'messages': messages, 'has_more': has_more,
+                                     'read_cursors': read_cursors})
+
+
+@socketio.on('load_history')
+def load_history(data):
+    user_id = socket_user(data)
+    if not user_id:
+        return
+
+    room_id = data.get('room_id')
+    before = data.get('before')
+    after = data.get('after')
+    if not room_id or (before is None and after is None):
+        return
+
+    with get_db() as conn, conn.cursor() as c:
+        if not is_member(c, room_id, user_id):
+            return
+
+        all_invisible = get_invisible_users(c, user_id)
+        messages, has_more = fetch_history_page(c, room_id, user_id, all_invisible,
+                                                before=before, after=after, limit=data.get('limit'))
+
+        emit_packed('chat_history_page', {'room_id': room_id, 'messages': messages, 'has_more': has_more,
+                                          'before': before, 'after': after})
+
+
+@socketio.on('mark_read')
+def handle_mark_read(data):
+    user_id = socket_user(data)
+    if not user_id:
+        return
+
+    room_id = data.get('room_id')
+    seq = data.get('seq')
+    if not room_id or seq is None:
+        return
+
+    with get_db() as conn, conn.cursor() as c:
+        if not is_member(c, room_id, user_id):
+            return
+
+    mark_read(user_id, room_id, seq)
+    emit('read_updated', {'room_id': room_id, 'seq': int(seq)}, to=user_room(user_id))
 
 
 @socketio.on('send_message')
 def handle_message(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data.get('room_id')
@@ -146,207 +216,154 @@ def handle_message(data):
     if not room_id:
         emit('message_error', {'error': 'Чат не обрано'})
         return
+    # With the MessagePack serializer content can arrive as any msgpack type;
+    # only text and (for voice/video) raw bytes are messages.
+    if not isinstance(content, (str, bytes)) or not isinstance(msg_type, str):
+        emit('message_error', {'error': 'Unsupported message content'})
+        return
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute(
-                "SELECT 1 FROM blocked_users WHERE blocker_id IN (SELECT user_id FROM participants WHERE room_id = %s AND user_id != %s) AND blocked_id = %s",
-                (room_id, user_id, user_id))
-            if c.fetchone():
-                emit('message_error', {'error': 'User has blocked you'})
-                return
-
-            c.execute(
-                "INSERT INTO messages (room_id, sender_id, type, content, created_at) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                (room_id, user_id, msg_type, content, datetime.now().isoformat()))
-            msg_id = c.fetchone()['id']
-
-            c.execute("SELECT name, avatar FROM users WHERE id = %s", (user_id,))
-            user = c.fetchone()
-
-            c.execute("SELECT type, deleted_for FROM rooms WHERE id = %s", (room_id,))
-            room = c.fetchone()
-            if room:
-                deleted_for = json.loads(room['deleted_for']) if room['deleted_for'] else []
-                if deleted_for:
-                    c.execute("UPDATE rooms SET deleted_for = NULL WHERE id = %s", (room_id,))
-
-                if room['type'] == 'group':
-                    details = 'Надіслав повідомлення'
-                    if msg_type == 'voice':
-                        details = 'Надіслав голосове'
-                    elif msg_type == 'video':
-                        details = 'Надіслав відеоповідомлення'
-                    c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                              (room_id, 'message', f"{user['name']}: {details}", datetime.now().isoformat()))
-
-            conn.commit()
+    # Autocommit: the send is a single statement, so skip the BEGIN/COMMIT round trips.
+    with get_db(autocommit=True) as conn, conn.cursor() as c:
+        if is_blocked_in_room(c, room_id, user_id):
+            emit('message_error', {'error': 'User has blocked you'})
+            return
 
-            emit('new_message', {
-                'id': msg_id, 'room_id': room_id, 'sender_id': user_id,
-                'sender_name': user['name'], 'sender_avatar': user['avatar'],
-                'type': msg_type, 'content': content, 'created_at': datetime.now().isoformat(), 'reactions': {}
-            }, to=room_id)
-    finally:
-        conn.close()
+        if isinstance(content, bytes):
+            if msg_type not in ('voice', 'video'):
+                emit('message_error', {'error': 'Unsupported message content'})
+                return
+            mime_type = data.get('mime')
+            if not isinstance(mime_type, str) or not mime_type.startswith(('audio/', 'video/')):
+                mime_type = 'application/octet-stream'
+            content = store_bytes(c, content, mime_type)
+        elif msg_type in ('voice', 'video') and content.startswith('data:'):
+            content = store_data_url(c, content)
+
+        user = get_profile(c, user_id)
+        inserted = send_message(c, room_id, user_id, msg_type, content)
+        if not inserted:
+            emit('message_error', {'error': 'User has blocked you'})
+            return
+        msg_id = inserted['id']
+        mark_read(user_id, room_id, inserted['seq'])
+        if inserted['room_type'] == 'group':
+            log_group_action(room_id, 'message', message_log_details(user['name'], msg_type))
+
+        emit('new_message', message_event(msg_id, room_id, user_id, inserted['seq'], msg_type, content,
+                                          inserted['created_at']), to=room_id)
 
 
 @socketio.on('add_reaction')
 def add_reaction(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     msg_id = data['id']
     reaction = data['reaction']
     room_id = data['room_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT sender_id FROM messages WHERE id = %s", (msg_id,))
-            msg = c.fetchone()
-            if not msg:
-                return
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT sender_id FROM messages WHERE id = %s", (msg_id,))
+        msg = c.fetchone()
+        if not msg:
+            return
 
-            sender_id = msg['sender_id']
-            c.execute("SELECT 1 FROM blocked_users WHERE blocker_id = %s AND blocked_id = %s", (sender_id, user_id))
-            if c.fetchone():
-                return
+        sender_id = msg['sender_id']
+        if sender_id in block_sets(c, user_id)[1]:
+            return
 
-            c.execute(
-                """INSERT INTO message_reactions (message_id, user_id, reaction, created_at)
-                   VALUES (%s, %s, %s, %s) ON CONFLICT (message_id, user_id) 
-                   DO
-                UPDATE SET reaction = EXCLUDED.reaction, created_at = EXCLUDED.created_at""",
-                (msg_id, user_id, reaction, datetime.now().isoformat()))
-            conn.commit()
+        c.execute(
+            """INSERT INTO message_reactions (message_id, user_id, reaction, created_at)
+               VALUES (%s, %s, %s, %s) ON CONFLICT (message_id, user_id) 
+               DO
+            UPDATE SET reaction = EXCLUDED.reaction, created_at = EXCLUDED.created_at""",
+            (msg_id, user_id, reaction, datetime.now(timezone.utc)))
+        conn.commit()
 
-            c.execute(
-                "SELECT r.user_id, r.reaction, u.name, u.avatar FROM message_reactions r JOIN users u ON r.user_id = u.id WHERE message_id = %s",
-                (msg_id,))
-            rows = c.fetchall()
-            reactions_map = {}
-            for r in rows:
-                reactions_map[r['user_id']] = {'reaction': r['reaction'], 'name': r['name'], 'avatar': r['avatar']}
+        reactions_map = load_reactions(c, [msg_id])[int(msg_id)]
 
-            c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-            user = c.fetchone()
+        user = get_profile(c, user_id)
 
-            emit('reaction_added', {'id': msg_id, 'room_id': room_id, 'reactions': reactions_map}, to=room_id)
+        emit('reaction_added', {'id': msg_id, 'room_id': room_id, 'reactions': reactions_map}, to=room_id)
 
-            if sender_id != user_id and sender_id in connected_users:
-                for sid in connected_users[sender_id]:
-                    emit('notification',
-                         {'title': user['name'], 'body': f'Відреагував {reaction} на ваше повідомлення'},
-                         room=sid)
-    finally:
-        conn.close()
+        if sender_id != user_id:
+            emit('notification',
+                 {'title': user['name'], 'body': f'Відреагував {reaction} на ваше повідомлення'},
+                 to=user_room(sender_id))
 
 
 @socketio.on('remove_reaction')
 def remove_reaction(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     msg_id = data['id']
     room_id = data['room_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT sender_id FROM messages WHERE id = %s", (msg_id,))
-            msg = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT sender_id FROM messages WHERE id = %s", (msg_id,))
+        msg = c.fetchone()
 
-            c.execute("DELETE FROM message_reactions WHERE message_id = %s AND user_id = %s", (msg_id, user_id))
-            conn.commit()
+        c.execute("DELETE FROM message_reactions WHERE message_id = %s AND user_id = %s", (msg_id, user_id))
+        conn.commit()
 
-            c.execute(
-                "SELECT r.user_id, r.reaction, u.name, u.avatar FROM message_reactions r JOIN users u ON r.user_id = u.id WHERE message_id = %s",
-                (msg_id,))
-            rows = c.fetchall()
-            reactions_map = {}
-            for r in rows:
-                reactions_map[r['user_id']] = {'reaction': r['reaction'], 'name': r['name'], 'avatar': r['avatar']}
+        reactions_map = load_reactions(c, [msg_id])[int(msg_id)]
 
-            c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-            user = c.fetchone()
+        user = get_profile(c, user_id)
 
-            emit('reaction_added', {'id': msg_id, 'room_id': room_id, 'reactions': reactions_map}, to=room_id)
+        emit('reaction_added', {'id': msg_id, 'room_id': room_id, 'reactions': reactions_map}, to=room_id)
 
-            if msg and msg['sender_id'] != user_id and msg['sender_id'] in connected_users:
-                for sid in connected_users[msg['sender_id']]:
-                    emit('notification', {'title': user['name'], 'body': f'Прибрав реакцію з вашого повідомлення'},
-                         room=sid)
-    finally:
-        conn.close()
+        if msg and msg['sender_id'] != user_id:
+            emit('notification', {'title': user['name'], 'body': f'Прибрав реакцію з вашого повідомлення'},
+                 to=user_room(msg['sender_id']))
 
 
 @socketio.on('edit_message')
 def edit_message(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     msg_id = data['id']
     new_content = data['content']
     room_id = data['room_id']
-    edited_at = datetime.now().isoformat()
+    edited_at = datetime.now(timezone.utc)
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("UPDATE messages SET content = %s, edited_at = %s WHERE id = %s AND sender_id = %s",
-                      (new_content, edited_at, msg_id, user_id))
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("UPDATE messages SET content = %s, edited_at = %s WHERE id = %s AND sender_id = %s",
+                  (new_content, edited_at, msg_id, user_id))
 
-            if c.rowcount > 0:
-                conn.commit()
-                emit('message_edited',
-                     {'id': msg_id, 'content': new_content, 'room_id': room_id, 'edited_at': edited_at},
-                     to=room_id)
-    finally:
-        conn.close()
+        if c.rowcount > 0:
+            conn.commit()
+            emit('message_edited',
+                 {'id': msg_id, 'content': new_content, 'room_id': room_id, 'edited_at': edited_at},
+                 to=room_id)
 
 
 @socketio.on('delete_message')
 def delete_message(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     msg_id = data['id']
     room_id = data['room_id']
     for_everyone = data.get('for_everyone', False)
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            if for_everyone:
-                c.execute("DELETE FROM messages WHERE id = %s AND sender_id = %s", (msg_id, user_id))
-                if c.rowcount > 0:
-                    c.execute("DELETE FROM message_reactions WHERE message_id = %s", (msg_id,))
-                    conn.commit()
-                    emit('message_deleted', {'id': msg_id, 'room_id': room_id}, to=room_id)
-            else:
-                c.execute("SELECT deleted_for FROM messages WHERE id = %s", (msg_id,))
-                row = c.fetchone()
-                if row:
-                    deleted_for = json.loads(row['deleted_for']) if row['deleted_for'] else []
-                    if user_id not in deleted_for:
-                        deleted_for.append(user_id)
-                        c.execute("UPDATE messages SET deleted_for = %s WHERE id = %s",
-                                  (json.dumps(deleted_for), msg_id))
-                        conn.commit()
-                        emit('message_hidden', {'id': msg_id, 'room_id': room_id}, room=request.sid)
-    finally:
-        conn.close()
+    with get_db() as conn, conn.cursor() as c:
+        if for_everyone:
+            c.execute("DELETE FROM messages WHERE id = %s AND sender_id = %s", (msg_id, user_id))
+            if c.rowcount > 0:
+                c.execute("DELETE FROM message_reactions WHERE message_id = %s", (msg_id,))
+                c.execute("DELETE FROM message_visibility WHERE message_id = %s", (msg_id,))
+                conn.commit()
+                emit('message_deleted', {'id': msg_id, 'room_id': room_id}, to=room_id)
+        else:
+            c.execute('''INSERT INTO message_visibility (user_id, message_id)
+                         SELECT %s, id FROM messages WHERE id = %s
+                         ON CONFLICT DO NOTHING''', (user_id, msg_id))
+            if c.rowcount > 0:
+                conn.commit()
+                emit('message_hidden', {'id': msg_id, 'room_id': room_id}, room=request.sid)
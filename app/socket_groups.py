@@ -1,20 +1,21 @@
 from flask import request
 from flask_socketio import emit, join_room, leave_room
-from flask_jwt_extended import decode_token
 from .extensions import socketio
 from .database import get_db
-from datetime import datetime
+from datetime import datetime, timezone
 import secrets
-import json
-from .socket_utils import connected_users
+from .socket_utils import user_room, socket_user
+from .presence import presence
+from .profiles import get_profile
+from .membership import invalidate_room
+from .audit import log_group_action
+from .uploads import delete_room_uploads, remove_parts
 
 
 @socketio.on('create_group')
 def create_group(data):
-    try:
-        token = data.get('token')
-        creator = decode_token(token)['sub']
-    except:
+    creator = socket_user(data)
+    if not creator:
         return
 
     name = data['name']
@@ -22,324 +23,270 @@ def create_group(data):
     new_room_id = secrets.token_hex(4)
     members.append(creator)
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("INSERT INTO rooms (id, type, name, created_by, created_at) VALUES (%s, %s, %s, %s, %s)",
-                      (new_room_id, 'group', name, creator, datetime.now().isoformat()))
-            c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                      (new_room_id, 'create', f'Група створена', datetime.now().isoformat()))
-
-            for member in members:
-                role = 'owner' if member == creator else 'member'
-                c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
-                          (new_room_id, member, role, datetime.now().isoformat()))
-                if member in connected_users:
-                    for sid in connected_users[member]:
-                        socketio.emit('force_join_room', {'room_id': new_room_id}, room=sid)
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("INSERT INTO rooms (id, type, name, created_by, created_at) VALUES (%s, %s, %s, %s, %s)",
+                  (new_room_id, 'group', name, creator, datetime.now(timezone.utc)))
 
-            conn.commit()
-            join_room(new_room_id)
-            emit('group_created', {'id': new_room_id}, broadcast=True)
-    finally:
-        conn.close()
+        for member in members:
+            role = 'owner' if member == creator else 'member'
+            c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                      (new_room_id, member, role, datetime.now(timezone.utc)))
+            socketio.emit('force_join_room', {'room_id': new_room_id}, to=user_room(member))
+
+        conn.commit()
+        invalidate_room(new_room_id)
+        log_group_action(new_room_id, 'create', 'Група створена')
+        join_room(new_room_id)
+        emit('group_created', {'id': new_room_id}, broadcast=True)
 
 
 @socketio.on('update_group_settings')
 def update_group_settings(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
     name = data.get('name')
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            p = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        p = c.fetchone()
 
-            if not p or p['role'] not in ('owner', 'admin'):
-                return
+        if not p or p['role'] not in ('owner', 'admin'):
+            return
 
-            c.execute("UPDATE rooms SET name = %s WHERE id = %s", (name, room_id))
+        c.execute("UPDATE rooms SET name = %s WHERE id = %s", (name, room_id))
 
-            if c.rowcount > 0:
-                c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                          (room_id, 'update', f'Назву змінено на {name}', datetime.now().isoformat()))
-                conn.commit()
-                emit('group_update', {'room_id': room_id, 'name': name}, to=room_id)
-    finally:
-        conn.close()
+        if c.rowcount > 0:
+            conn.commit()
+            log_group_action(room_id, 'update', f'Назву змінено на {name}')
+            emit('group_update', {'room_id': room_id, 'name': name}, to=room_id)
 
 
 @socketio.on('add_group_participant')
 def add_group_participant(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
     target_id = data['target_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            p = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        p = c.fetchone()
 
-            if not p or p['role'] not in ('owner', 'admin'):
-                return
+        if not p or p['role'] not in ('owner', 'admin'):
+            return
 
-            try:
-                c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
-                          (room_id, target_id, 'member', datetime.now().isoformat()))
+        try:
+            c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                      (room_id, target_id, 'member', datetime.now(timezone.utc)))
 
-                c.execute("SELECT name FROM users WHERE id = %s", (target_id,))
-                target_name = c.fetchone()['name']
+            target_name = get_profile(c, target_id)['name']
 
-                c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-                requester_name = c.fetchone()['name']
+            requester_name = get_profile(c, user_id)['name']
 
-                c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                          (room_id, 'add', f'{requester_name} додав {target_name}', datetime.now().isoformat()))
-                conn.commit()
+            conn.commit()
+            invalidate_room(room_id)
+            log_group_action(room_id, 'add', f'{requester_name} додав {target_name}')
 
-                if target_id in connected_users:
-                    for sid in connected_users[target_id]:
-                        socketio.emit('force_join_room', {'room_id': room_id}, room=sid)
+            socketio.emit('force_join_room', {'room_id': room_id}, to=user_room(target_id))
 
-                c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                             FROM users u
-                                      JOIN participants p ON u.id = p.user_id
-                             WHERE p.room_id = %s''', (room_id,))
-                participants = [dict(u) for u in c.fetchall()]
+            c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                         FROM users u
+                                  JOIN participants p ON u.id = p.user_id
+                         WHERE p.room_id = %s''', (room_id,))
+            participants = [dict(u) for u in c.fetchall()]
 
-                emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
+            emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
 
-            except:
-                pass
-    finally:
-        conn.close()
+        except:
+            pass
 
 
 @socketio.on('remove_group_participant')
 def remove_group_participant(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
     target_id = data['target_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            requester = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        requester = c.fetchone()
 
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, target_id))
-            target = c.fetchone()
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, target_id))
+        target = c.fetchone()
 
-            if not requester or requester['role'] not in ('owner', 'admin'):
-                return
+        if not requester or requester['role'] not in ('owner', 'admin'):
+            return
 
-            if target and target['role'] == 'owner':
-                return
+        if target and target['role'] == 'owner':
+            return
 
-            if target and target['role'] == 'admin' and requester['role'] != 'owner':
-                return
+        if target and target['role'] == 'admin' and requester['role'] != 'owner':
+            return
 
-            c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, target_id))
+        c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, target_id))
 
-            c.execute("SELECT name FROM users WHERE id = %s", (target_id,))
-            target_name = c.fetchone()['name']
+        target_name = get_profile(c, target_id)['name']
 
-            c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-            requester_name = c.fetchone()['name']
+        requester_name = get_profile(c, user_id)['name']
 
-            c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                      (room_id, 'remove', f'{requester_name} видалив {target_name}', datetime.now().isoformat()))
-            conn.commit()
+        conn.commit()
+        invalidate_room(room_id)
+        log_group_action(room_id, 'remove', f'{requester_name} видалив {target_name}')
 
-            if target_id in connected_users:
-                for sid in connected_users[target_id]:
-                    leave_room(room_id, sid)
-                    socketio.emit('force_leave_room', {'room_id': room_id}, room=sid)
+        for sid in presence.sids(target_id):
+            leave_room(room_id, sid)
+        socketio.emit('force_leave_room', {'room_id': room_id}, to=user_room(target_id))
 
-            c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                         FROM users u
-                                  JOIN participants p ON u.id = p.user_id
-                         WHERE p.room_id = %s''', (room_id,))
-            participants = [dict(u) for u in c.fetchall()]
+        c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                     FROM users u
+                              JOIN participants p ON u.id = p.user_id
+                     WHERE p.room_id = %s''', (room_id,))
+        participants = [dict(u) for u in c.fetchall()]
 
-            emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
-    finally:
-        conn.close()
+        emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
 
 
 @socketio.on('leave_group')
 def leave_group(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            requester = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        requester = c.fetchone()
+
+        if not requester:
+            return
 
-            if not requester:
+        if requester['role'] == 'owner':
+            c.execute("SELECT count(*) as cnt FROM participants WHERE room_id = %s", (room_id,))
+            if c.fetchone()['cnt'] > 1:
                 return
 
-            if requester['role'] == 'owner':
-                c.execute("SELECT count(*) as cnt FROM participants WHERE room_id = %s", (room_id,))
-                if c.fetchone()['cnt'] > 1:
-                    return
+        c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
 
-            c.execute("DELETE FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        user_name = get_profile(c, user_id)['name']
 
-            c.execute("SELECT name FROM users WHERE id = %s", (user_id,))
-            user_name = c.fetchone()['name']
+        conn.commit()
+        invalidate_room(room_id)
+        log_group_action(room_id, 'leave', f'{user_name} покинув групу')
 
-            c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                      (room_id, 'leave', f'{user_name} покинув групу', datetime.now().isoformat()))
-            conn.commit()
+        leave_room(room_id, request.sid)
+        socketio.emit('force_leave_room', {'room_id': room_id}, room=request.sid)
 
-            leave_room(room_id, request.sid)
-            socketio.emit('force_leave_room', {'room_id': room_id}, room=request.sid)
+        c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                     FROM users u
+                              JOIN participants p ON u.id = p.user_id
+                     WHERE p.room_id = %s''', (room_id,))
+        participants = [dict(u) for u in c.fetchall()]
 
-            c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                         FROM users u
-                                  JOIN participants p ON u.id = p.user_id
-                         WHERE p.room_id = %s''', (room_id,))
-            participants = [dict(u) for u in c.fetchall()]
-
-            emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
-    finally:
-        conn.close()
+        emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
 
 
 @socketio.on('promote_admin')
 def promote_admin(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
     target_id = data['target_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            requester = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        requester = c.fetchone()
 
-            if not requester or requester['role'] != 'owner':
-                return
+        if not requester or requester['role'] != 'owner':
+            return
 
-            c.execute("UPDATE participants SET role = 'admin' WHERE room_id = %s AND user_id = %s",
-                      (room_id, target_id))
+        c.execute("UPDATE participants SET role = 'admin' WHERE room_id = %s AND user_id = %s",
+                  (room_id, target_id))
 
-            c.execute("SELECT name FROM users WHERE id = %s", (target_id,))
-            target_name = c.fetchone()['name']
+        target_name = get_profile(c, target_id)['name']
 
-            c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                      (room_id, 'promote', f'Користувача {target_name} призначено адміном', datetime.now().isoformat()))
-            conn.commit()
+        conn.commit()
+        log_group_action(room_id, 'promote', f'Користувача {target_name} призначено адміном')
 
-            c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                         FROM users u
-                                  JOIN participants p ON u.id = p.user_id
-                         WHERE p.room_id = %s''', (room_id,))
-            participants = [dict(u) for u in c.fetchall()]
+        c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                     FROM users u
+                              JOIN participants p ON u.id = p.user_id
+                     WHERE p.room_id = %s''', (room_id,))
+        participants = [dict(u) for u in c.fetchall()]
 
-            emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
-    finally:
-        conn.close()
+        emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
 
 
 @socketio.on('demote_admin')
 def demote_admin(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
     target_id = data['target_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            requester = c.fetchone()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        requester = c.fetchone()
 
-            if not requester or requester['role'] != 'owner':
-                return
+        if not requester or requester['role'] != 'owner':
+            return
 
-            c.execute("UPDATE participants SET role = 'member' WHERE room_id = %s AND user_id = %s",
-                      (room_id, target_id))
+        c.execute("UPDATE participants SET role = 'member' WHERE room_id = %s AND user_id = %s",
+                  (room_id, target_id))
 
-            c.execute("SELECT name FROM users WHERE id = %s", (target_id,))
-            target_name = c.fetchone()['name']
+        target_name = get_profile(c, target_id)['name']
 
-            c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
-                      (room_id, 'demote', f'Адміна {target_name} розжалувано', datetime.now().isoformat()))
-            conn.commit()
+        conn.commit()
+        log_group_action(room_id, 'demote', f'Адміна {target_name} розжалувано')
 
-            c.execute('''SELECT u.id, u.name, u.avatar, p.role
-                         FROM users u
-                                  JOIN participants p ON u.id = p.user_id
-                         WHERE p.room_id = %s''', (room_id,))
-            participants = [dict(u) for u in c.fetchall()]
+        c.execute('''SELECT u.id, u.name, u.avatar, p.role
+                     FROM users u
+                              JOIN participants p ON u.id = p.user_id
+                     WHERE p.room_id = %s''', (room_id,))
+        participants = [dict(u) for u in c.fetchall()]
 
-            emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
-    finally:
-        conn.close()
+        emit('group_update', {'room_id': room_id, 'participants': participants}, to=room_id)
 
 
 @socketio.on('delete_group')
 def delete_group(data):
-    try:
-        token = data.get('token')
-        user_id = decode_token(token)['sub']
-    except:
+    user_id = socket_user(data)
+    if not user_id:
         return
 
     room_id = data['room_id']
 
-    conn = get_db()
-    try:
-        with conn.cursor() as c:
-            c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
-            p = c.fetchone()
-
-            if not p or p['role'] != 'owner':
-                return
-
-            c.execute("DELETE FROM message_reactions WHERE message_id IN (SELECT id FROM messages WHERE room_id = %s)",
-                      (room_id,))
-            c.execute("DELETE FROM messages WHERE room_id = %s", (room_id,))
-            c.execute("DELETE FROM participants WHERE room_id = %s", (room_id,))
-            c.execute("DELETE FROM group_logs WHERE room_id = %s", (room_id,))
-            c.execute("DELETE FROM rooms WHERE id = %s", (room_id,))
-            conn.commit()
-            emit('force_leave_room', {'room_id': room_id}, to=room_id)
-    finally:
-        conn.close()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT role FROM participants WHERE room_id = %s AND user_id = %s", (room_id, user_id))
+        p = c.fetchone()
+
+        if not p or p['role'] != 'owner':
+            return
+
+        c.execute("DELETE FROM message_reactions WHERE message_id IN (SELECT id FROM messages WHERE room_id = %s)",
+                  (room_id,))
+        c.execute("DELETE FROM message_visibility WHERE message_id IN (SELECT id FROM messages WHERE room_id = %s)",
+                  (room_id,))
+        c.execute("DELETE FROM messages WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM room_visibility WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM read_cursors WHERE room_id = %s", (room_id,))
+        upload_ids = delete_room_uploads(c, room_id)
+        c.execute("DELETE FROM participants WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM group_logs WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM rooms WHERE id = %s", (room_id,))
+        conn.commit()
+        remove_parts(upload_ids)
+        invalidate_room(room_id)
+        emit('force_leave_room', {'room_id': room_id}, to=room_id)
@@ -1,6 +1,65 @@
+from flask import request
+from flask_socketio import emit
+from flask_jwt_extended import decode_token
 from datetime import datetime
+from . import jsonutil
+import os
+import time
+import zlib
+
+SOCKET_COMPRESS_THRESHOLD = int(os.getenv('SOCKET_COMPRESS_THRESHOLD', 4096))
+SOCKET_COMPRESS_LEVEL = int(os.getenv('SOCKET_COMPRESS_LEVEL', 6))
+
+socket_sessions = {}
+
+
+def user_room(user_id):
+    return f'user:{user_id}'
+
+
+def bind_socket_user(token, compress=False):
+    claims = decode_token(token)
+    socket_sessions[request.sid] = {'user_id': claims['sub'], 'exp': claims['exp'], 'compress': compress}
+    return claims['sub']
+
+
+def renew_socket_user(token):
+    auth = socket_sessions.get(request.sid)
+    try:
+        claims = decode_token(token)
+    except:
+        return None
+    if not auth or claims['sub'] != auth['user_id']:
+        return None
+    auth['exp'] = claims['exp']
+    return auth
+
+
+def socket_user(data=None):
+    auth = socket_sessions.get(request.sid)
+    if not auth:
+        return None
+    if auth['exp'] > time.time():
+        return auth['user_id']
+
+    token = data.get('token') if isinstance(data, dict) else None
+    if token and renew_socket_user(token):
+        return auth['user_id']
+    emit('token_expired')
+    return None
+
+
+def emit_packed(event, payload):
+    # Large replies to the calling socket go out as a zlib-compressed binary
+    # frame ({'z': bytes}) if the client asked for it at connect.
+    auth = socket_sessions.get(request.sid)
+    if auth and auth.get('compress'):
+        encoded = jsonutil.dumps(payload, separators=(',', ':')).encode()
+        if len(encoded) >= SOCKET_COMPRESS_THRESHOLD:
+            emit(event, {'z': zlib.compress(encoded, SOCKET_COMPRESS_LEVEL)})
+            return
+    emit(event, payload)
 
-connected_users = {}
 
 def calculate_age(birth_date_str):
     if not birth_date_str:
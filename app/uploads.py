@@ -0,0 +1,193 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from .database import get_db
+from .extensions import socketio
+from .blobstore import blob_store, checked_file_mime
+from .messages import create_file_message
+from .membership import is_blocked_in_room, is_member
+from .audit import log_group_action
+from datetime import datetime, timezone
+import mimetypes
+import hashlib
+import secrets
+import shutil
+import tempfile
+import os
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+UPLOAD_DIR = os.path.abspath(os.getenv('UPLOAD_TMP_DIR', 'storage/uploads'))
+CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+MAX_CHUNK_SIZE = 2 * CHUNK_SIZE
+STREAM_BUFFER = 64 * 1024
+
+
+def part_path(upload_id):
+    return os.path.join(UPLOAD_DIR, f'{upload_id}.part')
+
+
+def remove_parts(upload_ids):
+    for upload_id in upload_ids:
+        if os.path.exists(part_path(upload_id)):
+            os.remove(part_path(upload_id))
+
+
+def delete_room_uploads(c, room_id):
+    # Part files are removed by the caller once the room deletion commits.
+    c.execute("DELETE FROM uploads WHERE room_id = %s RETURNING id", (room_id,))
+    return [row['id'] for row in c.fetchall()]
+
+
+def stream_chunk_to_disk(stream):
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    fd, chunk_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.chunk')
+    with os.fdopen(fd, 'wb') as out:
+        while True:
+            buf = stream.read(STREAM_BUFFER)
+            if not buf:
+                break
+            size += len(buf)
+            if size > MAX_CHUNK_SIZE:
+                break
+            sha.update(buf)
+            out.write(buf)
+    return chunk_path, sha.hexdigest(), size
+
+
+@uploads_bp.route('', methods=['POST'])
+@jwt_required()
+def init_upload():
+    user_id = get_jwt_identity()
+    data = request.json
+    room_id = data.get('room_id')
+    filename = data.get('filename')
+    size = data.get('size')
+
+    if not room_id or not filename or not isinstance(size, int) or size < 0:
+        return jsonify({'error': 'Bad request'}), 400
+    if size > current_app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': 'File too large'}), 413
+
+    with get_db() as conn, conn.cursor() as c:
+        if not is_member(c, room_id, user_id):
+            return jsonify({'error': 'Unauthorized'}), 403
+        if is_blocked_in_room(c, room_id, user_id):
+            return jsonify({'error': 'Blocked'}), 403
+
+        upload_id = secrets.token_hex(16)
+        mime_type = data.get('mime_type') or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        c.execute("""INSERT INTO uploads (id, user_id, room_id, filename, caption, mime_type, size, received, created_at)
+                     VALUES (%s, %s, %s, %s, %s, %s, %s, 0, %s)""",
+                  (upload_id, user_id, room_id, filename, data.get('caption', ''), mime_type, size,
+                   datetime.now(timezone.utc)))
+        conn.commit()
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    open(part_path(upload_id), 'wb').close()
+    return jsonify({'status': 'ok', 'upload_id': upload_id, 'offset': 0, 'chunk_size': CHUNK_SIZE})
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@jwt_required()
+def upload_status(upload_id):
+    user_id = get_jwt_identity()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT size, received FROM uploads WHERE id = %s AND user_id = %s", (upload_id, user_id))
+        upload = c.fetchone()
+    if not upload:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'status': 'ok', 'offset': upload['received'], 'size': upload['size']})
+
+
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+@jwt_required()
+def append_chunk(upload_id):
+    user_id = get_jwt_identity()
+    offset = request.args.get('offset', type=int)
+    expected_sha = (request.headers.get('X-Chunk-Sha256') or '').lower()
+
+    if offset is None:
+        return jsonify({'error': 'Offset required'}), 400
+    if request.content_length is not None and request.content_length > MAX_CHUNK_SIZE:
+        return jsonify({'error': 'Chunk too large'}), 413
+
+    chunk_path, chunk_sha, chunk_size = stream_chunk_to_disk(request.stream)
+    try:
+        if chunk_size > MAX_CHUNK_SIZE:
+            return jsonify({'error': 'Chunk too large'}), 413
+        if expected_sha and expected_sha != chunk_sha:
+            return jsonify({'error': 'Checksum mismatch', 'offset': offset}), 422
+
+        with get_db() as conn, conn.cursor() as c:
+            c.execute("SELECT size, received FROM uploads WHERE id = %s AND user_id = %s FOR UPDATE",
+                      (upload_id, user_id))
+            upload = c.fetchone()
+            if not upload:
+                return jsonify({'error': 'Not found'}), 404
+            if offset != upload['received']:
+                return jsonify({'error': 'Offset mismatch', 'offset': upload['received']}), 409
+            if offset + chunk_size > upload['size']:
+                return jsonify({'error': 'Chunk exceeds declared size', 'offset': offset}), 400
+
+            with open(part_path(upload_id), 'r+b') as part, open(chunk_path, 'rb') as chunk:
+                part.seek(offset)
+                part.truncate()
+                shutil.copyfileobj(chunk, part, STREAM_BUFFER)
+
+            c.execute("UPDATE uploads SET received = %s WHERE id = %s", (offset + chunk_size, upload_id))
+            conn.commit()
+    finally:
+        os.remove(chunk_path)
+
+    return jsonify({'status': 'ok', 'offset': offset + chunk_size})
+
+
+@uploads_bp.route('/<upload_id>/commit', methods=['POST'])
+@jwt_required()
+def commit_upload(upload_id):
+    user_id = get_jwt_identity()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("SELECT * FROM uploads WHERE id = %s AND user_id = %s FOR UPDATE", (upload_id, user_id))
+        upload = c.fetchone()
+        if not upload:
+            return jsonify({'error': 'Not found'}), 404
+        if upload['received'] != upload['size']:
+            return jsonify({'error': 'Upload incomplete', 'offset': upload['received']}), 409
+
+        room_id = upload['room_id']
+        if is_blocked_in_room(c, room_id, user_id):
+            return jsonify({'error': 'Blocked'}), 403
+
+        path = part_path(upload_id)
+        with open(path, 'r+b') as part:
+            part.truncate(upload['size'])
+        mime_type = checked_file_mime(upload['mime_type'], path)
+        # The part file stays until the message commits, so a failed commit
+        # can simply be retried.
+        key, size = blob_store.put_path(path, keep_source=True)
+
+        message, log_details = create_file_message(c, user_id, room_id, key, size, mime_type,
+                                                   upload['filename'], upload['caption'])
+        c.execute("DELETE FROM uploads WHERE id = %s", (upload_id,))
+        conn.commit()
+
+    remove_parts([upload_id])
+    if log_details:
+        log_group_action(room_id, "Файл", log_details)
+    socketio.emit('new_message', message, to=room_id)
+    return jsonify({'status': 'ok', 'id': message['id']})
+
+
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    user_id = get_jwt_identity()
+    with get_db() as conn, conn.cursor() as c:
+        c.execute("DELETE FROM uploads WHERE id = %s AND user_id = %s", (upload_id, user_id))
+        deleted = c.rowcount > 0
+        conn.commit()
+    if deleted and os.path.exists(part_path(upload_id)):
+        os.remove(part_path(upload_id))
+    return jsonify({'status': 'ok'})
@@ -0,0 +1,96 @@
+from .extensions import socketio
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+buffers = {}
+
+
+class WriteBehindBuffer:
+    def __init__(self, name, flush_fn, interval=5.0, max_size=500, merge=None):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.merge = merge
+        self.interval = interval
+        self.max_size = max_size
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.started = False
+        self.flush_scheduled = False
+        self.stats = {'flushes': 0, 'rows_flushed': 0, 'failures': 0, 'last_flush_ms': None, 'last_flush_rows': 0}
+        buffers[name] = self
+
+    def put(self, key, value):
+        with self.lock:
+            if self.merge is not None and key in self.pending:
+                value = self.merge(self.pending[key], value)
+            self.pending[key] = value
+            # While the database is down the buffer stays full; one pending
+            # flush at a time keeps every put from starting another one.
+            schedule = len(self.pending) >= self.max_size and not self.flush_scheduled
+            if schedule:
+                self.flush_scheduled = True
+        if schedule:
+            socketio.start_background_task(self.scheduled_flush)
+
+    def scheduled_flush(self):
+        try:
+            self.flush()
+        finally:
+            with self.lock:
+                self.flush_scheduled = False
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                items, self.pending = self.pending, {}
+            if not items:
+                return 0
+
+            started = time.monotonic()
+            try:
+                self.flush_fn(items)
+            except Exception:
+                with self.lock:
+                    for key, value in items.items():
+                        if key not in self.pending:
+                            self.pending[key] = value
+                        elif self.merge is not None:
+                            self.pending[key] = self.merge(value, self.pending[key])
+                self.stats['failures'] += 1
+                logger.exception('Flushing write-behind buffer %s failed', self.name)
+                return 0
+
+            self.stats['flushes'] += 1
+            self.stats['rows_flushed'] += len(items)
+            self.stats['last_flush_rows'] = len(items)
+            self.stats['last_flush_ms'] = round((time.monotonic() - started) * 1000, 2)
+            return len(items)
+
+    def run(self):
+        while True:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        atexit.register(self.flush)
+        socketio.start_background_task(self.run)
+
+    def peek(self, key):
+        with self.lock:
+            return self.pending.get(key)
+
+    def depth(self):
+        return len(self.pending)
+
+
+def get_buffer_stats():
+    return {name: {'depth': buf.depth(), 'interval': buf.interval, 'max_size': buf.max_size, **buf.stats}
+            for name, buf in buffers.items()}
@@ -0,0 +1,112 @@
+# Search latency on a synthetic dataset: loads N random messages spread over
+# the last two years, split between a throwaway group with one participant and
+# a second room the caller is not in. Every 20th message is a file named with
+# random words; only file names are searchable, message text is encrypted on
+# the client. Then times /api/search queries through app.search. Loading 10M
+# rows takes a while; --keep leaves the data in place for repeated runs with
+# --reuse.
+#
+#   DATABASE_URL=postgresql://... python bench/search.py --messages 10000000
+
+import argparse
+import os
+import secrets
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import psycopg
+from psycopg.rows import dict_row
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.search import search_messages  # noqa: E402
+
+WORDS = ['звіт', 'проєкт', 'зустріч', 'бюджет', 'реліз', 'сервер', 'клієнт', 'договір', 'відпустка', 'дедлайн',
+         'report', 'deploy', 'invoice', 'meeting', 'backup', 'database', 'ticket', 'review', 'design', 'budget']
+QUERIES = ['звіт', 'бюджет реліз', '"зустріч дедлайн"', 'deploy -backup', 'invoice', 'договір OR ticket', 'inv']
+BENCH_USER = 'benchsrch'
+
+
+def setup(conn, count):
+    now = datetime.now(timezone.utc)
+    rooms = [f'benchsearch{secrets.token_hex(4)}', f'benchsearch{secrets.token_hex(4)}']
+    with conn.cursor() as c:
+        c.execute("""INSERT INTO users (id, name, password_hash, created_at) VALUES (%s, %s, %s, %s)
+                     ON CONFLICT (id) DO NOTHING""", (BENCH_USER, 'bench_search', '-', now))
+        for room_id in rooms:
+            c.execute("INSERT INTO rooms (id, type, name, created_by, created_at) VALUES (%s, %s, %s, %s, %s)",
+                      (room_id, 'group', 'bench search', BENCH_USER, now))
+        c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                  (rooms[0], BENCH_USER, 'owner', now))
+        c.execute("""SELECT create_monthly_partition('messages', 'created_at', month::date)
+                     FROM generate_series(date_trunc('month', now() - interval '2 years'), now(),
+                                          interval '1 month') AS month""")
+        for room_id in rooms:
+            c.execute("""INSERT INTO messages (room_id, sender_id, type, content, filename, created_at)
+                         SELECT %(room_id)s, %(user_id)s,
+                                CASE WHEN i %% 20 = 0 THEN 'file' ELSE 'text' END,
+                                (SELECT string_agg((%(words)s::text[])[1 + floor(random() * %(n)s)::int], ' ')
+                                 FROM generate_series(1, 4 + i %% 8) WHERE i > 0),
+                                CASE
+                                    WHEN i %% 20 = 0 THEN
+                                        (SELECT string_agg((%(words)s::text[])[1 + floor(random() * %(n)s)::int], ' ')
+                                         FROM generate_series(1, 1 + i %% 3) WHERE i > 0) || ' ' || i || '.pdf'
+                                    END,
+                                now() - random() * interval '2 years'
+                         FROM generate_series(1, %(count)s) AS i""",
+                      {'room_id': room_id, 'user_id': BENCH_USER, 'words': WORDS, 'n': len(WORDS),
+                       'count': count})
+        c.execute("ANALYZE messages")
+    conn.commit()
+    return rooms
+
+
+def teardown(conn, rooms):
+    with conn.cursor() as c:
+        c.execute("DELETE FROM messages WHERE room_id = ANY(%s)", (rooms,))
+        c.execute("DELETE FROM read_cursors WHERE room_id = ANY(%s)", (rooms,))
+        c.execute("DELETE FROM participants WHERE room_id = ANY(%s)", (rooms,))
+        c.execute("DELETE FROM rooms WHERE id = ANY(%s)", (rooms,))
+    conn.commit()
+
+
+def measure(conn, query, room_id, repeat):
+    timings = []
+    with conn.cursor() as c:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows, _ = search_messages(c, BENCH_USER, query, room_id=room_id)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return len(rows), statistics.fmean(timings), timings[len(timings) // 2], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=10_000_000, help='Messages in total, split over both rooms.')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--keep', action='store_true', help='Do not delete the dataset afterwards.')
+    parser.add_argument('--reuse', nargs=2, metavar=('ROOM', 'OTHER_ROOM'), help='Rooms left by --keep.')
+    args = parser.parse_args()
+
+    with psycopg.connect(os.getenv('DATABASE_URL'), row_factory=dict_row) as conn:
+        if args.reuse:
+            rooms = args.reuse
+        else:
+            started = time.perf_counter()
+            rooms = setup(conn, args.messages // 2)
+            print(f'loaded {args.messages // 2 * 2} messages in {time.perf_counter() - started:.1f}s, rooms {rooms[0]} {rooms[1]}')
+
+        try:
+            for scope, room_id in (('room', rooms[0]), ('all', None)):
+                for query in QUERIES:
+                    found, mean, p50, worst = measure(conn, query, room_id, args.repeat)
+                    print(f'{scope:>4} {query!r:<24} rows={found:<3} mean={mean:.2f}ms p50={p50:.2f}ms max={worst:.2f}ms')
+        finally:
+            if not args.keep:
+                teardown(conn, rooms)
+
+
+if __name__ == '__main__':
+    main()
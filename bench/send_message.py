@@ -0,0 +1,116 @@
+# Per-message latency of the send path against a real database: the old
+# statement-by-statement sequence (block check, INSERT, SELECT user, UPDATE
+# room_visibility, SELECT room, INSERT group_logs, COMMIT) versus the single
+# SEND_MESSAGE_SQL statement used by handle_message (its group log entry goes
+# through the background audit writer instead). Creates a throwaway group with
+# two users and removes it afterwards.
+#
+#   DATABASE_URL=postgresql://... python bench/send_message.py --messages 2000
+
+import argparse
+import os
+import secrets
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import psycopg
+from psycopg.rows import dict_row
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.messages import send_message  # noqa: E402
+
+
+def legacy_send(conn, c, room_id, user_id, content):
+    c.execute(
+        "SELECT 1 FROM blocked_users WHERE blocker_id IN (SELECT user_id FROM participants WHERE room_id = %s AND user_id != %s) AND blocked_id = %s",
+        (room_id, user_id, user_id))
+    if c.fetchone():
+        return None
+    c.execute(
+        "INSERT INTO messages (room_id, sender_id, type, content, created_at) VALUES (%s, %s, %s, %s, %s) RETURNING id, created_at",
+        (room_id, user_id, 'text', content, datetime.now(timezone.utc)))
+    inserted = c.fetchone()
+    c.execute("SELECT name, avatar FROM users WHERE id = %s", (user_id,))
+    user = c.fetchone()
+    c.execute("UPDATE room_visibility SET hidden = FALSE WHERE room_id = %s AND hidden", (room_id,))
+    c.execute("SELECT type FROM rooms WHERE id = %s", (room_id,))
+    room = c.fetchone()
+    if room and room['type'] == 'group':
+        c.execute("INSERT INTO group_logs (room_id, action, details, timestamp) VALUES (%s, %s, %s, %s)",
+                  (room_id, 'message', f"{user['name']}: Надіслав повідомлення", datetime.now(timezone.utc)))
+    conn.commit()
+    return inserted
+
+
+def single_send(conn, c, room_id, user_id, content):
+    return send_message(c, room_id, user_id, 'text', content)
+
+
+def measure(conn, fn, room_id, user_id, count):
+    timings = []
+    with conn.cursor() as c:
+        for i in range(count):
+            started = time.perf_counter()
+            fn(conn, c, room_id, user_id, f'bench {i}')
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[int(len(timings) * 0.99) - 1],
+    }
+
+
+def setup(conn):
+    room_id = f'bench{secrets.token_hex(6)}'
+    users = [secrets.token_hex(4), secrets.token_hex(4)]
+    now = datetime.now(timezone.utc)
+    with conn.cursor() as c:
+        for user_id in users:
+            c.execute("INSERT INTO users (id, name, password_hash, created_at) VALUES (%s, %s, %s, %s)",
+                      (user_id, f'bench_{user_id}', '-', now))
+        c.execute("INSERT INTO rooms (id, type, name, created_by, created_at) VALUES (%s, %s, %s, %s, %s)",
+                  (room_id, 'group', 'bench', users[0], now))
+        for user_id in users:
+            c.execute("INSERT INTO participants (room_id, user_id, role, joined_at) VALUES (%s, %s, %s, %s)",
+                      (room_id, user_id, 'member', now))
+    conn.commit()
+    return room_id, users
+
+
+def teardown(conn, room_id, users):
+    with conn.cursor() as c:
+        c.execute("DELETE FROM messages WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM group_logs WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM read_cursors WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM participants WHERE room_id = %s", (room_id,))
+        c.execute("DELETE FROM rooms WHERE id = %s", (room_id,))
+        c.execute("DELETE FROM users WHERE id = ANY(%s)", (users,))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000)
+    args = parser.parse_args()
+
+    with psycopg.connect(os.getenv('DATABASE_URL'), row_factory=dict_row) as conn:
+        room_id, users = setup(conn)
+        try:
+            conn.autocommit = False
+            legacy = measure(conn, legacy_send, room_id, users[0], args.messages)
+            conn.autocommit = True
+            single = measure(conn, single_send, room_id, users[0], args.messages)
+        finally:
+            conn.autocommit = False
+            teardown(conn, room_id, users)
+
+    for name, result in (('before', legacy), ('after', single)):
+        print(f"{name:>6}: mean={result['mean']:.3f}ms p50={result['p50']:.3f}ms p99={result['p99']:.3f}ms")
+    print(f"speedup (mean): {legacy['mean'] / single['mean']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
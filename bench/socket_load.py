@@ -0,0 +1,81 @@
+# Socket.IO load test: N clients in the general room each send M messages,
+# every client receives every message. Run it against `python run.py`
+# (threading) and `python serve.py` (gevent) to compare.
+#
+#   pip install "python-socketio[client]"
+#   python bench/socket_load.py --url http://127.0.0.1:5000 --clients 50 --messages 20
+
+import argparse
+import json
+import secrets
+import threading
+import time
+import urllib.request
+
+import socketio
+
+
+def register(url, name):
+    body = json.dumps({'name': name, 'password': secrets.token_hex(8)}).encode()
+    req = urllib.request.Request(f'{url}/api/auth/register', data=body,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req) as res:
+        return json.load(res)['access_token']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--room', default='general')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    run_id = secrets.token_hex(3)
+    tokens = [register(args.url, f'bench_{run_id}_{i}') for i in range(args.clients)]
+    expected = args.clients * args.messages * args.clients
+    received = 0
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def on_message(msg):
+        nonlocal received
+        if not str(msg.get('content', '')).startswith(f'bench {run_id}'):
+            return
+        with lock:
+            received += 1
+            if received >= expected:
+                done.set()
+
+    clients = []
+    for token in tokens:
+        client = socketio.Client()
+        client.on('new_message', on_message)
+        client.connect(args.url, auth={'token': token}, transports=['websocket'])
+        clients.append((client, token))
+
+    def send_all(client, token):
+        for i in range(args.messages):
+            client.emit('send_message', {'token': token, 'room_id': args.room, 'type': 'text',
+                                         'content': f'bench {run_id} {i}'})
+
+    started = time.perf_counter()
+    senders = [threading.Thread(target=send_all, args=pair) for pair in clients]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    done.wait(args.timeout)
+    elapsed = time.perf_counter() - started
+
+    sent = args.clients * args.messages
+    print(f'clients={args.clients} messages={sent} deliveries={received}/{expected} time={elapsed:.2f}s')
+    print(f'messages/sec={sent / elapsed:.1f} deliveries/sec={received / elapsed:.1f}')
+
+    for client, _ in clients:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
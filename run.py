@@ -1,10 +1,12 @@
 from app import create_app, socketio
+from app.migrate import upgrade
 import os
 
 app = create_app()
 
 if __name__ == '__main__':
     if not os.environ.get("WERKZEUG_RUN_MAIN"):
+        upgrade()
         print('Сервер успішно запущено!')
         print('Посилання на сайт: http://127.0.0.1:5000')
 
@@ -0,0 +1,14 @@
+from gevent import monkey
+
+monkey.patch_all()
+
+import os
+
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+from app import create_app, socketio
+
+app = create_app()
+
+if __name__ == '__main__':
+    socketio.run(app, host=os.getenv('HOST', '0.0.0.0'), port=int(os.getenv('PORT', 5000)))
@@ -5,27 +5,31 @@ export const getAccessToken = () => accessToken;
 export const getMyId = () => sessionStorage.getItem('user_id');
 export const getMyName = () => sessionStorage.getItem('user_name');
 
+export async function refreshAccessToken() {
+    const refreshRes = await fetch('/api/auth/refresh', {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${refreshToken}` }
+    });
+
+    if (!refreshRes.ok) {
+        logout();
+        return false;
+    }
+    const data = await refreshRes.json();
+    accessToken = data.access_token;
+    sessionStorage.setItem('access_token', accessToken);
+    return true;
+}
+
 export async function fetchWithAuth(url, options = {}) {
     if (!options.headers) options.headers = {};
     options.headers['Authorization'] = `Bearer ${accessToken}`;
 
     let response = await fetch(url, options);
 
-    if (response.status === 401) {
-        const refreshRes = await fetch('/api/auth/refresh', {
-            method: 'POST',
-            headers: { 'Authorization': `Bearer ${refreshToken}` }
-        });
-
-        if (refreshRes.ok) {
-            const data = await refreshRes.json();
-            accessToken = data.access_token;
-            sessionStorage.setItem('access_token', accessToken);
-            options.headers['Authorization'] = `Bearer ${accessToken}`;
-            response = await fetch(url, options);
-        } else {
-            logout();
-        }
+    if (response.status === 401 && await refreshAccessToken()) {
+        options.headers['Authorization'] = `Bearer ${accessToken}`;
+        response = await fetch(url, options);
     }
     return response;
 }
@@ -1,6 +1,6 @@
-import {fetchWithAuth, getAccessToken, getMyId, getMyName, logout} from './api.js';
-import {decrypt} from './utils.js';
-import {initSocket} from './socket.js';
+import {fetchWithAuth, getAccessToken, getMyId, getMyName, logout, refreshAccessToken} from './api.js';
+import {decrypt, avatarUrl} from './utils.js';
+import {initSocket, onPacked} from './socket.js';
 import * as UI from './ui.js';
 import * as Groups from './modules/groups.js';
 import * as Chat from './modules/chat.js';
@@ -17,8 +17,26 @@ if (Notification.permission !== "granted") {
 const socket = initSocket();
 window.socket = socket;
 
+const TOKEN_REFRESH_INTERVAL = 10 * 60 * 1000;
+
+async function refreshSocketToken() {
+    if (await refreshAccessToken()) {
+        socket.emit('refresh_token', {token: getAccessToken()});
+    }
+}
+
+socket.on('token_expired', refreshSocketToken);
+setInterval(refreshSocketToken, TOKEN_REFRESH_INTERVAL);
+// Also renews the blob cookie, which may have expired since the last visit.
+refreshSocketToken();
+
 let currentTab = 'groups';
 let cachedUsers = [];
+let historyState = {roomId: null, oldestId: null, hasMore: false, loading: false};
+let syncVersion = null;
+let unreadCounts = {};
+let othersReadSeq = 0;
+let roomSummaries = {};
 let cachedProfile = {
     bio: '',
     avatars_gallery: [],
@@ -41,17 +59,82 @@ document.getElementById('profile-birthdate-picker').addEventListener('change', (
     document.getElementById('profile-birthdate').value = val;
 });
 
+function markRead(roomId, seq) {
+    if (!seq) return;
+    unreadCounts[roomId] = 0;
+    socket.emit('mark_read', {token: getAccessToken(), room_id: roomId, seq});
+}
+
+function resolveSender(msg) {
+    if (msg.sender_name !== undefined) return;
+    if (msg.sender_id === getMyId()) {
+        msg.sender_name = getMyName();
+        msg.sender_avatar = cachedProfile.avatar;
+        return;
+    }
+    const user = cachedUsers.find(u => u.id === msg.sender_id);
+    msg.sender_name = user ? user.name : '…';
+    msg.sender_avatar = user ? user.avatar : null;
+    if (!user) requestSync();
+}
+
+function bumpRoom(msg) {
+    const previous = roomSummaries[msg.room_id] || {};
+    roomSummaries[msg.room_id] = {
+        last_activity: msg.created_at,
+        message_count: (previous.message_count || 0) + 1,
+        last_message_id: msg.id,
+        sender_id: msg.sender_id,
+        type: msg.type,
+        preview: msg.type === 'file' ? msg.filename : msg.content,
+    };
+    const rooms = Groups.getCachedRooms();
+    const index = rooms.findIndex(r => r.id === msg.room_id);
+    if (index > 0) rooms.unshift(...rooms.splice(index, 1));
+}
+
+function requestSync() {
+    socket.emit('get_data', {token: getAccessToken(), since_xid: syncVersion});
+}
+
 socket.on('connect', () => {
-    socket.emit('get_data', {token: getAccessToken()});
+    requestSync();
 });
 
-socket.on('data_update', (data) => {
-    Groups.setCachedRooms(data.rooms);
-    cachedUsers = data.users;
+onPacked(socket, 'data_update', (data) => {
+    const roomsById = new Map(data.full ? [] : Groups.getCachedRooms().map(r => [r.id, r]));
+    data.rooms.forEach(r => roomsById.set(r.id, r));
+    Groups.setCachedRooms(data.room_ids.map(id => roomsById.get(id)).filter(Boolean));
+    roomSummaries = data.summaries || {};
+
+    if (data.full) {
+        cachedUsers = data.users;
+    } else {
+
+        const usersById = new Map(cachedUsers.map(u => [u.id, u]));
+        data.users.forEach(u => usersById.set(u.id, u));
+        cachedUsers = Array.from(usersById.values());
+
+        data.users.forEach(u => {
+            Groups.getCachedRooms().forEach(room => {
+                const p = (room.participants || []).find(p => p.id === u.id);
+                if (p) {
+                    p.name = u.name;
+                    p.avatar = u.avatar;
+                }
+            });
+        });
+    }
+
+    const online = new Set(data.online);
+    cachedUsers.forEach(u => u.is_online = online.has(u.id));
 
     if (data.my_profile) {
         cachedProfile = data.my_profile;
     }
+    syncVersion = data.version;
+    unreadCounts = data.unread || {};
+    if (Groups.getCurrentRoom()) unreadCounts[Groups.getCurrentRoom()] = 0;
 
     updateMyAvatar();
     renderList();
@@ -59,7 +142,7 @@ socket.on('data_update', (data) => {
 
 socket.on('force_join_room', (data) => {
     socket.emit('join_chat', {room_id: data.room_id, token: getAccessToken()});
-    socket.emit('get_data', {token: getAccessToken()});
+    requestSync();
 });
 
 socket.on('user_registered', (user) => {
@@ -69,14 +152,17 @@ socket.on('user_registered', (user) => {
     }
 });
 
-socket.on('user_status', (data) => {
-    const user = cachedUsers.find(u => u.id === data.user_id);
-    if (user) {
-        user.is_online = (data.status === 'online');
-        user.last_active = data.last_active;
-        if (data.gender) user.gender = data.gender;
-        if (currentTab === 'users') renderList();
-    }
+socket.on('presence_update', (data) => {
+    let changed = false;
+    data.updates.forEach(update => {
+        const user = cachedUsers.find(u => u.id === update.user_id);
+        if (!user) return;
+        user.is_online = (update.status === 'online');
+        if (update.last_active) user.last_active = update.last_active;
+        if (update.gender) user.gender = update.gender;
+        changed = true;
+    });
+    if (changed && currentTab === 'users') renderList();
 });
 
 socket.on('profile_updated', (data) => {
@@ -126,7 +212,7 @@ socket.on('group_updated', (data) => {
         if (data.name) document.getElementById('room-name').innerText = data.name;
         if (data.avatar) {
             const av = document.getElementById('current-room-avatar');
-            av.style.backgroundImage = `url(data:image/png;base64,${data.avatar})`;
+            av.style.backgroundImage = `url(${avatarUrl(data.avatar)})`;
             av.style.display = 'block';
         }
     }
@@ -145,7 +231,7 @@ socket.on('group_update', (data) => {
         if (data.name) document.getElementById('room-name').innerText = data.name;
         if (data.avatar) {
             const av = document.getElementById('current-room-avatar');
-            av.style.backgroundImage = `url(data:image/png;base64,${data.avatar})`;
+            av.style.backgroundImage = `url(${avatarUrl(data.avatar)})`;
             av.style.display = 'block';
         }
         if (document.getElementById('group-settings-modal').classList.contains('active')) {
@@ -218,14 +304,20 @@ socket.on('participant_removed', (data) => {
 });
 
 socket.on('new_message', (msg) => {
+    resolveSender(msg);
     const rooms = Groups.getCachedRooms();
     if (!rooms.find(r => r.id === msg.room_id)) {
-        socket.emit('get_data', {token: getAccessToken()});
+        requestSync();
     }
 
     if (Groups.getCurrentRoom() === msg.room_id) {
         UI.appendMessage(msg, socket);
+        if (msg.sender_id !== getMyId()) markRead(msg.room_id, msg.seq);
+    } else if (msg.sender_id !== getMyId()) {
+        unreadCounts[msg.room_id] = (unreadCounts[msg.room_id] || 0) + 1;
     }
+    bumpRoom(msg);
+    renderList();
 
     if (msg.sender_id !== getMyId()) {
         notificationSound.play().catch(e => {
@@ -258,28 +350,90 @@ socket.on('message_edited', (data) => {
     if (Groups.getCurrentRoom() === data.room_id) {
         UI.updateMessageInDOM(data.id, data.content, data.edited_at);
     }
+    const summary = roomSummaries[data.room_id];
+    if (summary && summary.last_message_id === data.id && summary.type === 'text') {
+        summary.preview = data.content;
+        renderList();
+    }
 });
 
 socket.on('message_hidden', (data) => {
     if (Groups.getCurrentRoom() === data.room_id) {
         UI.removeMessageFromDOM(data.id);
     }
+    const summary = roomSummaries[data.room_id];
+    if (summary && summary.last_message_id === data.id) requestSync();
 });
 
 socket.on('message_deleted', (data) => {
     if (Groups.getCurrentRoom() === data.room_id) {
         UI.removeMessageFromDOM(data.id);
     }
+    const summary = roomSummaries[data.room_id];
+    if (summary && summary.last_message_id === data.id) requestSync();
 });
 
-socket.on('chat_history', (data) => {
+onPacked(socket, 'chat_history', (data) => {
+    if (Groups.getCurrentRoom() !== data.room_id) return;
     const area = document.getElementById('messages-area');
     area.innerHTML = '';
     data.messages.forEach(msg => UI.appendMessage(msg, socket));
+
+    const last = data.messages[data.messages.length - 1];
+    if (last) markRead(data.room_id, last.seq);
+    othersReadSeq = Math.max(0, ...(data.read_cursors || []).map(c => c.seq));
+    UI.markMessagesRead(othersReadSeq);
+    renderList();
+
+    historyState = {
+        roomId: data.room_id,
+        oldestId: data.messages.length ? data.messages[0].id : null,
+        hasMore: data.has_more,
+        loading: false
+    };
+    UI.setLoadOlderVisible(historyState.hasMore, loadOlderMessages);
+});
+
+socket.on('read_updated', (data) => {
+    unreadCounts[data.room_id] = 0;
+    renderList();
+});
+
+socket.on('read_receipts', (data) => {
+    if (Groups.getCurrentRoom() !== data.room_id) return;
+    data.cursors.forEach(c => {
+        if (c.user_id !== getMyId()) othersReadSeq = Math.max(othersReadSeq, c.seq);
+    });
+    UI.markMessagesRead(othersReadSeq);
+});
+
+onPacked(socket, 'chat_history_page', (data) => {
+    if (historyState.roomId !== data.room_id) return;
+    historyState.loading = false;
+    if (data.messages.length) {
+        UI.prependMessages(data.messages, socket);
+        historyState.oldestId = data.messages[0].id;
+    }
+    historyState.hasMore = data.has_more;
+    UI.setLoadOlderVisible(historyState.hasMore, loadOlderMessages);
+});
+
+function loadOlderMessages() {
+    if (!historyState.hasMore || historyState.loading || historyState.oldestId === null) return;
+    historyState.loading = true;
+    socket.emit('load_history', {
+        token: getAccessToken(),
+        room_id: historyState.roomId,
+        before: historyState.oldestId
+    });
+}
+
+document.getElementById('messages-area').addEventListener('scroll', (e) => {
+    if (e.target.scrollTop < 100) loadOlderMessages();
 });
 
 socket.on('private_chat_ready', (data) => {
-    socket.emit('get_data', {token: getAccessToken()});
+    requestSync();
     setTimeout(() => {
         const rooms = Groups.getCachedRooms();
         const room = rooms.find(r => r.id === data.room_id) || {id: data.room_id, type: 'private'};
@@ -288,7 +442,7 @@ socket.on('private_chat_ready', (data) => {
 });
 
 socket.on('group_created', (data) => {
-    socket.emit('get_data', {token: getAccessToken()});
+    requestSync();
     UI.closeModal('group-modal');
 });
 
@@ -303,7 +457,7 @@ socket.on('user_disconnected_video', (data) => {
 function updateMyAvatar() {
     const avatarEl = document.getElementById('my-avatar-small');
     if (cachedProfile.avatar) {
-        avatarEl.style.backgroundImage = `url(data:image/png;base64,${cachedProfile.avatar})`;
+        avatarEl.style.backgroundImage = `url(${avatarUrl(cachedProfile.avatar)})`;
         avatarEl.innerText = '';
     } else {
         avatarEl.style.backgroundImage = '';
@@ -314,7 +468,7 @@ function updateMyAvatar() {
 function renderList() {
     window.renderList = renderList;
     if (currentTab === 'groups') {
-        UI.renderRoomList(Groups.getCachedRooms(), Groups.getCurrentRoom(), onRoomClick);
+        UI.renderRoomList(Groups.getCachedRooms(), Groups.getCurrentRoom(), onRoomClick, unreadCounts, roomSummaries);
     } else {
         UI.renderUserList(cachedUsers, onUserClick, cachedProfile.blocked_users);
     }
@@ -322,11 +476,12 @@ function renderList() {
 
 function onRoomClick(room) {
     Groups.setCurrentRoom(room.id);
+    othersReadSeq = 0;
     document.getElementById('room-name').innerText = room.name || 'Чат';
 
     const avatarEl = document.getElementById('current-room-avatar');
     if (room.avatar) {
-        avatarEl.style.backgroundImage = `url(data:image/png;base64,${room.avatar})`;
+        avatarEl.style.backgroundImage = `url(${avatarUrl(room.avatar)})`;
         avatarEl.style.display = 'block';
     } else {
         avatarEl.style.display = 'none';
@@ -369,7 +524,7 @@ window.unblockUser = async (uid) => {
         });
         cachedProfile.blocked_users = cachedProfile.blocked_users.filter(id => id !== uid);
 
-        socket.emit('get_data', {token: getAccessToken()});
+        requestSync();
 
         const currentRoom = Groups.getCurrentRoom();
         if (currentRoom) {
@@ -396,7 +551,7 @@ function onUserClick(user) {
         document.getElementById('user-info-bio').innerText = '';
         UI.renderReadOnlyGallery([]);
     } else {
-        bigAv.style.backgroundImage = user.avatar ? `url(data:image/png;base64,${user.avatar})` : '';
+        bigAv.style.backgroundImage = user.avatar ? `url(${avatarUrl(user.avatar, 256)})` : '';
         if (user.real_name) {
             document.getElementById('user-info-realname').innerText = user.real_name;
             document.getElementById('user-info-birth').innerText = user.birth_date;
@@ -437,7 +592,7 @@ function onUserClick(user) {
                 body: JSON.stringify({target_id: user.id, action})
             });
 
-            socket.emit('get_data', {token: getAccessToken()});
+            requestSync();
             UI.closeModal('user-info-modal');
         }
     };
@@ -453,7 +608,7 @@ window.openUserProfile = (userId) => {
 };
 
 async function onAvatarSelect(avatarData) {
-    document.getElementById('profile-avatar-big').style.backgroundImage = `url(data:image/png;base64,${avatarData})`;
+    document.getElementById('profile-avatar-big').style.backgroundImage = `url(${avatarUrl(avatarData, 256)})`;
     await fetchWithAuth('/api/user/avatar/select', {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
@@ -478,7 +633,7 @@ async function onDeleteAvatar(avatarData) {
 
         const bigAv = document.getElementById('profile-avatar-big');
         if (cachedProfile.avatar) {
-            bigAv.style.backgroundImage = `url(data:image/png;base64,${cachedProfile.avatar})`;
+            bigAv.style.backgroundImage = `url(${avatarUrl(cachedProfile.avatar, 256)})`;
         } else {
             bigAv.style.backgroundImage = '';
         }
@@ -518,7 +673,7 @@ window.openProfileModal = () => {
     }
 
     if (cachedProfile.avatar) {
-        document.getElementById('profile-avatar-big').style.backgroundImage = `url(data:image/png;base64,${cachedProfile.avatar})`;
+        document.getElementById('profile-avatar-big').style.backgroundImage = `url(${avatarUrl(cachedProfile.avatar, 256)})`;
     } else {
         document.getElementById('profile-avatar-big').style.backgroundImage = '';
     }
@@ -531,7 +686,7 @@ window.handleAvatarUpload = () => Media.handleAvatarUpload((data) => {
         cachedProfile.avatar = data.avatar;
 
         const bigAv = document.getElementById('profile-avatar-big');
-        if (bigAv) bigAv.style.backgroundImage = `url(data:image/png;base64,${data.avatar})`;
+        if (bigAv) bigAv.style.backgroundImage = `url(${avatarUrl(data.avatar, 256)})`;
 
         UI.renderProfileGallery(data.gallery, data.avatar, onAvatarSelect, onDeleteAvatar);
         updateMyAvatar();
@@ -591,6 +746,14 @@ window.toggleVideo = Media.toggleVideo;
 window.closeVideoCall = () => Media.closeVideoCall(socket, Groups.getCurrentRoom());
 window.openDeleteChatModal = Groups.openDeleteChatModal;
 window.confirmDeleteChat = () => Groups.confirmDeleteChat(Groups.getCurrentRoom());
+window.clearChatHistory = async () => {
+    const roomId = Groups.getCurrentRoom();
+    if (!roomId || !await Groups.clearChatHistory(roomId)) return;
+    if (Groups.getCurrentRoom() !== roomId) return;
+    document.getElementById('messages-area').innerHTML = '';
+    historyState = {roomId, oldestId: null, hasMore: false, loading: false};
+    UI.setLoadOlderVisible(false, loadOlderMessages);
+};
 
 document.getElementById('msg-input').addEventListener('keypress', function (e) {
     if (e.key === 'Enter') window.sendMessage();
@@ -18,6 +18,71 @@ export function cancelFile() {
     document.getElementById('file-caption').value = '';
 }
 
+const MAX_CHUNK_RETRIES = 3;
+
+async function sha256Hex(buffer) {
+    if (!window.crypto || !window.crypto.subtle) return null;
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadChunk(uploadId, offset, chunk) {
+    const buffer = await chunk.arrayBuffer();
+    const checksum = await sha256Hex(buffer);
+    const headers = {'Content-Type': 'application/octet-stream'};
+    if (checksum) headers['X-Chunk-Sha256'] = checksum;
+
+    const res = await fetchWithAuth(`/api/uploads/${uploadId}?offset=${offset}`, {
+        method: 'PUT',
+        headers,
+        body: buffer
+    });
+    const data = await res.json();
+    if (res.ok) return data.offset;
+    if (data.offset !== undefined && res.status === 409) return data.offset;
+    throw new Error(data.error || 'Upload failed');
+}
+
+export async function uploadInChunks(file, roomId, caption, onProgress) {
+    const initRes = await fetchWithAuth('/api/uploads', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            room_id: roomId,
+            filename: file.name,
+            size: file.size,
+            mime_type: file.type,
+            caption
+        })
+    });
+    const init = await initRes.json();
+    if (!initRes.ok) throw new Error(init.error);
+
+    const {upload_id: uploadId, chunk_size: chunkSize} = init;
+    let offset = init.offset;
+    let retries = 0;
+
+    while (offset < file.size) {
+        try {
+            offset = await uploadChunk(uploadId, offset, file.slice(offset, offset + chunkSize));
+            retries = 0;
+        } catch (e) {
+            if (++retries > MAX_CHUNK_RETRIES) {
+                fetchWithAuth(`/api/uploads/${uploadId}`, {method: 'DELETE'});
+                throw e;
+            }
+            const statusRes = await fetchWithAuth(`/api/uploads/${uploadId}`);
+            if (statusRes.ok) offset = (await statusRes.json()).offset;
+        }
+        onProgress(Math.floor(offset * 100 / (file.size || 1)));
+    }
+
+    const commitRes = await fetchWithAuth(`/api/uploads/${uploadId}/commit`, {method: 'POST'});
+    const commit = await commitRes.json();
+    if (!commitRes.ok) throw new Error(commit.error);
+    return commit;
+}
+
 export function sendMessage(socket, currentRoom) {
     if (!currentRoom) {
         alert('Будь ласка, оберіть чат');
@@ -25,16 +90,15 @@ export function sendMessage(socket, currentRoom) {
     }
 
     if (fileToSend) {
-        const formData = new FormData();
-        formData.append('file', fileToSend);
-        formData.append('room_id', currentRoom);
-        formData.append('caption', document.getElementById('file-caption').value);
-
-        fetchWithAuth('/api/upload', {
-            method: 'POST',
-            body: formData
+        const file = fileToSend;
+        const caption = document.getElementById('file-caption').value;
+        uploadInChunks(file, currentRoom, caption, (percent) => {
+            document.getElementById('file-name').innerText = `${file.name} — ${percent}%`;
         }).then(() => {
             cancelFile();
+        }).catch((e) => {
+            alert(e.message || 'Не вдалося завантажити файл');
+            document.getElementById('file-name').innerText = file.name;
         });
         return;
     }
@@ -1,5 +1,6 @@
 import {fetchWithAuth, getMyId, getAccessToken} from '../api.js';
 import * as UI from '../ui.js';
+import {avatarUrl} from '../utils.js';
 
 let cachedRooms = [];
 let currentRoom = null;
@@ -55,7 +56,7 @@ export async function openGroupSettings(roomId, cachedUsers, socket) {
     nameInput.disabled = !canEdit;
 
     const av = document.getElementById('group-settings-avatar');
-    av.style.backgroundImage = room.avatar ? `url(data:image/png;base64,${room.avatar})` : '';
+    av.style.backgroundImage = room.avatar ? `url(${avatarUrl(room.avatar)})` : '';
 
     document.getElementById('save-group-btn').style.display = canEdit ? 'block' : 'none';
     document.getElementById('delete-group-btn').style.display = isOwner ? 'block' : 'none';
@@ -122,17 +123,18 @@ export function handleGroupAvatarUpload(roomId) {
     const reader = new FileReader();
     reader.onload = (e) => {
         UI.initCropper(e.target.result, async (base64) => {
-            document.getElementById('group-settings-avatar').style.backgroundImage = `url(data:image/png;base64,${base64})`;
+            document.getElementById('group-settings-avatar').style.backgroundImage = `url(${avatarUrl(base64, 256)})`;
 
-            await fetchWithAuth('/api/group/update', {
+            const res = await fetchWithAuth('/api/group/update', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({room_id: roomId, image: base64})
             });
+            const data = await res.json();
 
             const room = cachedRooms.find(r => r.id === roomId);
-            if (room) {
-                room.avatar = base64;
+            if (room && data.avatar) {
+                room.avatar = data.avatar;
                 if (window.renderList) window.renderList();
             }
 
@@ -196,4 +198,14 @@ export async function confirmDeleteChat(roomId) {
         body: JSON.stringify({room_id: roomId, mutual: isMutual})
     });
     UI.closeModal('delete-chat-modal');
+}
+
+export async function clearChatHistory(roomId) {
+    const res = await fetchWithAuth('/api/chat/clear', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({room_id: roomId})
+    });
+    UI.closeModal('delete-chat-modal');
+    return res.ok;
 }
\ No newline at end of file
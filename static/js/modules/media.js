@@ -30,16 +30,15 @@ export function startVoice(socket, currentRoom) {
             if (audioChunks.length === 0) return;
             const audioBlob = new Blob(audioChunks, {type: 'audio/webm'});
             if (audioBlob.size < 1000) return;
-            const reader = new FileReader();
-            reader.readAsDataURL(audioBlob);
-            reader.onloadend = () => {
+            audioBlob.arrayBuffer().then(buffer => {
                 socket.emit('send_message', {
                     token: getAccessToken(),
                     room_id: currentRoom,
-                    content: reader.result,
+                    content: buffer,
+                    mime: audioBlob.type,
                     type: 'voice'
                 });
-            };
+            });
             stream.getTracks().forEach(track => track.stop());
         });
         mediaRecorder.start();
@@ -87,16 +86,15 @@ export function startVideoMessage(socket, currentRoom) {
             if (chunks.length === 0) return;
             const blob = new Blob(chunks, {type: 'video/webm'});
 
-            const reader = new FileReader();
-            reader.readAsDataURL(blob);
-            reader.onloadend = () => {
+            blob.arrayBuffer().then(buffer => {
                 socket.emit('send_message', {
                     token: getAccessToken(),
                     room_id: currentRoom,
-                    content: reader.result,
+                    content: buffer,
+                    mime: blob.type,
                     type: 'video'
                 });
-            };
+            });
             stream.getTracks().forEach(track => track.stop());
         });
 
@@ -2,6 +2,16 @@ import { getAccessToken } from './api.js';
 
 export function initSocket() {
     return io({
-        auth: { token: getAccessToken() }
+        auth: (cb) => cb({ token: getAccessToken(), compress: typeof pako !== 'undefined' })
     });
-}
\ No newline at end of file
+}
+
+// Large replies arrive as {z: ArrayBuffer} (zlib JSON) when compression was negotiated at connect.
+export function onPacked(socket, event, handler) {
+    socket.on(event, (data) => {
+        if (data && data.z) {
+            data = JSON.parse(pako.inflate(new Uint8Array(data.z), { to: 'string' }));
+        }
+        handler(data);
+    });
+}
@@ -1,5 +1,5 @@
 import {getMyId} from './api.js';
-import {decrypt} from './utils.js';
+import {decrypt, blobUrl, mediaSrc, avatarUrl, formatDate} from './utils.js';
 
 let editingMessageId = null;
 
@@ -11,22 +11,41 @@ const emojiData = {
     'Об\'єкти': ['🔥', '🎉', '✨', '💩', '🤡', '👻', '💀', '👽', '🤖', '🎃', '🎄', '🎆', '🧨', '🎈', '🎁', '🎀', '🏆', '🥇', '🥈', '🥉', '⚽', '🏀', '🏈', '⚾', '🎾']
 };
 
-export function renderRoomList(rooms, currentRoomId, onClick) {
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function summaryText(room, summary) {
+    if (!summary || !summary.type) return room.type === 'private' ? 'Особистий' : 'Група';
+    let text;
+    if (summary.type === 'text' || summary.type === 'system') text = summary.preview ? decrypt(summary.preview) : 'Повідомлення';
+    else if (summary.type === 'file') text = `📎 ${summary.preview || 'Файл'}`;
+    else if (summary.type === 'voice') text = '🎤 Голосове';
+    else text = '📹 Відеоповідомлення';
+    if (text.length > 60) text = text.slice(0, 60) + '…';
+    return escapeHtml(summary.sender_id === getMyId() ? `Ви: ${text}` : text);
+}
+
+export function renderRoomList(rooms, currentRoomId, onClick, unread = {}, summaries = {}) {
     const container = document.getElementById('list-container');
     container.innerHTML = rooms.map(room => {
         const isActive = room.id === currentRoomId ? 'active' : '';
+        const unreadCount = unread[room.id] || 0;
+        const summary = summaries[room.id];
         const avatarStyle = room.avatar
-            ? `background-image: url(data:image/png;base64,${room.avatar})`
+            ? `background-image: url(${avatarUrl(room.avatar)})`
             : '';
         return `
             <div class="list-item ${isActive}" onclick="window.onRoomClick('${room.id}')">
                 <div class="avatar" style="${avatarStyle}">${!room.avatar ? room.name[0].toUpperCase() : ''}</div>
-                <div>
+                <div class="list-item-body">
                     <div style="font-weight: 600;">${room.name}</div>
-                    <div style="font-size: 0.8rem; color: var(--text-secondary);">
-                        ${room.type === 'private' ? 'Особистий' : 'Група'}
-                    </div>
+                    <div class="room-preview">${summaryText(room, summary)}</div>
                 </div>
+                ${summary && summary.type ? `<span class="room-time">${formatDate(summary.last_activity)}</span>` : ''}
+                ${unreadCount ? `<span class="unread-badge">${unreadCount > 99 ? '99+' : unreadCount}</span>` : ''}
             </div>
         `;
     }).join('');
@@ -45,7 +64,7 @@ export function renderUserList(users, onClick, blockedUsers = []) {
 
         let avatarStyle = '';
         if (user.avatar && !isBlocked) {
-            avatarStyle = `background-image: url(data:image/png;base64,${user.avatar})`;
+            avatarStyle = `background-image: url(${avatarUrl(user.avatar)})`;
         }
 
         const statusColor = (user.is_online && !isBlocked) ? 'var(--success-color)' : 'var(--text-secondary)';
@@ -94,10 +113,56 @@ function getFileIcon(filename) {
 
 export function appendMessage(msg, socket) {
     const area = document.getElementById('messages-area');
+    area.appendChild(buildMessageElement(msg));
+    area.scrollTop = area.scrollHeight;
+
+    if (msg.reactions) {
+        updateMessageReactions(msg.id, msg.reactions, socket, msg.room_id);
+    }
+}
+
+export function prependMessages(messages, socket) {
+    const area = document.getElementById('messages-area');
+    const anchor = document.getElementById('load-older-btn')?.nextSibling || area.firstChild;
+    const prevHeight = area.scrollHeight;
+
+    messages.forEach(msg => area.insertBefore(buildMessageElement(msg), anchor));
+    messages.forEach(msg => {
+        if (msg.reactions) updateMessageReactions(msg.id, msg.reactions, socket, msg.room_id);
+    });
+
+    area.scrollTop += area.scrollHeight - prevHeight;
+}
+
+export function markMessagesRead(seq) {
+    document.querySelectorAll('.message.sent[data-seq]').forEach(el => {
+        if (Number(el.dataset.seq) <= seq) el.classList.add('read');
+    });
+}
+
+export function setLoadOlderVisible(visible, onClick) {
+    const area = document.getElementById('messages-area');
+    let btn = document.getElementById('load-older-btn');
+    if (!visible) {
+        if (btn) btn.remove();
+        return;
+    }
+    if (!btn) {
+        btn = document.createElement('button');
+        btn.id = 'load-older-btn';
+        btn.className = 'btn-secondary load-older-btn';
+        btn.innerText = 'Завантажити попередні';
+        area.insertBefore(btn, area.firstChild);
+    }
+    btn.onclick = onClick;
+}
+
+function buildMessageElement(msg) {
     const div = document.createElement('div');
     const isMe = msg.sender_id === getMyId();
     div.className = `message ${isMe ? 'sent' : 'received'}`;
     div.id = `msg-${msg.id}`;
+    if (msg.seq) div.dataset.seq = msg.seq;
 
     let contentHtml = '';
     let captionHtml = '';
@@ -108,18 +173,19 @@ export function appendMessage(msg, socket) {
     } else if (msg.type === 'file') {
         try {
             const data = JSON.parse(msg.content);
-            const src = `data:application/octet-stream;base64,${data.file}`;
             const ext = msg.filename.split('.').pop().toLowerCase();
+            const inline = data.blob ? blobUrl(data.blob) : null;
+            const src = data.blob ? blobUrl(data.blob, msg.filename) : `data:application/octet-stream;base64,${data.file}`;
             const isImage = ['jpg', 'jpeg', 'png', 'gif', 'webp'].includes(ext);
             const isVideo = ['mp4', 'webm', 'mov'].includes(ext);
             const isAudio = ['mp3', 'wav', 'ogg'].includes(ext);
 
             if (isImage) {
-                contentHtml = `<img src="data:image/${ext};base64,${data.file}" class="chat-image" onclick="window.openImage(this.src)">`;
+                contentHtml = `<img src="${inline || `data:image/${ext};base64,${data.file}`}" class="chat-image" onclick="window.openImage(this.src)">`;
             } else if (isVideo) {
-                contentHtml = `<video controls src="data:video/${ext};base64,${data.file}" style="max-width:100%; border-radius:10px;"></video>`;
+                contentHtml = `<video controls preload="metadata" src="${inline || `data:video/${ext};base64,${data.file}`}" style="max-width:100%; border-radius:10px;"></video>`;
             } else if (isAudio) {
-                contentHtml = `<audio controls src="data:audio/${ext};base64,${data.file}" style="width:100%"></audio>`;
+                contentHtml = `<audio controls preload="metadata" src="${inline || `data:audio/${ext};base64,${data.file}`}" style="width:100%"></audio>`;
             } else {
                 const icon = getFileIcon(msg.filename);
                 contentHtml = `
@@ -140,14 +206,14 @@ export function appendMessage(msg, socket) {
             contentHtml = 'Error loading file';
         }
     } else if (msg.type === 'voice') {
-        contentHtml = `<audio controls src="${msg.content}"></audio>`;
+        contentHtml = `<audio controls preload="metadata" src="${mediaSrc(msg.content)}"></audio>`;
     } else if (msg.type === 'video') {
-        contentHtml = `<video controls src="${msg.content}" class="video-msg"></video>`;
+        contentHtml = `<video controls preload="metadata" src="${mediaSrc(msg.content)}" class="video-msg"></video>`;
     }
 
     const senderName = isMe ? 'Ви' : msg.sender_name;
     const avatarStyle = (msg.sender_avatar)
-        ? `background-image: url(data:image/png;base64,${msg.sender_avatar})`
+        ? `background-image: url(${avatarUrl(msg.sender_avatar, 64)})`
         : '';
 
     const senderHtml = `
@@ -179,12 +245,7 @@ export function appendMessage(msg, socket) {
         </div>
     `;
 
-    area.appendChild(div);
-    area.scrollTop = area.scrollHeight;
-
-    if (msg.reactions) {
-        updateMessageReactions(msg.id, msg.reactions, socket, msg.room_id);
-    }
+    return div;
 }
 
 window.toggleReactionMenu = (msgId) => {
@@ -241,7 +302,7 @@ export function updateMessageReactions(msgId, reactions, socket, roomId) {
     container.innerHTML = Object.keys(reactionGroups).map(reaction => {
         const users = reactionGroups[reaction];
         const avatars = users.slice(0, 3).map(u => {
-            const style = u.avatar ? `background-image: url(data:image/png;base64,${u.avatar})` : '';
+            const style = u.avatar ? `background-image: url(${avatarUrl(u.avatar, 64)})` : '';
             return `<div class="reaction-avatar" style="${style}" title="${u.name}"></div>`;
         }).join('');
 
@@ -359,7 +420,7 @@ export function renderProfileGallery(gallery, currentAvatar, onSelect, onDelete)
     container.innerHTML = gallery.map(img => {
         const isSelected = img === currentAvatar ? 'selected' : '';
         return `
-            <div class="gallery-item ${isSelected}" style="background-image: url(data:image/png;base64,${img})">
+            <div class="gallery-item ${isSelected}" style="background-image: url(${avatarUrl(img)})">
                  <div class="delete-gallery-btn">×</div>
             </div>
         `;
@@ -385,7 +446,7 @@ export function renderReadOnlyGallery(gallery) {
         return;
     }
     container.innerHTML = gallery.map(img => `
-        <div class="gallery-item" style="background-image: url(data:image/png;base64,${img}); cursor:default;"></div>
+        <div class="gallery-item" style="background-image: url(${avatarUrl(img)}); cursor:default;"></div>
     `).join('');
 }
 
@@ -409,7 +470,7 @@ export function renderParticipants(participants, myId, myRole, onRemove, onPromo
         return `
             <div class="participant-row">
                 <div style="display:flex; align-items:center;">
-                    <div class="avatar" style="width:32px; height:32px; font-size:0.8rem; margin-right:10px; background-image: url(data:image/png;base64,${p.avatar || ''})">
+                    <div class="avatar" style="width:32px; height:32px; font-size:0.8rem; margin-right:10px; background-image: url(${avatarUrl(p.avatar || '', 64)})">
                         ${!p.avatar ? p.name[0] : ''}
                     </div>
                     <div>
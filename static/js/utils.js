@@ -16,4 +16,24 @@ export function decrypt(ciphertext) {
 export function formatDate(isoString) {
     if (!isoString) return '';
     return new Date(isoString).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
-}
\ No newline at end of file
+}
+
+export function blobUrl(key, downloadName) {
+    const url = `/api/blobs/${key}`;
+    return downloadName ? `${url}?download=${encodeURIComponent(downloadName)}` : url;
+}
+
+export function mediaSrc(content) {
+    if (!content || content.startsWith('data:')) return content;
+    try {
+        return blobUrl(JSON.parse(content).blob);
+    } catch (e) {
+        return content;
+    }
+}
+
+export function avatarUrl(ref, size = 128) {
+    if (!ref) return '';
+    if (/^[0-9a-f]{64}$/.test(ref)) return `/api/avatars/${ref}/${size}`;
+    return `data:image/png;base64,${ref}`;
+}
@@ -0,0 +1,91 @@
+import json
+import queue
+import uuid
+
+import socketio
+
+from app.broker import MemoryManager
+from app.socket_utils import user_room
+
+
+class Worker:
+    def __init__(self, channel):
+        self.server = socketio.Server(client_manager=MemoryManager(channel=channel), async_mode='threading')
+        self.sent = queue.Queue()
+        self.server._send_eio_packet = lambda eio_sid, pkt: self.sent.put((eio_sid, pkt.data))
+        self.server.manager_initialized = True
+        self.server.manager.initialize()
+
+    def connect(self, eio_sid):
+        return self.server.manager.connect(eio_sid, '/')
+
+    def received(self, timeout=2):
+        eio_sid, data = self.sent.get(timeout=timeout)
+        return eio_sid, json.loads(data[1:])
+
+
+def make_workers():
+    channel = f'test-{uuid.uuid4().hex}'
+    return Worker(channel), Worker(channel)
+
+
+def test_room_emit_reaches_other_worker():
+    first, second = make_workers()
+    sid = second.connect('eio-b')
+    second.server.enter_room(sid, 'room-1')
+
+    first.server.emit('new_message', {'id': 1, 'room_id': 'room-1'}, to='room-1')
+
+    assert second.received() == ('eio-b', ['new_message', {'id': 1, 'room_id': 'room-1'}])
+    assert first.sent.empty()
+
+
+def test_user_room_emit_reaches_all_workers():
+    first, second = make_workers()
+    sid_a = first.connect('eio-a')
+    sid_b = second.connect('eio-b')
+    first.server.enter_room(sid_a, user_room('u1'))
+    second.server.enter_room(sid_b, user_room('u1'))
+
+    second.server.emit('force_join_room', {'room_id': 'room-2'}, to=user_room('u1'))
+
+    assert first.received() == ('eio-a', ['force_join_room', {'room_id': 'room-2'}])
+    assert second.received() == ('eio-b', ['force_join_room', {'room_id': 'room-2'}])
+
+
+def test_presence_update_skips_clients_outside_room():
+    first, second = make_workers()
+    member = second.connect('eio-member')
+    second.connect('eio-outsider')
+    second.server.enter_room(member, 'room-3')
+
+    update = {'updates': [{'user_id': 'u1', 'status': 'online', 'last_active': None}]}
+    first.server.emit('presence_update', update, to='room-3')
+
+    assert second.received() == ('eio-member', ['presence_update', update])
+    assert second.sent.empty()
+
+
+def test_enter_room_for_sid_on_other_worker():
+    first, second = make_workers()
+    sid = second.connect('eio-b')
+
+    first.server.manager.enter_room(sid, '/', 'room-4')
+    first.server.emit('new_message', {'id': 2}, to='room-4')
+
+    assert second.received() == ('eio-b', ['new_message', {'id': 2}])
+
+
+def test_binary_emit_reaches_other_worker_as_attachment():
+    first, second = make_workers()
+    sid = second.connect('eio-b')
+    second.server.enter_room(sid, 'room-5')
+
+    first.server.emit('history_page', {'z': b'\x00\x01'}, to='room-5')
+
+    eio_sid, header = second.sent.get(timeout=2)
+    _, attachment = second.sent.get(timeout=2)
+    assert eio_sid == 'eio-b'
+    assert header.startswith('51-')
+    assert json.loads(header[3:]) == ['history_page', {'z': {'_placeholder': True, 'num': 0}}]
+    assert attachment == b'\x00\x01'